@@ -0,0 +1,292 @@
+"""End-to-end throughput and latency of the structuring process.
+
+The micro-benchmarks time single functions; this harness measures a whole
+registration the way RDE runs it. For each input variant it builds a complete
+RDE input tree (`data/inputdata` with one synthetic measurement file per
+tile, `data/invoice/invoice.json` and `data/tasksupport` copied from the
+template of the format) and runs `rdetoolkit.workflows.run` with
+`datasets_process.dataset`, followed by the manifest refresh of `main.py`.
+Directory layout, invoice handling, metadata writing and image saving are
+therefore included.
+
+Each variant runs in a fresh spawned process, so the peak RSS and the import
+cost are those of a single registration. Per variant the report contains the
+tiles per second, the p50/p95/p99 of the per-tile latency (one call of
+rdetoolkit's per-tile step, including its invoice and thumbnail handling),
+the peak RSS and the total bytes written.
+
+With `--baseline` the report is compared with a stored one, and every metric
+that is worse by more than `--tolerance` is listed; the command then exits
+with status 1.
+
+Usage:
+    python -m benchmarks.e2e --tiles 20 --points 1e4 --output e2e.json
+    python -m benchmarks.e2e --tiles 20 --points 1e4 --baseline e2e.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import importlib
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import UTC, datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from rdetoolkit import workflows
+
+from benchmarks.generators import VARIANTS, LoopSpec
+from benchmarks.micro import environment
+from modules import datasets_process
+from modules_vsm.manifest import refresh_manifests
+
+BENCHMARK_FORMAT = "vsm-benchmark-e2e/1"
+REPO_ROOT = Path(__file__).resolve().parents[2]
+INVOICE_SAMPLE = REPO_ROOT.joinpath("tryout", "invoice_sample.json")
+# Template providing the tasksupport files of each variant.
+TEMPLATES = {
+    "dat": "mpms",
+    "vsm": "TAMAKAWA",
+    "vsm_no_date_angle": "TAMAKAWA",
+    "txt": "LakeShore",
+}
+DEFAULT_TILES = 10
+DEFAULT_POINTS = 2_000
+PERCENTILES = (50, 95, 99)
+# Relative change of a metric that is reported as a regression.
+DEFAULT_TOLERANCE = 0.10
+# Metrics compared with the baseline; +1 if larger is better, -1 if smaller is better.
+COMPARED_METRICS = {
+    "files_per_sec": 1,
+    "latency_p50_sec": -1,
+    "latency_p95_sec": -1,
+    "latency_p99_sec": -1,
+    "peak_rss_bytes": -1,
+    "output_bytes": -1,
+}
+
+
+def tile_filename(variant: str, idx: int) -> str:
+    """Return the input file name of a tile; the sample token gets the tile number, so the filename mapping rule still applies."""
+    name = VARIANTS[variant][1]
+    stem, suffix = name.rsplit(".", 1)
+    tokens = stem.split("_")
+    tokens[min(1, len(tokens) - 1)] += f"-{idx}"
+    return "_".join(tokens) + "." + suffix
+
+
+def _invoice(variant: str) -> dict[str, Any]:
+    with open(INVOICE_SAMPLE, encoding="utf_8") as f:
+        invoice: dict[str, Any] = json.load(f)
+    with open(REPO_ROOT.joinpath("templates", TEMPLATES[variant], "invoice.schema.json"), encoding="utf_8") as f:
+        schema = json.load(f)
+    # The measured date is taken from the measurement file.
+    invoice["custom"]["measurement_measured_date"] = None
+    if "sample" in schema.get("required", []):
+        invoice["sample"] = {
+            "sampleId": None,
+            "names": ["benchmark"],
+            "ownerId": invoice["basic"]["dataOwnerId"],
+            "composition": None,
+            "referenceUrl": None,
+            "description": None,
+            "generalAttributes": [],
+            "specificAttributes": [],
+        }
+    return invoice
+
+
+def build_tree(root: Path, variant: str, tiles: int, spec: LoopSpec) -> Path:
+    """Build an RDE input tree with one measurement file per tile.
+
+    Args:
+        root (Path): directory that receives `data/`; existing contents are removed.
+        variant (str): input variant, see `benchmarks.generators.VARIANTS`.
+        tiles (int): number of measurement files.
+        spec (LoopSpec): loop shape; tile `i` uses the seed `spec.seed + i`.
+
+    Returns:
+        Path: the `data` directory.
+
+    """
+    shutil.rmtree(root, ignore_errors=True)
+    data = root.joinpath("data")
+    write = VARIANTS[variant][0]
+    for idx in range(tiles):
+        tile_spec = dataclasses.replace(spec, seed=spec.seed + idx)
+        write(data.joinpath("inputdata", tile_filename(variant, idx)), tile_spec)
+    shutil.copytree(REPO_ROOT.joinpath("templates", TEMPLATES[variant], "tasksupport"), data.joinpath("tasksupport"))
+    data.joinpath("invoice").mkdir(parents=True)
+    with open(data.joinpath("invoice", "invoice.json"), "w", encoding="utf_8") as f:
+        json.dump(_invoice(variant), f, indent=2, ensure_ascii=False)
+    return data
+
+
+def _snapshot(data: Path) -> dict[Path, tuple[int, int]]:
+    return {p: (p.stat().st_size, p.stat().st_mtime_ns) for p in data.rglob("*") if p.is_file()}
+
+
+def _run_tree(root: Path) -> dict[str, Any]:
+    """Run the structuring process on a tree; called in a fresh worker process."""
+    importlib.import_module("matplotlib").use("Agg")
+    os.chdir(root)
+    data = Path("data")
+    before = _snapshot(data)
+    tile_sec: list[float] = []
+    process_mode = workflows._process_mode  # type: ignore[attr-defined]  # noqa: SLF001
+
+    def timed_process_mode(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return process_mode(*args, **kwargs)
+        finally:
+            tile_sec.append(time.perf_counter() - start)
+
+    workflows._process_mode = timed_process_mode  # type: ignore[attr-defined]  # noqa: SLF001
+    start = time.perf_counter()
+    try:
+        result = json.loads(workflows.run(custom_dataset_function=datasets_process.dataset))
+        refresh_manifests(data)
+    finally:
+        workflows._process_mode = process_mode  # type: ignore[attr-defined]  # noqa: SLF001
+    wall_sec = time.perf_counter() - start
+    after = _snapshot(data)
+    return {
+        "wall_sec": wall_sec,
+        "tile_sec": tile_sec,
+        "failed": sum(1 for status in result.get("statuses", []) if status.get("status") != "success"),
+        # ru_maxrss is in KiB on Linux.
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "output_bytes": sum(size for path, (size, mtime) in after.items() if before.get(path) != (size, mtime)),
+    }
+
+
+def run_variant(variant: str, tiles: int, spec: LoopSpec, work_dir: Path) -> dict[str, Any]:
+    """Build the tree of a variant, run it in a fresh process and return its metrics."""
+    root = work_dir.joinpath(variant)
+    build_tree(root, variant, tiles, spec)
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        measured = pool.submit(_run_tree, root.resolve()).result()
+    tile_sec = measured.pop("tile_sec")
+    latencies = np.percentile(tile_sec, PERCENTILES) if tile_sec else [float("nan")] * len(PERCENTILES)
+    return {
+        "variant": variant,
+        "tiles": tiles,
+        "points": spec.points,
+        "files_per_sec": tiles / measured["wall_sec"],
+        **{f"latency_p{p}_sec": float(v) for p, v in zip(PERCENTILES, latencies, strict=True)},
+        **measured,
+        "tile_sec": tile_sec,
+    }
+
+
+def run(variants: list[str], tiles: int, spec: LoopSpec, work_dir: Path | None = None) -> dict[str, Any]:
+    """Run the end-to-end benchmark for each variant and return the report.
+
+    Args:
+        variants (list[str]): input variants.
+        tiles (int): tiles per variant.
+        spec (LoopSpec): loop shape of the measurement files.
+        work_dir (Path | None): directory for the trees; a temporary directory is used and removed if None.
+
+    Returns:
+        dict[str, Any]: the report written by `main`.
+
+    """
+    with tempfile.TemporaryDirectory(prefix="vsm_e2e_") as tmp:
+        target = Path(tmp) if work_dir is None else work_dir
+        results = [run_variant(variant, tiles, spec, target) for variant in variants]
+    return {
+        "format": BENCHMARK_FORMAT,
+        "created": datetime.now(UTC).isoformat(),
+        "environment": environment(),
+        "parameters": {"variants": variants, "tiles": tiles, **dataclasses.asdict(spec)},
+        "results": results,
+    }
+
+
+def compare(report: dict[str, Any], baseline: dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> list[str]:
+    """Return a line for every metric of `report` that is worse than in `baseline` by more than `tolerance`.
+
+    Args:
+        report (dict[str, Any]): current report.
+        baseline (dict[str, Any]): stored report; variants missing in it are not compared.
+        tolerance (float): allowed relative change, e.g. 0.1 for 10 %.
+
+    Returns:
+        list[str]: descriptions of the regressions, empty if there are none.
+
+    """
+    if report["parameters"] != baseline["parameters"]:
+        sys.stderr.write("warning: the baseline was measured with different parameters\n")
+    stored = {result["variant"]: result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        reference = stored.get(result["variant"])
+        if reference is None:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            old, new = reference[metric], result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if direction * change < -tolerance:
+                regressions.append(f"{result['variant']}: {metric} {old:.4g} -> {new:.4g} ({change:+.1%})")
+    return regressions
+
+
+def format_table(report: dict[str, Any]) -> str:
+    """Return the metrics of each variant as a text table."""
+    lines = [f"{'variant':<20}{'tiles':>7}{'failed':>8}{'files/s':>10}{'p50 [s]':>10}{'p95 [s]':>10}{'p99 [s]':>10}{'RSS [MiB]':>11}{'out [MiB]':>11}"]
+    for r in report["results"]:
+        lines.append(
+            f"{r['variant']:<20}{r['tiles']:>7}{r['failed']:>8}{r['files_per_sec']:>10.2f}"
+            f"{r['latency_p50_sec']:>10.3f}{r['latency_p95_sec']:>10.3f}{r['latency_p99_sec']:>10.3f}"
+            f"{r['peak_rss_bytes'] / 2**20:>11.1f}{r['output_bytes'] / 2**20:>11.2f}",
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point; returns 1 if a regression against the baseline was found."""
+    parser = argparse.ArgumentParser(description="Measure the end-to-end throughput and latency of the VSM structuring process.")
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=sorted(VARIANTS))
+    parser.add_argument("--tiles", type=int, default=DEFAULT_TILES)
+    parser.add_argument("--points", type=lambda s: int(float(s)), default=DEFAULT_POINTS, help="rows per file, e.g. 1e4")
+    parser.add_argument("--loops", type=int, default=1)
+    parser.add_argument("--spikes", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, default=None, help="keep the input and output trees here")
+    parser.add_argument("--output", type=Path, default=None, help="JSON report")
+    parser.add_argument("--baseline", type=Path, default=None, help="stored report to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative slowdown (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    spec = LoopSpec(points=args.points, loops=args.loops, spikes=args.spikes, seed=args.seed)
+    report = run(args.variants, args.tiles, spec, args.work_dir)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf_8") as f:
+            json.dump(report, f, indent=2)
+    sys.stdout.write(format_table(report))
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, encoding="utf_8") as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    for line in regressions:
+        sys.stdout.write(f"REGRESSION {line}\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""Synthetic measurement files for benchmarks.
+
+Each generator writes a hysteresis loop in one of the supported input formats:
+MPMS `.dat` (wide `[Data]` section as written by MPMS3), TAMAKAWA `.vsm` (with
+or without the DATE and Angle columns) and LakeShore `.txt` (`***DATA***`
+block). The loop is deterministic for a given `LoopSpec`, so timings of
+different revisions are measured on identical inputs.
+
+Usage:
+    python -m benchmarks.generators dat /tmp/bench/BGULVAC_T20221013-2_VSM_P20221016.dat --points 1e6 --spikes 10 --loops 2
+"""
+
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, TextIO
+
+import numpy as np
+import pandas as pd
+
+# Rows formatted per write; bounds the memory used for 1e7-point files.
+WRITE_BLOCK_ROWS = 100_000
+
+# Columns of an MPMS3 VSM measurement; the three used by the reader are filled, the others are constant or empty.
+DAT_COLUMNS = (
+    "Comment", "Time Stamp (sec)", "Temperature (K)", "Magnetic Field (Oe)", "Moment (emu)", "M. Std. Err. (emu)",
+    "Transport Action", "Averaging Time (sec)", "Frequency (Hz)", "Peak Amplitude (mm)", "Center Position (mm)",
+    "Coil Signal' (mV)", "Coil Signal (mV)", "Range", "M. Quad. Signal (Am2)", "M. Raw' (emu)", "M. Raw (emu)",
+    "Min. Temperature (K)", "Max. Temperature (K)", "Min. Field (Oe)", "Max. Field (Oe)", "Mass (grams)",
+    "Motor Lag (deg)", "Pressure (Torr)", "Measure Count", "Measurement Number", "SQUID Status (code)",
+    "Motor Status (code)", "Measure Status (code)", "Motor Current (amps)", "Motor Temp. (C)", "Temp. Status (code)",
+    "Field Status (code)", "Chamber Temp (K)", "Chamber Status (code)", "Chamber Pressure (Torr)",
+    "DC Moment Fixed Ctr (emu)", "DC Moment Err Fixed Ctr (emu)",
+)
+
+
+@dataclass(frozen=True)
+class LoopSpec:
+    """Shape of a synthetic hysteresis measurement.
+
+    Attributes:
+        points (int): number of data rows.
+        loops (int): number of full loops (+Hmax -> -Hmax -> +Hmax) the rows are spread over.
+        spikes (int): number of single-point outliers added to the moment.
+        h_max (float): maximum field in Oe.
+        ms (float): saturation moment in emu.
+        hc (float): coercive field in Oe.
+        slope (float): linear (para-/diamagnetic) background in emu/Oe.
+        noise (float): standard deviation of the moment noise relative to `ms`.
+        seed (int): random seed.
+
+    """
+
+    points: int = 1000
+    loops: int = 1
+    spikes: int = 0
+    h_max: float = 20000.0
+    ms: float = 1e-3
+    hc: float = 300.0
+    slope: float = 1e-9
+    noise: float = 1e-4
+    seed: int = 0
+
+
+def loop_arrays(spec: LoopSpec) -> tuple[np.ndarray, np.ndarray]:
+    """Return field (Oe) and moment (emu) of the loop described by `spec`."""
+    rng = np.random.default_rng(spec.seed)
+    # Phase 0..1 per loop: descending branch first, then ascending.
+    half_loop = 0.5
+    phase = np.linspace(0.0, spec.loops, spec.points, endpoint=False) % 1.0
+    descending = phase < half_loop
+    field = np.where(descending, 1.0 - 4.0 * phase, 4.0 * phase - 3.0) * spec.h_max
+    branch = np.where(descending, 1.0, -1.0)
+    width = spec.h_max / 15.0
+    moment = spec.ms * np.tanh((field + branch * spec.hc) / width) + spec.slope * field
+    moment += rng.normal(0.0, spec.noise * spec.ms, spec.points)
+    if spec.spikes:
+        idx = rng.choice(spec.points, size=min(spec.spikes, spec.points), replace=False)
+        moment[idx] += rng.choice([-5.0, 5.0], size=len(idx)) * spec.ms
+    return field, moment
+
+
+def _write_rows(f: TextIO, columns: dict[str, Any], sep: str) -> None:
+    """Write columns of equal length without a header, block by block."""
+    df = pd.DataFrame(columns)
+    for start in range(0, len(df), WRITE_BLOCK_ROWS):
+        df.iloc[start:start + WRITE_BLOCK_ROWS].to_csv(f, sep=sep, header=False, index=False, float_format="%.8g", lineterminator="\n")
+
+
+def write_dat(path: Path, spec: LoopSpec) -> Path:
+    """Write an MPMS `.dat` file with a `[Header]` and a wide `[Data]` section."""
+    field, moment = loop_arrays(spec)
+    n = spec.points
+    columns: dict[str, Any] = dict.fromkeys(DAT_COLUMNS, "")
+    columns.update({
+        "Time Stamp (sec)": 3.6e9 + np.arange(n) * 0.5,
+        "Temperature (K)": 300.0,
+        "Magnetic Field (Oe)": field,
+        "Moment (emu)": moment,
+        "M. Std. Err. (emu)": abs(spec.noise * spec.ms),
+        "Transport Action": 6,
+        "Averaging Time (sec)": 1.0,
+        "Frequency (Hz)": 40.0,
+        "Peak Amplitude (mm)": 2.0,
+        "Center Position (mm)": 35.2,
+        "Range": 1,
+        "Measure Count": 1,
+        "Measurement Number": np.arange(1, n + 1),
+    })
+    header = [
+        "[Header]",
+        "; Synthetic benchmark data",
+        "TITLE,benchmark",
+        "BYAPP,MPMS3,1.2.3",
+        "INFO,MPMS,APPNAME",
+        "INFO,benchmark sample,SAMPLE_MATERIAL",
+        "INFO,1*1*0.1,SAMPLE_SIZE",
+        "FILEOPENTIME,5,01/02/2022,10:00 AM",
+        "DATATYPE,COMMENT,1",
+        "DATATYPE,TIME,2",
+        "STARTUPAXIS,X,4",
+        "STARTUPAXIS,Y1,5",
+        "FIELDGROUP,VSM,Moment (emu),M. Std. Err. (emu)",
+        "[Data]",
+        ",".join(DAT_COLUMNS),
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf_8", newline="") as f:
+        f.write("\n".join(header) + "\n")
+        _write_rows(f, columns, ",")
+    return path
+
+
+def write_vsm(path: Path, spec: LoopSpec, *, with_date: bool = True, with_angle: bool = True) -> Path:
+    """Write a TAMAKAWA `.vsm` file.
+
+    Args:
+        path (Path): output file.
+        spec (LoopSpec): loop shape.
+        with_date (bool): write the DATE column (the header line then starts with DATE).
+        with_angle (bool): write the Angle column; without it the reader fills it with NaN.
+
+    Returns:
+        Path: the written file.
+
+    """
+    field, moment = loop_arrays(spec)
+    columns: dict[str, Any] = {}
+    names = []
+    if with_date:
+        seconds = pd.Timestamp("2022-10-16 10:00:00") + pd.to_timedelta(np.arange(spec.points), unit="s")
+        columns["DATE"] = seconds.strftime("%Y/%m/%d %H:%M:%S")
+        names.append("DATE")
+    columns["H(Oe)"] = field
+    columns["M(emu)"] = moment
+    names += ["H(Oe)", "M(emu)"]
+    if with_angle:
+        columns["Angle(degree)"] = 0.0
+        names.append("Angle(degree)")
+    header = [
+        "date=,2022/10/16",
+        "sample name=,benchmark",
+        "sample size=,1*1*0.1",
+        "operator=,bench",
+        ",".join(names),
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf_8", newline="") as f:
+        f.write("\n".join(header) + "\n")
+        _write_rows(f, columns, ",")
+    return path
+
+
+def write_txt(path: Path, spec: LoopSpec) -> Path:
+    """Write a LakeShore `.txt` file with a `***DATA***` block."""
+    field, moment = loop_arrays(spec)
+    header = [
+        "Start Time:  10/16/2022 10:00:00 AM",
+        "Sample:  benchmark",
+        "Operator:  bench",
+        f"Max Field:  {spec.h_max:.0f} Oe",
+        "***DATA***",
+        "Field(Oe)  Moment(emu)",
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf_8", newline="") as f:
+        f.write("\n".join(header) + "\n")
+        _write_rows(f, {"Field(Oe)": field, "Moment(emu)": moment}, "\t")
+    return path
+
+
+# Generator and file name of each benchmark variant. The names follow the filename
+# mapping rules of the templates, so the files can also be registered.
+VARIANTS: dict[str, tuple[Callable[[Path, LoopSpec], Path], str]] = {
+    "dat": (write_dat, "BGULVAC_T20221013-2_VSM_P20221016.dat"),
+    "vsm": (write_vsm, "BGULVAC_T20221013-2_VSM_P20221016.vsm"),
+    "vsm_no_date_angle": (lambda path, spec: write_vsm(path, spec, with_date=False, with_angle=False), "BGULVAC_T20221013-2_VSM_P20221016.vsm"),
+    "txt": (write_txt, "sample1.txt"),
+}
+
+
+def generate(variant: str, out_dir: Path, spec: LoopSpec) -> Path:
+    """Write the file of a benchmark variant into a directory and return its path."""
+    write, name = VARIANTS[variant]
+    return write(out_dir.joinpath(name), spec)
+
+
+def main(argv: list[str] | None = None) -> Path:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Write a synthetic VSM measurement file.")
+    parser.add_argument("variant", choices=sorted(VARIANTS))
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--points", type=lambda s: int(float(s)), default=LoopSpec.points, help="number of rows, e.g. 1e6")
+    parser.add_argument("--loops", type=int, default=LoopSpec.loops)
+    parser.add_argument("--spikes", type=int, default=LoopSpec.spikes)
+    parser.add_argument("--seed", type=int, default=LoopSpec.seed)
+    args = parser.parse_args(argv)
+    spec = LoopSpec(points=args.points, loops=args.loops, spikes=args.spikes, seed=args.seed)
+    return VARIANTS[args.variant][0](args.path, spec)
+
+
+if __name__ == "__main__":
+    main()
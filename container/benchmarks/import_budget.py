@@ -0,0 +1,148 @@
+"""Import-time budget of the structuring entry point.
+
+Every container start, batch worker and isolated-stage worker imports
+`main` (and with it `modules.datasets_process`) before the first file is
+opened. This check runs `python -X importtime -c "import main"` in fresh
+interpreters, takes the fastest of `--repeat` runs, and exits with status 1
+when the cumulative import time exceeds `--budget-ms`, or when a deferred
+dependency (scikit-learn, SciPy, matplotlib) is imported eagerly again. Those
+are loaded at first use through `modules_vsm.deferred_imports`.
+
+The slowest packages by cumulative time are listed, so that a regression can
+be traced to the import that caused it. Run it from the `container` directory.
+
+Usage:
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --budget-ms 1800 --output import_time.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+
+BENCHMARK_FORMAT = "vsm-benchmark-import/1"
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_MODULE = "main"
+DEFAULT_BUDGET_MS = 1800.0
+DEFAULT_REPEAT = 3
+DEFAULT_TOP = 15
+# Packages that must not be imported before the stage that needs them.
+DEFERRED_PACKAGES = ("sklearn", "scipy", "matplotlib")
+
+# "import time:  self [us] | cumulative | imported package", the package indented by nesting level.
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+@dataclass
+class ImportTime:
+    """Import times of one interpreter run.
+
+    Attributes:
+        total_ms (float): cumulative import time of the measured module.
+        packages (dict[str, float]): cumulative milliseconds of each top-level import.
+        modules (list[str]): all imported modules.
+
+    """
+
+    total_ms: float
+    packages: dict[str, float] = field(default_factory=dict)
+    modules: list[str] = field(default_factory=list)
+
+
+def parse_importtime(output: str, module: str) -> ImportTime:
+    """Parse the stderr of `python -X importtime`."""
+    result = ImportTime(total_ms=0.0)
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is None:
+            continue
+        cumulative_ms = int(match.group(2)) / 1000
+        name = match.group(4)
+        result.modules.append(name)
+        if name == module and not match.group(3):
+            result.total_ms = cumulative_ms
+            continue
+        package = name.split(".")[0]
+        # Packages are reported after their submodules; keep the largest cumulative time.
+        result.packages[package] = max(result.packages.get(package, 0.0), cumulative_ms)
+    return result
+
+
+def measure(module: str) -> ImportTime:
+    """Import a module in a fresh interpreter and return its import times."""
+    completed = subprocess.run(  # noqa: S603
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode != 0:
+        err_msg = f"Failed to import {module}:\n{completed.stderr[-2000:]}"
+        raise RuntimeError(err_msg)
+    return parse_importtime(completed.stderr, module)
+
+
+def check(module: str, budget_ms: float, repeat: int, top: int) -> dict:
+    """Measure the import time and compare it with the budget.
+
+    Args:
+        module (str): module imported, e.g. "main".
+        budget_ms (float): allowed cumulative import time in milliseconds.
+        repeat (int): interpreter runs; the fastest is reported.
+        top (int): number of packages listed.
+
+    Returns:
+        dict: the report; `violations` is empty if the budget is met.
+
+    """
+    runs = [measure(module) for _ in range(repeat)]
+    best = min(runs, key=lambda run: run.total_ms)
+    eager = sorted({name for name in best.modules if name.split(".")[0] in DEFERRED_PACKAGES})
+    violations = []
+    if best.total_ms > budget_ms:
+        violations.append(f"import {module} took {best.total_ms:.0f} ms, budget {budget_ms:.0f} ms")
+    if eager:
+        packages = sorted({name.split(".")[0] for name in eager})
+        violations.append(f"deferred packages imported eagerly: {', '.join(packages)}")
+    return {
+        "format": BENCHMARK_FORMAT,
+        "python": sys.version.split()[0],
+        "module": module,
+        "budget_ms": budget_ms,
+        "runs_ms": [round(run.total_ms, 1) for run in runs],
+        "total_ms": round(best.total_ms, 1),
+        "top_packages_ms": dict(sorted(((k, round(v, 1)) for k, v in best.packages.items()), key=lambda item: -item[1])[:top]),
+        "violations": violations,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point; returns 1 if the budget is exceeded."""
+    parser = argparse.ArgumentParser(description="Check the import time of the structuring entry point against a budget.")
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="module to import")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="allowed cumulative import time")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="interpreter runs; the fastest is used")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="packages listed by cumulative import time")
+    parser.add_argument("--output", type=Path, default=None, help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = check(args.module, args.budget_ms, args.repeat, args.top)
+    lines = [f"import {report['module']}: {report['total_ms']:.0f} ms (budget {report['budget_ms']:.0f} ms, runs {report['runs_ms']})"]
+    lines += [f"  {name:<24}{ms:>10.1f} ms" for name, ms in report["top_packages_ms"].items()]
+    lines += [f"FAIL: {violation}" for violation in report["violations"]]
+    sys.stdout.write("\n".join(lines) + "\n")
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf_8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["violations"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
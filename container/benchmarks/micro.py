@@ -0,0 +1,279 @@
+"""Per-function micro-benchmarks of the structuring process.
+
+The hot functions are timed one at a time on synthetic inputs (see
+`benchmarks.generators`): reading each input format (`_read_raw_data`), the
+Hampel filter, the high-field extraction and fit, the intercept calculation,
+the three CSV writers and the `GraphPlotter` methods. Every function is called
+once untimed and then `--repeat` times; the individual wall times and their
+min, median and mean are written to a JSON file, so that results of two
+revisions can be compared in review.
+
+The functions run without the parsed input cache and without an active output
+manifest, so only the function itself is measured.
+
+Usage:
+    python -m benchmarks.micro --sizes 1e3 1e5 1e6 --repeat 5 --output bench_micro.json
+"""
+
+# The hot functions are private methods of the handlers.
+# ruff: noqa: SLF001
+
+from __future__ import annotations
+
+import argparse
+import functools
+import importlib.metadata
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from benchmarks.generators import VARIANTS, LoopSpec, generate
+from modules_vsm.graph_handler import GraphPlotter
+from modules_vsm.inputfile_handler import FileReader
+from modules_vsm.LakeShore.txt.inputfile_handler import FileReader as txtFileReader
+from modules_vsm.mpms.dat.inputfile_handler import FileReader as datFileReader
+from modules_vsm.structured_handler import StructuredDataProcesser
+from modules_vsm.TAMAKAWA.vsm.inputfile_handler import FileReader as vsmFileReader
+
+BENCHMARK_FORMAT = "vsm-benchmark-micro/1"
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DEFAULT_REPEAT = 5
+# The Hampel filter is quadratic in the number of points; larger inputs are skipped unless raised.
+HAMPEL_MAX_POINTS = 20_000
+# Packages whose versions affect the timings.
+PACKAGES = ("numpy", "pandas", "scikit-learn", "matplotlib", "rdetoolkit")
+
+READERS: dict[str, type[FileReader]] = {
+    "dat": datFileReader,
+    "vsm": vsmFileReader,
+    "vsm_no_date_angle": vsmFileReader,
+    "txt": txtFileReader,
+}
+# Graph settings of the templates; the plots of all formats are the same.
+PLOT_CONFIG = {"vsm": {"main_image_settings": "bs", "plot_bs_curve": True, "plot_ms_curve": True}}
+
+
+@dataclass
+class Timing:
+    """Timings of one function on one input.
+
+    Attributes:
+        name (str): benchmarked function.
+        variant (str): input variant, e.g. the file format.
+        points (int): number of data rows.
+        times_sec (list[float]): wall time of each timed call.
+        skipped (str | None): reason if the function was not run.
+
+    """
+
+    name: str
+    variant: str
+    points: int
+    times_sec: list[float] = field(default_factory=list)
+    skipped: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the JSON representation with summary statistics."""
+        result: dict[str, Any] = {"name": self.name, "variant": self.variant, "points": self.points}
+        if self.skipped is not None:
+            result["skipped"] = self.skipped
+            return result
+        result.update({
+            "repeat": len(self.times_sec),
+            "min_sec": min(self.times_sec),
+            "median_sec": statistics.median(self.times_sec),
+            "mean_sec": statistics.fmean(self.times_sec),
+            "times_sec": self.times_sec,
+        })
+        return result
+
+
+def measure(func: Callable[[], object], repeat: int) -> list[float]:
+    """Call a function once untimed and then `repeat` times, returning the wall time of each timed call."""
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def environment() -> dict[str, Any]:
+    """Return the interpreter, platform and package versions the benchmark ran with."""
+    versions: dict[str, str | None] = {}
+    for name in PACKAGES:
+        try:
+            versions[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            versions[name] = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": versions,
+    }
+
+
+def _analysis_benchmarks(df_data: pd.DataFrame, columns: tuple[str | None, str | None, str | None], spike_removal: bool) -> Iterator[tuple[str, Callable[[], object]]]:
+    """Yield the analysis functions of `StructuredDataProcesser` bound to prepared inputs."""
+    processer = StructuredDataProcesser()
+    x_col, rm_col, _ = columns
+    # Preprocessed without spike removal, which would run the Hampel filter timed separately below.
+    df = processer._preprocess_data(df_data[[x_col]], df_data[[rm_col]], spike_removal=False)
+    y = df["y"].to_numpy()
+
+    yield "hampel", lambda: processer.hampel(y, k=2, thr=3)
+    yield "extract_high_field_fit", lambda: processer._fit_linear_regression(processer._extract_high_field_data(df))
+
+    slope = processer._fit_linear_regression(processer._extract_high_field_data(df)).coef_[0]
+    df_corrected = processer._background_correction(df.copy(), slope, spike_removal)
+    yield "calculate_intercepts", lambda: processer._calculate_intercepts(df_corrected)
+
+
+def _output_benchmarks(df_data: pd.DataFrame, columns: tuple[str | None, str | None, str | None], out_dir: Path) -> Iterator[tuple[str, Callable[[], object]]]:
+    """Yield the CSV writers and plotting methods bound to prepared inputs."""
+    processer = StructuredDataProcesser()
+    plotter = GraphPlotter(PLOT_CONFIG)  # type: ignore[arg-type]
+    x_col, rm_col, dc_rm_col = columns
+    invoice_obj = {"custom": {"spike_removal": False, "background_removal": True, "feature_acquisition": True}}
+    fit_data, characteristic_values, moment_flag, physical_props = processer.analyze(
+        df_data, x_col=x_col, rm_col=rm_col, dc_rm_col=dc_rm_col, header={"SAMPLE_SIZE": "1*1*0.1"}, invoice_obj=invoice_obj,
+    )
+    df_original = pd.DataFrame({"Magnetic Field (Oe)": df_data[x_col], "Moment (emu)": df_data[rm_col]})
+    df_corrected = pd.DataFrame({"Magnetic Field (T)": fit_data["x"], "Magnetization (emu)": fit_data["RM"]})
+    outdir = str(out_dir)
+
+    yield "write_param_csv", lambda: processer.write_param_csv(out_dir.joinpath("bench_param.csv"), characteristic_values, invoice_obj, physical_props)
+    yield "write_raw_csv", lambda: processer.write_raw_csv(out_dir.joinpath("bench_raw.csv"), df_data, x_col, rm_col, dc_rm_col, moment_flag)
+    yield "write_graph_csv", lambda: processer.write_graph_csv(out_dir.joinpath("bench.csv"), fit_data)
+    yield "plot_original", lambda: plotter._plot_original("bench", "png", outdir, df_original)
+    yield "plot_corrected_ms", lambda: plotter._plot_corrected("bench", "png", outdir, df_corrected, characteristic_values, invoice_obj, m_key="Ms")
+    yield "plot_corrected_bs", lambda: plotter._plot_corrected("bench", "png", outdir, df_corrected, characteristic_values, invoice_obj, m_key="Bs")
+    yield "plot_corrected_original", lambda: plotter.plot_corrected_original(
+        df_data, fit_data, characteristic_values, "bench", invoice_obj, out_dir, out_dir, moment_flag,
+        x_col=x_col, rm_col=rm_col, dc_rm_col=dc_rm_col,
+    )
+
+
+def run_size(spec: LoopSpec, repeat: int, work_dir: Path, *, hampel_max_points: int = HAMPEL_MAX_POINTS) -> list[Timing]:
+    """Benchmark all functions on inputs with `spec.points` rows.
+
+    Args:
+        spec (LoopSpec): shape of the synthetic inputs.
+        repeat (int): timed calls per function.
+        work_dir (Path): directory for the input and output files.
+        hampel_max_points (int): larger inputs skip the Hampel filter.
+
+    Returns:
+        list[Timing]: one timing per function and input variant.
+
+    """
+    timings = []
+    parsed: dict[str, pd.DataFrame] = {}
+    for variant in VARIANTS:
+        path = generate(variant, work_dir.joinpath(variant), spec)
+        reader = READERS[variant]()
+        timings.append(Timing("read_raw_data", variant, spec.points, measure(functools.partial(reader._read_raw_data, path), repeat)))
+        parsed[variant] = reader._read_raw_data(path)[1]
+        path.unlink()
+
+    # The analysis and the outputs do not depend on the input format once the data is read.
+    df_data = parsed["dat"]
+    columns = READERS["dat"]().identify_columns(df_data)
+    out_dir = work_dir.joinpath("out")
+    out_dir.mkdir(exist_ok=True)
+    benchmarks = [
+        *_analysis_benchmarks(df_data, columns, spike_removal=spec.spikes > 0),
+        *_output_benchmarks(df_data, columns, out_dir),
+    ]
+    for name, func in benchmarks:
+        if name == "hampel" and spec.points > hampel_max_points:
+            timings.append(Timing(name, "dat", spec.points, skipped=f"more than {hampel_max_points} points"))
+            continue
+        timings.append(Timing(name, "dat", spec.points, measure(func, repeat)))
+    return timings
+
+
+def run(
+    sizes: list[int],
+    repeat: int = DEFAULT_REPEAT,
+    *,
+    loops: int = 1,
+    spikes: int = 0,
+    seed: int = 0,
+    hampel_max_points: int = HAMPEL_MAX_POINTS,
+) -> dict[str, Any]:
+    """Run the micro-benchmarks for each size and return the report.
+
+    Args:
+        sizes (list[int]): numbers of data rows.
+        repeat (int): timed calls per function.
+        loops (int): hysteresis loops per input.
+        spikes (int): outliers per input; the background is then subtracted as with spike removal enabled.
+        seed (int): random seed of the inputs.
+        hampel_max_points (int): larger inputs skip the Hampel filter.
+
+    Returns:
+        dict[str, Any]: the report written by `main`.
+
+    """
+    timings: list[Timing] = []
+    with tempfile.TemporaryDirectory(prefix="vsm_bench_") as tmp:
+        for points in sizes:
+            spec = LoopSpec(points=points, loops=loops, spikes=spikes, seed=seed)
+            timings += run_size(spec, repeat, Path(tmp), hampel_max_points=hampel_max_points)
+    return {
+        "format": BENCHMARK_FORMAT,
+        "created": datetime.now(UTC).isoformat(),
+        "environment": environment(),
+        "parameters": {"sizes": sizes, "repeat": repeat, "loops": loops, "spikes": spikes, "seed": seed},
+        "results": [t.to_dict() for t in timings],
+    }
+
+
+def format_table(report: dict[str, Any]) -> str:
+    """Return the median time of each function and size as a text table."""
+    lines = [f"{'function':<26}{'variant':<20}{'points':>10}{'median [ms]':>14}"]
+    for result in report["results"]:
+        median = f"{result['median_sec'] * 1e3:.3f}" if "median_sec" in result else "skipped"
+        lines.append(f"{result['name']:<26}{result['variant']:<20}{result['points']:>10}{median:>14}")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Time the hot functions of the VSM structuring process on synthetic inputs.")
+    parser.add_argument("--sizes", type=lambda s: int(float(s)), nargs="+", default=list(DEFAULT_SIZES), help="numbers of data rows, e.g. 1e3 1e7")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--loops", type=int, default=1)
+    parser.add_argument("--spikes", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hampel-max-points", type=lambda s: int(float(s)), default=HAMPEL_MAX_POINTS)
+    parser.add_argument("--output", type=Path, default=None, help="JSON report (default: standard output)")
+    args = parser.parse_args(argv)
+
+    importlib.import_module("matplotlib").use("Agg")
+    report = run(args.sizes, args.repeat, loops=args.loops, spikes=args.spikes, seed=args.seed, hampel_max_points=args.hampel_max_points)
+    if args.output is None:
+        sys.stdout.write(json.dumps(report, indent=2) + "\n")
+    else:
+        with open(args.output, "w", encoding="utf_8") as f:
+            json.dump(report, f, indent=2)
+        sys.stdout.write(format_table(report))
+    return report
+
+
+if __name__ == "__main__":
+    main()
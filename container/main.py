@@ -1,5 +1,13 @@
+from pathlib import Path
+
 import rdetoolkit
 
 from modules import datasets_process
+from modules_vsm.manifest import refresh_manifests
+
+# Guarded so that worker processes started with "spawn" (isolated_stages) can import this module.
+if __name__ == "__main__":
+    rdetoolkit.workflows.run(custom_dataset_function=datasets_process.dataset)
 
-rdetoolkit.workflows.run(custom_dataset_function=datasets_process.dataset)
+    # rdetoolkit post-processes some outputs (e.g. invoice.json) after the dataset function.
+    refresh_manifests(Path("data"))
@@ -0,0 +1,322 @@
+"""Process-pool batch runner for the VSM structuring process.
+
+`rdetoolkit.workflows.run` processes data tiles one after another. This runner
+prepares the tiles the same way and dispatches them to a pool of worker
+processes, each pre-warmed with the heavy imports. Results are collected in
+tile order, and a failing tile (an exception or a crashed worker) is reported
+as a failed tile without stopping the others.
+
+Completed tiles are recorded in `data/logs/batch_journal.jsonl` together with
+the hash of their inputs and their output manifest. When a batch is started
+again after it was interrupted, tiles whose inputs and outputs are unchanged
+are skipped and only the remaining tiles are processed; `--no-resume` clears
+the journal and processes every tile.
+
+Usage:
+    python -m modules.batch_runner --workers 32
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import tempfile
+import traceback
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+
+from rdetoolkit.config import load_config
+from rdetoolkit.errors import handle_and_exit_on_structured_error, handle_generic_error
+from rdetoolkit.exceptions import StructuredError
+from rdetoolkit.invoicefile import backup_invoice_json_files
+from rdetoolkit.models.config import Config
+from rdetoolkit.models.rde2types import RdeInputDirPaths, RdeOutputResourcePath
+from rdetoolkit.models.result import WorkflowExecutionStatus, WorkflowResultManager
+from rdetoolkit.rde2util import StorageDir
+from rdetoolkit.rdelogger import get_logger
+
+# The private helpers are what `rdetoolkit.workflows.run` uses per tile; the bundled stub does not declare them.
+from rdetoolkit.workflows import _create_error_status, _process_mode, check_files, generate_folder_paths_iterator  # type: ignore[attr-defined]
+
+from modules_vsm.batch_journal import BatchJournal, hash_inputs
+from modules_vsm.deferred_imports import load_matplotlib
+from modules_vsm.manifest import refresh_manifest, refresh_manifests, remove_partial_outputs
+
+# Modules imported by each worker before it receives its first tile.
+WARM_IMPORTS = ("numpy", "pandas", "sklearn.linear_model", "modules.datasets_process")
+# A tile whose worker died this many times is re-run alone before it is reported as failed.
+ISOLATE_AFTER_CRASHES = 2
+JOURNAL_NAME = "batch_journal.jsonl"
+
+
+@dataclass(frozen=True)
+class TileJob:
+    """Everything a worker process needs to process one data tile."""
+
+    idx: int
+    srcpaths: RdeInputDirPaths
+    resource_paths: RdeOutputResourcePath
+    config: Config
+    excel_invoice_files: Path | None
+    smarttable_file: Path | None
+
+    def input_paths(self) -> list[Path]:
+        """Return the files whose contents determine the outputs of the tile."""
+        return [*self.resource_paths.rawfiles, self.resource_paths.invoice_org, self.srcpaths.tasksupport]
+
+    def output_dirs(self) -> list[Path]:
+        """Return the directories the structuring process writes to."""
+        paths = self.resource_paths
+        return [paths.struct, paths.main_image, paths.other_image, paths.meta, paths.invoice, paths.logs]
+
+
+def warm_up_worker() -> None:
+    """Import the heavy dependencies once per worker process."""
+    load_matplotlib()
+    for name in WARM_IMPORTS:
+        importlib.import_module(name)
+
+
+def _failed_status(job: TileJob, exc: BaseException, mode: str) -> WorkflowExecutionStatus:
+    error_info = {
+        "code": getattr(exc, "ecode", None),
+        "message": getattr(exc, "emsg", None) or str(exc),
+        "stacktrace": "".join(traceback.format_exception(type(exc), exc, exc.__traceback__)),
+    }
+    status: WorkflowExecutionStatus = _create_error_status(job.idx, error_info, job.resource_paths, mode)
+    return status
+
+
+def _run_marked(process_function: Callable[[TileJob], WorkflowExecutionStatus], job: TileJob, started_dir: Path) -> WorkflowExecutionStatus:
+    """Run a job in a worker, leaving a marker file while it executes.
+
+    A marker left behind after the pool broke identifies the jobs that were
+    executing when a worker crashed, as opposed to the jobs still queued.
+    """
+    marker = started_dir.joinpath(str(job.idx))
+    marker.touch()
+    try:
+        return process_function(job)
+    finally:
+        marker.unlink(missing_ok=True)
+
+
+def process_tile(job: TileJob) -> WorkflowExecutionStatus:
+    """Process one data tile in a worker process; exceptions become a failed status."""
+    from modules import datasets_process  # noqa: PLC0415
+
+    logger = get_logger(__name__, file_path=StorageDir.get_specific_outputdir(True, "logs").joinpath("rdesys.log"))
+    try:
+        status: WorkflowExecutionStatus
+        status, error_info, mode = _process_mode(
+            job.idx, job.srcpaths, job.resource_paths, job.config,
+            job.excel_invoice_files, job.smarttable_file,
+            datasets_process.dataset, logger,
+        )
+    except Exception as e:
+        logger.exception("Tile %s failed", job.idx)
+        return _failed_status(job, e, "batch")
+    if error_info and any(value is not None for value in error_info.values()):
+        status = _create_error_status(job.idx, error_info, job.resource_paths, mode)
+    return status
+
+
+class BatchRunner:
+    """Dispatch data tiles to a process pool.
+
+    Args:
+        max_workers (int | None): number of worker processes. Defaults to the CPU count.
+        process_function (Callable[[TileJob], WorkflowExecutionStatus]): function run for each tile.
+        journal (BatchJournal | None): journal of completed tiles; tiles recorded
+            in it are skipped and newly completed tiles are added.
+
+    Example:
+        runner = BatchRunner(max_workers=32, journal=BatchJournal(journal_path))
+        statuses = runner.run_jobs(jobs)
+
+    """
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        process_function: Callable[[TileJob], WorkflowExecutionStatus] = process_tile,
+        journal: BatchJournal | None = None,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.process_function = process_function
+        self.journal = journal
+        self._input_hashes: dict[int, str] = {}
+
+    def _checkpoint(self, job: TileJob, status: WorkflowExecutionStatus) -> None:
+        """Record a successfully completed tile in the journal."""
+        manifest_path = job.resource_paths.logs.joinpath("manifest.json")
+        if self.journal is None or status.status != "success" or not manifest_path.exists():
+            return
+        # rdetoolkit has finished post-processing the tile, so the manifest can be made final now.
+        refresh_manifest(manifest_path)
+        with open(manifest_path, encoding="utf_8") as f:
+            files = json.load(f)["files"]
+        self.journal.append(job.idx, self._input_hashes[job.idx], status.model_dump(), files)
+
+    def _resume(self, jobs: list[TileJob]) -> tuple[dict[int, WorkflowExecutionStatus], list[TileJob]]:
+        """Split jobs into the statuses of tiles completed by an earlier run and the jobs still to run."""
+        if self.journal is None:
+            return {}, jobs
+        results: dict[int, WorkflowExecutionStatus] = {}
+        pending: list[TileJob] = []
+        for job in jobs:
+            self._input_hashes[job.idx] = hash_inputs(job.input_paths())
+            entry = self.journal.completed(job.idx, self._input_hashes[job.idx])
+            if entry is not None:
+                results[job.idx] = WorkflowExecutionStatus(**entry["status"])
+                continue
+            # Outputs of an interrupted attempt; complete files are overwritten by the new run.
+            remove_partial_outputs(job.output_dirs())
+            pending.append(job)
+        return results, pending
+
+    def _run_pool(self, jobs: list[TileJob], max_workers: int) -> tuple[dict[int, WorkflowExecutionStatus], list[TileJob], list[TileJob]]:
+        """Run jobs on one pool.
+
+        Returns:
+            tuple: finished statuses, the jobs that were executing when a worker
+                crashed, and the jobs that had not started when the pool broke.
+
+        """
+        results: dict[int, WorkflowExecutionStatus] = {}
+        crashed: list[TileJob] = []
+        interrupted: list[TileJob] = []
+        with tempfile.TemporaryDirectory(prefix="vsm-batch-") as tmp, ProcessPoolExecutor(max_workers=max_workers, initializer=warm_up_worker) as executor:
+            started_dir = Path(tmp)
+            futures: dict[Future, TileJob] = {executor.submit(_run_marked, self.process_function, job, started_dir): job for job in jobs}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures[future]
+                    exc = future.exception()
+                    if isinstance(exc, BrokenProcessPool):
+                        (crashed if started_dir.joinpath(str(job.idx)).exists() else interrupted).append(job)
+                    elif exc is not None:
+                        results[job.idx] = _failed_status(job, exc, "batch")
+                    else:
+                        results[job.idx] = future.result()
+                        self._checkpoint(job, results[job.idx])
+        return results, crashed, interrupted
+
+    def run_jobs(self, jobs: list[TileJob]) -> list[WorkflowExecutionStatus]:
+        """Process all jobs and return their statuses in tile order.
+
+        A crashed worker breaks the whole pool, so the unfinished jobs are
+        resubmitted to a fresh pool. Only the jobs that were executing when the
+        pool broke count the crash; a job that was executing repeatedly is run
+        alone, and reported as failed if its worker crashes again.
+
+        """
+        results, pending = self._resume(list(jobs))
+        crashes: dict[int, int] = {}
+        while pending:
+            shared = [job for job in pending if crashes.get(job.idx, 0) < ISOLATE_AFTER_CRASHES]
+            isolated = [job for job in pending if crashes.get(job.idx, 0) >= ISOLATE_AFTER_CRASHES]
+            pending = []
+
+            if shared:
+                done, crashed, interrupted = self._run_pool(shared, min(self.max_workers, len(shared)))
+                results.update(done)
+                if not done and not crashed:
+                    # The pool broke before any job started (e.g. in the worker initializer).
+                    crashed, interrupted = interrupted, []
+                for job in crashed:
+                    crashes[job.idx] = crashes.get(job.idx, 0) + 1
+                pending.extend([*crashed, *interrupted])
+
+            for job in isolated:
+                done, crashed, interrupted = self._run_pool([job], 1)
+                results.update(done)
+                for job_crashed in [*crashed, *interrupted]:
+                    err_msg = f"Worker process crashed while processing tile {job_crashed.idx}"
+                    results[job_crashed.idx] = _failed_status(job_crashed, StructuredError(err_msg), "batch")
+
+        return [results[job.idx] for job in sorted(jobs, key=lambda j: j.idx)]
+
+
+def prepare_jobs(config: Config | None = None, *, resume: bool = False) -> list[TileJob]:
+    """Set up the RDE input/output directories like `rdetoolkit.workflows.run` and return one job per tile.
+
+    Args:
+        config (Config | None): rdetoolkit configuration, loaded from tasksupport if None.
+        resume (bool): keep the backup of the original invoice made by the
+            interrupted run; invoice.json may already have been rewritten by a completed tile.
+
+    Returns:
+        list[TileJob]: one job per data tile.
+
+    """
+    srcpaths = RdeInputDirPaths(
+        inputdata=StorageDir.get_specific_outputdir(False, "inputdata"),
+        invoice=StorageDir.get_specific_outputdir(False, "invoice"),
+        tasksupport=StorageDir.get_specific_outputdir(False, "tasksupport"),
+    )
+    rde_config = load_config(str(srcpaths.tasksupport), config=config)
+    srcpaths.config = rde_config
+
+    raw_files_group, excel_invoice_files, smarttable_file = check_files(srcpaths, mode=rde_config.system.extended_mode)  # type: ignore[misc]
+    invoice_org_filepath = StorageDir.get_specific_outputdir(True, "temp").joinpath("invoice_org.json")
+    if not (resume and invoice_org_filepath.exists()):
+        invoice_org_filepath = backup_invoice_json_files(excel_invoice_files, rde_config.system.extended_mode)
+    invoice_schema_filepath = srcpaths.tasksupport.joinpath("invoice.schema.json")
+
+    return [
+        TileJob(idx, srcpaths, resource_paths, rde_config, excel_invoice_files, smarttable_file)
+        for idx, resource_paths in enumerate(generate_folder_paths_iterator(raw_files_group, invoice_org_filepath, invoice_schema_filepath))
+    ]
+
+
+def run(max_workers: int | None = None, config: Config | None = None, *, resume: bool = True) -> str:
+    """Run the structuring process for all data tiles on a process pool.
+
+    Args:
+        max_workers (int | None): number of worker processes. Defaults to the CPU count.
+        config (Config | None): rdetoolkit configuration, loaded from tasksupport if None.
+        resume (bool): skip the tiles recorded as completed in the batch journal.
+            If False, the journal is cleared and every tile is processed.
+
+    Returns:
+        str: The JSON representation of the workflow execution results.
+
+    """
+    logs_dir = StorageDir.get_specific_outputdir(True, "logs")
+    logger = get_logger(__name__, file_path=logs_dir.joinpath("rdesys.log"))
+    wf_manager = WorkflowResultManager()
+    journal = BatchJournal(logs_dir.joinpath(JOURNAL_NAME))
+    if not resume:
+        journal.clear()
+    try:
+        jobs = prepare_jobs(config, resume=len(journal) > 0)
+        for status in BatchRunner(max_workers, journal=journal).run_jobs(jobs):
+            wf_manager.add_status(status)
+    except StructuredError as e:
+        handle_and_exit_on_structured_error(e, logger)
+    except Exception as e:
+        handle_generic_error(e, logger)
+
+    refresh_manifests(Path("data"))
+    return wf_manager.to_json()
+
+
+def main(argv: list[str] | None = None) -> str:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Run the VSM structuring process on a process pool.")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--no-resume", action="store_true", help="clear the journal of completed tiles and process every tile")
+    args = parser.parse_args(argv)
+    return run(max_workers=args.workers, resume=not args.no_resume)
+
+
+if __name__ == "__main__":
+    main()
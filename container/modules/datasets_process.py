@@ -1,65 +1,49 @@
 from __future__ import annotations
 
+import contextlib
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
 from rdetoolkit.errors import catch_exception_with_message
-from rdetoolkit.models.rde2types import RdeInputDirPaths, RdeOutputResourcePath
+from rdetoolkit.models.rde2types import MetaType, RdeInputDirPaths, RdeOutputResourcePath, RepeatedMetaType
 from rdetoolkit.rde2util import Meta
 
+from modules import isolated_stages
+from modules.pipeline import DEFAULT_PIPELINE_WORKERS, Stage, StageGraph
+from modules_vsm import metrics
+from modules_vsm.chunked_handler import CHUNKED_STAGES, UNSUPPORTED_STAGES, ChunkedAnalyzer
 from modules_vsm.factory import VsmFactory
+from modules_vsm.manifest import OutputManifest, open_output
+from modules_vsm.profiling import DIAGNOSTICS_DIR, TileProfiler
+from modules_vsm.result_cache import CACHED_STAGES, ResultCache
+from modules_vsm.result_index import ResultIndex, file_sha256, pipeline_row
+from modules_vsm.shared_frame import SharedFrameArena
+from modules_vsm.tasksupport_cache import tasksupport_cache
+from modules_vsm.time_budget import METADATA_KEY, TimeBudget
+from modules_vsm.timing import DEFAULT_MEMORY_TOP, TIMINGS_NAME, TileTimings, span
 
+# Stages that run on every tile. Optional outputs are added when enabled in rdeconfig.yaml.
+DEFAULT_TARGETS = ("param_csv", "raw_csv", "graph_csv", "metadata", "invoice", "graph")
 
-@catch_exception_with_message()
-def dataset(
-    srcpaths: RdeInputDirPaths,
-    resource_paths: RdeOutputResourcePath,
-) -> None:
-    """Execute structured processing in VSM.
-
-    Execute structured text processing, metadata extraction, and visualization.
-    It handles structured text processing, metadata extraction, and graphing.
-    Other processing required for structuring may be implemented as needed.
-
-    Args:
-        srcpaths: Paths to input resources for processing.
-        resource_paths: Paths to output resources for saving results.
-
-    Returns:
-        None
 
-    Note:
-        The actual function names and processing details may vary depending on the project.
+def _read_raw(*, module: VsmFactory, resource_paths: RdeOutputResourcePath, is_filename_mapping_rule: bool) -> tuple[MetaType, pd.DataFrame, list[str] | None]:
+    return module.file_reader.read(resource_paths, is_filename_mapping_rule)
 
-    """
-    # 設定とモジュール取得
-    config = VsmFactory.get_config(resource_paths.rawfiles[0], srcpaths.tasksupport)
-    module = VsmFactory.get_objects(resource_paths.rawfiles[0], srcpaths.tasksupport, config)
-
-    # 拡張子・ファイル名ベース
-    raw_file = resource_paths.rawfiles[0]
-    raw_basename = raw_file.stem
 
-    # 共通CSVパス
-    csv_path_graph = resource_paths.struct.joinpath(f"{raw_basename}.csv")
-    csv_path_param = resource_paths.struct.joinpath(f"{raw_basename}_param.csv")
-    csv_path_raw = resource_paths.struct.joinpath(f"{raw_basename}_raw.csv")
-
-    # 入力データ読み込み
-    meta = df_data = fname_token = None
-    is_filename_mapping_rule = False
-    moment_flag = None
-
-    if srcpaths.tasksupport.joinpath("filename_mapping_rule.txt").exists():
-        is_filename_mapping_rule = True
-
-    meta, df_data, fname_token = module.file_reader.read(resource_paths, is_filename_mapping_rule)
-    x_col, rm_col, dc_rm_col = module.file_reader.identify_columns(df_data)
-    invoice_obj = module.file_reader.read_invoice(resource_paths.invoice_org)
-
-    # データ処理（CSV出力）
-    fit_data, characteristic_values, moment_flag = module.structured_processer.to_csv_3types(
+def _analyze(
+    *,
+    module: VsmFactory,
+    df_data: pd.DataFrame,
+    columns: tuple[str | None, str | None, str | None],
+    meta: MetaType,
+    invoice_obj: dict,
+) -> tuple[pd.DataFrame, pd.DataFrame, bool, dict[str, str]]:
+    x_col, rm_col, dc_rm_col = columns
+    return module.structured_processer.analyze(
         df_data,
-        csv_path_param,
-        csv_path_raw,
-        csv_path_graph,
         x_col=x_col,
         rm_col=rm_col,
         dc_rm_col=dc_rm_col,
@@ -67,16 +51,44 @@ def dataset(
         invoice_obj=invoice_obj,
     )
 
-    # メタデータ保存
-    const_meta_info, repeated_meta_info = module.meta_parser.parse(meta, characteristic_values, invoice_obj)
+
+def _write_raw_csv(
+    *,
+    module: VsmFactory,
+    csv_path_raw: Path,
+    df_data: pd.DataFrame,
+    columns: tuple[str | None, str | None, str | None],
+    moment_flag: bool,
+) -> None:
+    x_col, rm_col, dc_rm_col = columns
+    module.structured_processer.write_raw_csv(csv_path_raw, df_data, x_col, rm_col, dc_rm_col, moment_flag)
+
+
+def _save_meta(
+    *,
+    module: VsmFactory,
+    resource_paths: RdeOutputResourcePath,
+    metadata_def: Meta,
+    const_meta_info: MetaType,
+    repeated_meta_info: RepeatedMetaType,
+) -> None:
     module.meta_parser.save_meta(
         resource_paths.meta.joinpath("metadata.json"),
-        Meta(srcpaths.tasksupport.joinpath("metadata-def.json")),
+        metadata_def,
         const_meta_info=const_meta_info,
         repeated_meta_info=repeated_meta_info,
     )
 
-    # インボイス保存
+
+def _overwrite_invoice(
+    *,
+    module: VsmFactory,
+    resource_paths: RdeOutputResourcePath,
+    invoice_obj: dict,
+    meta: MetaType,
+    is_filename_mapping_rule: bool,
+    fname_token: list[str] | None,
+) -> None:
     module.file_reader.overwrite_invoice(
         invoice_obj,
         meta,
@@ -85,7 +97,20 @@ def dataset(
         resource_paths.invoice.joinpath("invoice.json"),
     )
 
-    # グラフ描画
+
+def _plot(
+    *,
+    module: VsmFactory,
+    resource_paths: RdeOutputResourcePath,
+    raw_basename: str,
+    df_data: pd.DataFrame,
+    columns: tuple[str | None, str | None, str | None],
+    fit_data: pd.DataFrame,
+    characteristic_values: pd.DataFrame,
+    moment_flag: bool,
+    invoice_obj: dict,
+) -> None:
+    x_col, rm_col, dc_rm_col = columns
     module.graph_plotter.plot_corrected_original(
         df_data,
         fit_data,
@@ -99,3 +124,318 @@ def dataset(
         rm_col=rm_col,
         dc_rm_col=dc_rm_col,
     )
+
+
+def _write_pyramid(
+    *,
+    module: VsmFactory,
+    resource_paths: RdeOutputResourcePath,
+    raw_basename: str,
+    df_data: pd.DataFrame,
+    columns: tuple[str | None, str | None, str | None],
+    fit_data: pd.DataFrame,
+    moment_flag: bool,
+) -> None:
+    x_col, rm_col, dc_rm_col = columns
+    module.pyramid_writer.write_pyramid(
+        df_data,
+        fit_data,
+        raw_basename,
+        resource_paths.struct,
+        moment_flag,
+        x_col=x_col,
+        rm_col=rm_col,
+        dc_rm_col=dc_rm_col,
+    )
+
+
+def build_stage_graph(isolated: Iterable[str] = ()) -> StageGraph:
+    """Return the DAG of the VSM structuring pipeline.
+
+    Values given by `dataset`: srcpaths, resource_paths, rawfile, raw_basename,
+    config, csv_path_param, csv_path_raw, csv_path_graph. Since `config` is given,
+    the "config" stage is skipped there; it is kept so that the graph can also be
+    run from the input paths alone.
+
+    Args:
+        isolated (Iterable[str]): stages to run in worker processes (see
+            `modules.isolated_stages`). They need the value `shared_arena`.
+
+    Returns:
+        StageGraph: the pipeline stages.
+
+    """
+    # Variants of stages that run in worker processes.
+    isolated_variants = {
+        "analyze": Stage(
+            "analyze",
+            isolated_stages.analyze,
+            inputs=("shared_arena", "rawfile", "srcpaths", "df_shared", "columns", "meta", "invoice_obj"),
+            outputs=("fit_data", "characteristic_values", "moment_flag", "physical_props"),
+        ),
+        "graph": Stage(
+            "graph",
+            isolated_stages.plot,
+            inputs=(
+                "rawfile", "srcpaths", "resource_paths", "raw_basename", "df_shared", "columns",
+                "fit_shared", "characteristic_values", "moment_flag", "invoice_obj",
+            ),
+        ),
+    }
+    isolated = set(isolated)
+    unknown = isolated - isolated_variants.keys()
+    if unknown:
+        err_msg = f"Stages cannot be isolated: {sorted(unknown)}"
+        raise ValueError(err_msg)
+
+    stages = [
+        # 設定とモジュール取得
+        Stage(
+            "config",
+            lambda rawfile, srcpaths: VsmFactory.get_config(rawfile, srcpaths.tasksupport),
+            inputs=("rawfile", "srcpaths"),
+            outputs=("config",),
+        ),
+        Stage(
+            "factory",
+            lambda rawfile, srcpaths, config: VsmFactory.get_objects(rawfile, srcpaths.tasksupport, config),
+            inputs=("rawfile", "srcpaths", "config"),
+            outputs=("module",),
+        ),
+        Stage(
+            "filename_mapping_rule",
+            lambda srcpaths: srcpaths.tasksupport.joinpath("filename_mapping_rule.txt").exists(),
+            inputs=("srcpaths",),
+            outputs=("is_filename_mapping_rule",),
+        ),
+        Stage(
+            "metadata_def",
+            lambda srcpaths: tasksupport_cache.new_metadata_def(srcpaths.tasksupport.joinpath("metadata-def.json")),
+            inputs=("srcpaths",),
+            outputs=("metadata_def",),
+        ),
+        # 入力データ読み込み
+        Stage(
+            "read",
+            _read_raw,
+            inputs=("module", "resource_paths", "is_filename_mapping_rule"),
+            outputs=("meta", "df_data", "fname_token"),
+        ),
+        Stage(
+            "identify_columns",
+            lambda module, df_data: module.file_reader.identify_columns(df_data),
+            inputs=("module", "df_data"),
+            outputs=("columns",),
+        ),
+        Stage(
+            "read_invoice",
+            lambda module, resource_paths: module.file_reader.read_invoice(resource_paths.invoice_org),
+            inputs=("module", "resource_paths"),
+            outputs=("invoice_obj",),
+        ),
+        # 別プロセスのステージへ渡すデータを共有メモリに配置
+        Stage(
+            "share_data",
+            isolated_stages.share_data,
+            inputs=("shared_arena", "df_data", "columns"),
+            outputs=("df_shared",),
+        ),
+        Stage(
+            "share_fit",
+            isolated_stages.share_fit,
+            inputs=("shared_arena", "fit_data"),
+            outputs=("fit_shared",),
+        ),
+        # データ解析
+        Stage(
+            "analyze",
+            _analyze,
+            inputs=("module", "df_data", "columns", "meta", "invoice_obj"),
+            outputs=("fit_data", "characteristic_values", "moment_flag", "physical_props"),
+        ),
+        Stage(
+            "parse_meta",
+            lambda module, meta, characteristic_values, invoice_obj: module.meta_parser.parse(meta, characteristic_values, invoice_obj),
+            inputs=("module", "meta", "characteristic_values", "invoice_obj"),
+            outputs=("const_meta_info", "repeated_meta_info"),
+        ),
+        # CSV出力
+        Stage(
+            "param_csv",
+            lambda module, csv_path_param, characteristic_values, invoice_obj, physical_props: module.structured_processer.write_param_csv(
+                csv_path_param, characteristic_values, invoice_obj, physical_props,
+            ),
+            inputs=("module", "csv_path_param", "characteristic_values", "invoice_obj", "physical_props"),
+        ),
+        Stage(
+            "raw_csv",
+            _write_raw_csv,
+            inputs=("module", "csv_path_raw", "df_data", "columns", "moment_flag"),
+        ),
+        Stage(
+            "graph_csv",
+            lambda module, csv_path_graph, fit_data: module.structured_processer.write_graph_csv(csv_path_graph, fit_data),
+            inputs=("module", "csv_path_graph", "fit_data"),
+        ),
+        Stage(
+            "field_grid",
+            lambda module, resource_paths, raw_basename, fit_data: module.grid_resampler.write_grid_npy(fit_data, raw_basename, resource_paths.struct),
+            inputs=("module", "resource_paths", "raw_basename", "fit_data"),
+        ),
+        # メタデータ保存
+        Stage(
+            "metadata",
+            _save_meta,
+            inputs=("module", "resource_paths", "metadata_def", "const_meta_info", "repeated_meta_info"),
+        ),
+        # インボイス保存（解析に成功した場合のみ書き換える）
+        Stage(
+            "invoice",
+            _overwrite_invoice,
+            inputs=("module", "resource_paths", "invoice_obj", "meta", "is_filename_mapping_rule", "fname_token"),
+            after=("analyze",),
+        ),
+        # グラフ描画
+        Stage(
+            "graph",
+            _plot,
+            inputs=("module", "resource_paths", "raw_basename", "df_data", "columns", "fit_data", "characteristic_values", "moment_flag", "invoice_obj"),
+        ),
+        # ビューア用の多重解像度データ出力
+        Stage(
+            "plot_data_pyramid",
+            _write_pyramid,
+            inputs=("module", "resource_paths", "raw_basename", "df_data", "columns", "fit_data", "moment_flag"),
+        ),
+    ]
+    return StageGraph([isolated_variants[stage.name] if stage.name in isolated else stage for stage in stages])
+
+
+def select_targets(config: Any) -> list[str]:
+    """Return the output stages to run for the given rdeconfig.yaml contents."""
+    targets = list(DEFAULT_TARGETS)
+    if config['vsm'].get('field_grid_resampling', False):
+        targets.append("field_grid")
+    if config['vsm'].get('plot_data_pyramid', False):
+        targets.append("plot_data_pyramid")
+    return targets
+
+
+@catch_exception_with_message()
+def dataset(
+    srcpaths: RdeInputDirPaths,
+    resource_paths: RdeOutputResourcePath,
+) -> None:
+    """Execute structured processing in VSM.
+
+    Execute structured text processing, metadata extraction, and visualization.
+    It handles structured text processing, metadata extraction, and graphing.
+    Other processing required for structuring may be implemented as needed.
+
+    The processing is declared as a DAG of stages (see `build_stage_graph`) and
+    run by `StageGraph`, which executes independent stages in parallel.
+
+    Args:
+        srcpaths: Paths to input resources for processing.
+        resource_paths: Paths to output resources for saving results.
+
+    Returns:
+        None
+
+    Note:
+        The actual function names and processing details may vary depending on the project.
+
+    """
+    # 設定取得（対象ステージと並行数の決定に使用）
+    config = VsmFactory.get_config(resource_paths.rawfiles[0], srcpaths.tasksupport)
+
+    # 拡張子・ファイル名ベース
+    raw_file = resource_paths.rawfiles[0]
+    raw_basename = raw_file.stem
+
+    values = {
+        "srcpaths": srcpaths,
+        "resource_paths": resource_paths,
+        "rawfile": raw_file,
+        "raw_basename": raw_basename,
+        "config": config,
+        # 共通CSVパス
+        "csv_path_graph": resource_paths.struct.joinpath(f"{raw_basename}.csv"),
+        "csv_path_param": resource_paths.struct.joinpath(f"{raw_basename}_param.csv"),
+        "csv_path_raw": resource_paths.struct.joinpath(f"{raw_basename}_raw.csv"),
+    }
+
+    # 出力ファイルのマニフェスト（書き込み時にSHA-256を計算）
+    manifest = OutputManifest()
+    # ステージごとの処理時間（logs/timings.json）、メモリ計測時はステージを逐次実行
+    memory_top = config['vsm'].get('memory_profile_top', DEFAULT_MEMORY_TOP) if config['vsm'].get('memory_profile', False) else None
+    manufacturer = config['vsm'].get('manufacturer', '')
+    timings = TileTimings(raw_file.name, raw_file.stat().st_size, memory_top, manufacturer)
+    # 集計用メトリクス（metrics_dir、環境変数 VSM_METRICS_DIR を設定した場合にファイル出力）
+    metrics.start_exporter(config)
+    isolated = config['vsm'].get('isolated_stages', ())
+    graph = build_stage_graph(isolated)
+    targets = select_targets(config)
+    max_workers = config['vsm'].get('pipeline_workers', DEFAULT_PIPELINE_WORKERS) if memory_top is None else 1
+    result_cache = ResultCache(config)
+    # 特性値の索引（result_index、処理したファイルごとに1行をSQLiteへ登録）
+    result_index = ResultIndex.from_config(config)
+    # ステージごとの処理時間の上限（stage_time_budgets、超過時は簡略化した処理に切り替え）
+    budget = TimeBudget.from_config(config)
+    # 一部のタイルのみプロファイルを取得（profile_rate、環境変数 VSM_PROFILE）
+    profiler = TileProfiler.sample(raw_basename, config, resource_paths.logs.joinpath(DIAGNOSTICS_DIR))
+    profiling = profiler.activate() if profiler is not None else contextlib.nullcontext()
+    with profiling, metrics.track_tile(timings, manufacturer), timings.activate(), manifest.activate(), budget.activate(), contextlib.ExitStack() as stack:
+        # 別プロセスで実行するステージ用の共有メモリ（タイルの終了時に解放）
+        if isolated:
+            values["shared_arena"] = stack.enter_context(SharedFrameArena())
+
+        # 解析結果キャッシュ（ヒットした場合は解析・CSV・グラフ出力を復元）
+        cache_key, entry = None, None
+        if result_cache.enabled:
+            values = graph.run(values, targets=["read_invoice"], max_workers=max_workers)
+            cache_key = result_cache.make_key(raw_file, values["invoice_obj"])
+            entry = result_cache.load(cache_key)
+            if entry is not None:
+                with span("result_cache"):
+                    result_cache.restore(entry, resource_paths)
+                values.update(entry["values"])
+                targets = [t for t in targets if t not in CACHED_STAGES]
+
+        # 大容量ファイルの分割処理（解析と生データ・グラフCSVの出力をブロック単位で行う）
+        chunked = ChunkedAnalyzer(config)
+        if entry is None and chunked.enabled:
+            values = graph.run(values, targets=["factory", "filename_mapping_rule", "read_invoice"], max_workers=max_workers)
+            with span("chunked_analyze"):
+                values.update(chunked.analyze(
+                    values["module"],
+                    resource_paths,
+                    is_filename_mapping_rule=values["is_filename_mapping_rule"],
+                    invoice_obj=values["invoice_obj"],
+                    csv_path_raw=values["csv_path_raw"],
+                    csv_path_graph=values["csv_path_graph"],
+                ))
+            targets = [t for t in targets if t not in (*CHUNKED_STAGES, *UNSUPPORTED_STAGES)]
+
+        values = graph.run(values, targets=targets, max_workers=max_workers)
+        if budget.degradations and "const_meta_info" in values:
+            # 簡略化した処理をメタデータに記録（メタデータは描画と並行して出力済みのため再出力）
+            values = graph.run(
+                {
+                    **values,
+                    "metadata_def": tasksupport_cache.new_metadata_def(srcpaths.tasksupport.joinpath("metadata-def.json")),
+                    "const_meta_info": {**values["const_meta_info"], METADATA_KEY: budget.summary()},
+                },
+                targets=["metadata"],
+                max_workers=max_workers,
+            )
+        if result_index is not None and "characteristic_values" in values:
+            with span("result_index"):
+                result_index.add(pipeline_row(values, manufacturer, file_sha256(raw_file), resource_paths.struct.parent.resolve()))
+        # 簡略化した結果はキャッシュしない（次回は通常の処理を試みる）
+        if cache_key is not None and entry is None and not budget.degradations:
+            result_cache.store(cache_key, values, manifest, resource_paths)
+        with span("manifest"):
+            manifest.write(resource_paths.logs.joinpath("manifest.json"))
+    with open_output(resource_paths.logs.joinpath(TIMINGS_NAME), "w", encoding="utf_8") as f:
+        json.dump(timings.to_dict(), f, indent=4, ensure_ascii=False)
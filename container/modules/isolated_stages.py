@@ -0,0 +1,214 @@
+"""Pipeline stages run in separate worker processes.
+
+The stages of a tile normally run in threads of the dataset process. Listed in
+`isolated_stages` of rdeconfig.yaml, the analysis ("analyze") and plotting
+("graph") stages run in a small pool of worker processes instead, so that a
+fit or a plot that exhausts memory or crashes the interpreter fails its stage
+without taking the whole dataset process down, and so that plotting does not
+hold the GIL of the process running the other stages.
+
+The parsed arrays are not pickled to the workers: the measurement data and the
+corrected curve are placed in shared memory blocks of the tile's
+`SharedFrameArena`, and the workers attach to them without copying. Worker
+results that are DataFrames come back the same way. The arena removes every
+block of the tile when the tile is done, also after a worker crash.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+from rdetoolkit.models.rde2types import MetaType, RdeInputDirPaths, RdeOutputResourcePath
+
+from modules_vsm.deferred_imports import load_matplotlib
+from modules_vsm.factory import VsmFactory
+from modules_vsm.manifest import OutputManifest, current_manifest, current_stage
+from modules_vsm.shared_frame import SharedFrameArena, SharedFrameDescriptor, attach_frame, share_frame
+
+# Worker processes of the pool; the isolated stages of one tile run one after another.
+ISOLATED_WORKERS = 2
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    load_matplotlib()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool  # noqa: PLW0603
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked: the dataset process runs stage threads.
+            _pool = ProcessPoolExecutor(
+                max_workers=ISOLATED_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _pool
+
+
+def _submit(func: Any, **kwargs: Any) -> Any:
+    """Run a function in the pool; a crashed worker fails the stage and the pool is replaced."""
+    global _pool  # noqa: PLW0603
+    pool = _get_pool()
+    try:
+        return pool.submit(func, **kwargs).result()
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        pool.shutdown(wait=False)
+        raise
+
+
+def _module(rawfile: Path, tasksupport: Path) -> VsmFactory:
+    # The configuration and handlers are cached per worker process.
+    config = VsmFactory.get_config(rawfile, tasksupport)
+    return VsmFactory.get_objects(rawfile, tasksupport, config)
+
+
+def _analyze_worker(
+    *,
+    rawfile: Path,
+    tasksupport: Path,
+    data: SharedFrameDescriptor,
+    columns: tuple[str | None, str | None, str | None],
+    meta: MetaType,
+    invoice_obj: dict,
+    prefix: str,
+) -> tuple[SharedFrameDescriptor, pd.DataFrame, bool, dict[str, str]]:
+    module = _module(rawfile, tasksupport)
+    x_col, rm_col, dc_rm_col = columns
+    with attach_frame(data) as df_data:
+        fit_data, characteristic_values, moment_flag, physical_props = module.structured_processer.analyze(
+            df_data,
+            x_col=x_col,
+            rm_col=rm_col,
+            dc_rm_col=dc_rm_col,
+            header=meta,
+            invoice_obj=invoice_obj,
+        )
+    # The block is unlinked by the dataset process when it takes the result.
+    shm, fit_shared = share_frame(fit_data.reset_index(drop=True), prefix)
+    shm.close()
+    return fit_shared, characteristic_values, moment_flag, physical_props
+
+
+def _plot_worker(
+    *,
+    rawfile: Path,
+    tasksupport: Path,
+    resource_paths: RdeOutputResourcePath,
+    raw_basename: str,
+    data: SharedFrameDescriptor,
+    columns: tuple[str | None, str | None, str | None],
+    fit: SharedFrameDescriptor,
+    characteristic_values: pd.DataFrame,
+    moment_flag: bool,
+    invoice_obj: dict,
+) -> list[dict[str, Any]]:
+    module = _module(rawfile, tasksupport)
+    x_col, rm_col, dc_rm_col = columns
+    manifest = OutputManifest()
+    current_stage.set("graph")
+    with manifest.activate(), attach_frame(data) as df_data, attach_frame(fit) as fit_data:
+        module.graph_plotter.plot_corrected_original(
+            df_data,
+            fit_data,
+            characteristic_values,
+            raw_basename,
+            invoice_obj,
+            resource_paths.main_image,
+            resource_paths.other_image,
+            moment_flag,
+            x_col=x_col,
+            rm_col=rm_col,
+            dc_rm_col=dc_rm_col,
+        )
+    return manifest.entries
+
+
+def _record(entries: list[dict[str, Any]]) -> None:
+    """Record the outputs a worker wrote in the manifest of the tile."""
+    manifest = current_manifest.get()
+    if manifest is None:
+        return
+    for entry in entries:
+        manifest.record(Path(entry["path"]), entry["bytes"], entry["sha256"], entry["stage"])
+
+
+def share_data(
+    *,
+    shared_arena: SharedFrameArena,
+    df_data: pd.DataFrame,
+    columns: tuple[str | None, str | None, str | None],
+) -> SharedFrameDescriptor:
+    """Place the measurement columns used by the analysis and the plots in shared memory."""
+    return shared_arena.share(df_data.reset_index(drop=True), columns)
+
+
+def share_fit(*, shared_arena: SharedFrameArena, fit_data: pd.DataFrame) -> SharedFrameDescriptor:
+    """Place the corrected curve in shared memory."""
+    return shared_arena.share(fit_data.reset_index(drop=True))
+
+
+def analyze(
+    *,
+    shared_arena: SharedFrameArena,
+    rawfile: Path,
+    srcpaths: RdeInputDirPaths,
+    df_shared: SharedFrameDescriptor,
+    columns: tuple[str | None, str | None, str | None],
+    meta: MetaType,
+    invoice_obj: dict,
+) -> tuple[pd.DataFrame, pd.DataFrame, bool, dict[str, str]]:
+    """Run `StructuredDataProcesser.analyze` in a worker process."""
+    fit_shared, characteristic_values, moment_flag, physical_props = _submit(
+        _analyze_worker,
+        rawfile=rawfile,
+        tasksupport=srcpaths.tasksupport,
+        data=df_shared,
+        columns=columns,
+        meta=meta,
+        invoice_obj=invoice_obj,
+        prefix=shared_arena.prefix,
+    )
+    return shared_arena.take(fit_shared), characteristic_values, moment_flag, physical_props
+
+
+def plot(
+    *,
+    rawfile: Path,
+    srcpaths: RdeInputDirPaths,
+    resource_paths: RdeOutputResourcePath,
+    raw_basename: str,
+    df_shared: SharedFrameDescriptor,
+    columns: tuple[str | None, str | None, str | None],
+    fit_shared: SharedFrameDescriptor,
+    characteristic_values: pd.DataFrame,
+    moment_flag: bool,
+    invoice_obj: dict,
+) -> None:
+    """Run `GraphPlotter.plot_corrected_original` in a worker process."""
+    entries = _submit(
+        _plot_worker,
+        rawfile=rawfile,
+        tasksupport=srcpaths.tasksupport,
+        resource_paths=resource_paths,
+        raw_basename=raw_basename,
+        data=df_shared,
+        columns=columns,
+        fit=fit_shared,
+        characteristic_values=characteristic_values,
+        moment_flag=moment_flag,
+        invoice_obj=invoice_obj,
+    )
+    _record(entries)
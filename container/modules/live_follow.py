@@ -0,0 +1,121 @@
+"""Tail-follow live mode for a measurement that is still running.
+
+The instrument appends rows to the measurement file while a loop is measured.
+This mode follows the file, parses only the appended rows and updates
+provisional characteristic values (Hc, Br, Bs, Ms) and the sweep segments
+without re-reading the file. The values are written to `<stem>_live.json`
+after each update and the corrected loop is re-rendered to `<stem>_live.png`
+at most every `live_plot_interval` seconds.
+
+Following stops when the file has not grown for `--idle-timeout` seconds; the
+last rows are then evaluated and the final values are written with
+`"complete": true`. The regular structuring process is not replaced: register
+the finished file as usual.
+
+Usage:
+    python -m modules.live_follow /mnt/instrument/sample.dat
+        --tasksupport templates/mpms/tasksupport --invoice invoice.json --output-dir /tmp/live
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from modules_vsm.factory import VsmFactory, get_classes
+from modules_vsm.live_handler import LiveLoopAnalyzer, LivePlotter, TailFollower, write_live_status
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_IDLE_TIMEOUT = 300.0
+
+
+def follow(
+    rawfile: Path,
+    tasksupport: Path,
+    output_dir: Path,
+    *,
+    spike_removal: bool = False,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+) -> Path:
+    """Follow a measurement file until it stops growing.
+
+    Args:
+        rawfile (Path): measurement file being written.
+        tasksupport (Path): tasksupport directory with rdeconfig.yaml.
+        output_dir (Path): directory of the live status and graph.
+        spike_removal (bool): apply the spike removal and background correction, as the invoice field of the same name.
+        poll_interval (float): seconds between reads of the file.
+        idle_timeout (float): seconds without new rows after which following stops.
+
+    Returns:
+        Path: the live status file.
+
+    """
+    config = VsmFactory.get_config(rawfile, tasksupport)
+    class_filereader, _ = get_classes(config['vsm']['manufacturer'], rawfile.suffix.lower())
+    file_reader = class_filereader()
+    follower = TailFollower(file_reader, rawfile)
+    analyzer = LiveLoopAnalyzer(spike_removal=spike_removal)
+    plotter = LivePlotter(config)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    status_path = output_dir.joinpath(f"{rawfile.stem}_live.json")
+    graph_path = output_dir.joinpath(f"{rawfile.stem}_live.png")
+
+    x_col: str | None = None
+    y_col: str | None = None
+    last_growth = time.monotonic()
+    while True:
+        df_rows = follower.poll()
+        if df_rows is not None and len(df_rows) > 0:
+            if x_col is None:
+                x_col, rm_col, dc_rm_col = file_reader.identify_columns(df_rows)
+                # Same choice as StructuredDataProcesser.analyze, made on the rows available at start.
+                y_col = dc_rm_col if rm_col is None or df_rows[rm_col].isna().iloc[-1] else rm_col
+                if x_col is None or y_col is None:
+                    err_msg = f"Measurement columns not found in {rawfile}"
+                    raise ValueError(err_msg)
+            analyzer.update(df_rows[x_col].to_numpy(dtype=float), df_rows[y_col].to_numpy(dtype=float))
+            write_live_status(status_path, follower, analyzer, complete=False)
+            last_growth = time.monotonic()
+        elif time.monotonic() - last_growth >= idle_timeout:
+            break
+        plotter.update(graph_path, rawfile.stem, analyzer)
+        time.sleep(poll_interval)
+
+    analyzer.finish()
+    write_live_status(status_path, follower, analyzer, complete=True)
+    plotter.update(graph_path, rawfile.stem, analyzer, force=True)
+    return status_path
+
+
+def main(argv: list[str] | None = None) -> Path:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Follow a VSM measurement file and update provisional results as rows are appended.")
+    parser.add_argument("rawfile", type=Path, help="measurement file being written")
+    parser.add_argument("--tasksupport", type=Path, required=True, help="tasksupport directory with rdeconfig.yaml")
+    parser.add_argument("--invoice", type=Path, default=None, help="invoice.json; its spike_removal field is applied")
+    parser.add_argument("--output-dir", type=Path, default=None, help="directory of the live status and graph (default: next to the file)")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT, help="seconds without new rows before following stops")
+    args = parser.parse_args(argv)
+
+    spike_removal = False
+    if args.invoice is not None:
+        with open(args.invoice, encoding="utf_8") as f:
+            spike_removal = bool(json.load(f)["custom"].get("spike_removal"))
+
+    return follow(
+        args.rawfile,
+        args.tasksupport,
+        args.output_dir or args.rawfile.parent,
+        spike_removal=spike_removal,
+        poll_interval=args.poll_interval,
+        idle_timeout=args.idle_timeout,
+    )
+
+
+if __name__ == "__main__":
+    main()
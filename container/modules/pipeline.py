@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import contextvars
+import traceback
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any
+
+import pandas as pd
+from rdetoolkit.exceptions import StructuredError
+
+from modules_vsm.manifest import current_stage
+from modules_vsm.profiling import track_thread
+from modules_vsm.time_budget import stage_budget
+from modules_vsm.timing import span
+
+DEFAULT_PIPELINE_WORKERS = 4
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A named step of the structuring pipeline.
+
+    Attributes:
+        name (str): unique stage name.
+        func (Callable[..., Any]): called with the declared inputs as keyword arguments.
+            With one declared output it returns the value, with several it returns a
+            tuple in the declared order, and a stage without outputs returns None.
+        inputs (tuple[str, ...]): names of the values the stage consumes.
+        outputs (tuple[str, ...]): names of the values the stage produces.
+        after (tuple[str, ...]): stages that must finish first without passing values,
+            e.g. so that the invoice is only rewritten once the analysis succeeded.
+
+    """
+
+    name: str
+    func: Callable[..., Any]
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+    after: tuple[str, ...] = ()
+
+
+def stage_error(name: str, exc: BaseException) -> StructuredError:
+    """Return the error raised for a failed stage.
+
+    A StructuredError is returned unchanged, so that its message and error code
+    reach the user as raised by the stage. Other exceptions are wrapped into a
+    StructuredError naming the stage and carrying the traceback.
+    """
+    if isinstance(exc, StructuredError):
+        return exc
+    err_msg = f"Stage '{name}' failed: {exc}"
+    tb = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+    return StructuredError(err_msg, traceback_info=tb)
+
+
+def _frame_rows(values: Iterable[Any]) -> int | None:
+    """Return the row count of the largest DataFrame among the values."""
+    rows = [len(value) for value in values if isinstance(value, pd.DataFrame)]
+    return max(rows) if rows else None
+
+
+class StageGraph:
+    """Dependency-aware scheduler for a DAG of stages.
+
+    Stages run on a bounded thread pool as soon as all of their inputs exist, so
+    independent stages (e.g. reading the invoice and reading the raw file, or
+    plotting and writing metadata) overlap. Only the stages needed for the
+    requested targets are executed; values given to `run` are not recomputed.
+
+    Example:
+        graph = StageGraph([
+            Stage("read", read_raw, inputs=("path",), outputs=("df",)),
+            Stage("plot", plot, inputs=("df",)),
+        ])
+        values = graph.run({"path": path}, targets=["plot"])
+
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: dict[str, Stage] = {}
+        self.producers: dict[str, str] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                err_msg = f"Duplicate stage name: {stage.name}"
+                raise ValueError(err_msg)
+            self.stages[stage.name] = stage
+            for output in stage.outputs:
+                if output in self.producers:
+                    err_msg = f"Value '{output}' is produced by both '{self.producers[output]}' and '{stage.name}'"
+                    raise ValueError(err_msg)
+                self.producers[output] = stage.name
+
+    def _dependencies(self, stage: Stage, available: set[str]) -> set[str]:
+        # A stage whose outputs are all given counts as done, e.g. an analysis restored from a cache.
+        deps = {
+            name for name in stage.after
+            if name not in self.stages or not self.stages[name].outputs or not set(self.stages[name].outputs) <= available
+        }
+        for value in stage.inputs:
+            if value in available:
+                continue
+            if value in self.producers:
+                deps.add(self.producers[value])
+            else:
+                err_msg = f"Stage '{stage.name}' needs '{value}', which is neither given nor produced by any stage"
+                raise ValueError(err_msg)
+        unknown = deps - self.stages.keys()
+        if unknown:
+            err_msg = f"Stage '{stage.name}' depends on unknown stages: {sorted(unknown)}"
+            raise ValueError(err_msg)
+        return deps
+
+    def plan(self, targets: Iterable[str], available: Iterable[str] = ()) -> dict[str, set[str]]:
+        """Return the needed stages and their dependencies for the given target stages.
+
+        Args:
+            targets (Iterable[str]): names of the stages whose effects are wanted.
+            available (Iterable[str]): names of values given to `run`.
+
+        Returns:
+            dict[str, set[str]]: stage name to the names of the stages it waits for.
+
+        Raises:
+            ValueError: On unknown targets, unresolvable inputs or cycles.
+
+        """
+        available = set(available)
+        needed: dict[str, set[str]] = {}
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name in needed:
+                continue
+            if name not in self.stages:
+                err_msg = f"Unknown stage: {name}"
+                raise ValueError(err_msg)
+            needed[name] = self._dependencies(self.stages[name], available)
+            pending.extend(needed[name])
+
+        # Kahn's algorithm, only to reject cycles before anything runs.
+        remaining = {name: set(deps) for name, deps in needed.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                err_msg = f"Cycle between stages: {sorted(remaining)}"
+                raise ValueError(err_msg)
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return needed
+
+    def _execute(self, stage: Stage, values: dict[str, Any]) -> dict[str, Any]:
+        current_stage.set(stage.name)
+        with span(stage.name) as timed, track_thread(), stage_budget(stage.name):
+            inputs = {name: values[name] for name in stage.inputs}
+            result = stage.func(**inputs)
+            if not stage.outputs:
+                produced = {}
+            elif len(stage.outputs) == 1:
+                produced = {stage.outputs[0]: result}
+            else:
+                produced = dict(zip(stage.outputs, result, strict=True))
+            if timed is not None:
+                # Rows of the measurement data the stage consumed, or produced if it consumed none.
+                timed.rows = _frame_rows(inputs.values())
+                if timed.rows is None:
+                    timed.rows = _frame_rows(produced.values())
+        return produced
+
+    def run(
+        self,
+        values: dict[str, Any],
+        targets: Iterable[str],
+        max_workers: int = DEFAULT_PIPELINE_WORKERS,
+    ) -> dict[str, Any]:
+        """Run the stages needed for the targets.
+
+        Args:
+            values (dict[str, Any]): initial values available to the stages.
+            targets (Iterable[str]): names of the stages that must run.
+            max_workers (int): maximum number of stages running at once.
+
+        Returns:
+            dict[str, Any]: the initial values together with all produced values.
+
+        Raises:
+            StructuredError: If a stage fails. No further stage is started, the
+                running ones are awaited and the first failure is re-raised
+                (see `stage_error`).
+
+        """
+        values = dict(values)
+        waiting = self.plan(targets, values.keys())
+        done_stages: set[str] = set()
+        failed: list[tuple[str, BaseException]] = []
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="vsm-stage") as executor:
+            running: dict[Future, str] = {}
+            while waiting or running:
+                if not failed:
+                    for name in [n for n, deps in waiting.items() if deps <= done_stages]:
+                        del waiting[name]
+                        # Each stage runs in a copy of the caller's context (active manifest etc.).
+                        ctx = contextvars.copy_context()
+                        running[executor.submit(ctx.run, self._execute, self.stages[name], values)] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    exc = future.exception()
+                    if exc is not None:
+                        failed.append((name, exc))
+                        continue
+                    values.update(future.result())
+                    done_stages.add(name)
+
+        if failed:
+            name, exc = failed[0]
+            error = stage_error(name, exc)
+            if error is exc:
+                raise error
+            raise error from exc
+        return values
@@ -0,0 +1,155 @@
+"""Add already processed datasets to the SQLite index of characteristic values.
+
+New runs are added to the index by the structuring pipeline when `result_index`
+is enabled in rdeconfig.yaml (see `modules_vsm.result_index`). This command
+fills the index from the outputs of earlier runs: it finds the param CSVs
+(`structured/*_param.csv`) below the given directories and reads, next to each
+of them, the invoice (measured date, file name tokens, sample size), the
+metadata (sample size of the file header) and the measurement file in `raw`,
+`nonshared_raw` or `inputdata` for its SHA-256. The manufacturer is taken
+from the extension of the measurement file.
+
+The values are those of the param CSV, i.e. rounded to three significant
+digits; processing the file again replaces them with full precision values.
+Rows added by the pipeline are kept, so a backfill never overwrites them.
+Datasets without a param CSV (`feature_acquisition` disabled) are skipped.
+
+Usage:
+    python -m modules.result_index_backfill data --db ~/.cache/rde_vsm/index.sqlite
+    python -m modules.result_index_backfill /data/rde/* --config tasksupport/rdeconfig.yaml
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+from modules_vsm.factory import (
+    MPMS_SUFFIX_CLASS_MAPPING,
+    TAMAKAWA_SUFFIX_CLASS_MAPPING,
+    LakeShore_SUFFIX_CLASS_MAPPING,
+    read_rdeconfig,
+)
+from modules_vsm.result_index import ResultIndex, file_sha256, index_row
+from modules_vsm.structured_handler import StructuredDataProcesser
+
+PARAM_SUFFIX = "_param"
+# Directories of a tile that may hold the measurement file, in order of preference.
+RAW_DIRS = ("raw", "nonshared_raw", "inputdata")
+# Rows written per transaction.
+BATCH_ROWS = 500
+SUFFIX_MANUFACTURERS = {
+    suffix: manufacturer
+    for mapping in (MPMS_SUFFIX_CLASS_MAPPING, TAMAKAWA_SUFFIX_CLASS_MAPPING, LakeShore_SUFFIX_CLASS_MAPPING)
+    for manufacturer, suffixes in mapping.items()
+    for suffix in suffixes
+}
+
+
+def _read_json(path: Path) -> dict[str, Any]:
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf_8") as f:
+        data: dict[str, Any] = json.load(f)
+    return data
+
+
+def _find_rawfile(tile_dir: Path, stem: str) -> Path | None:
+    for name in RAW_DIRS:
+        candidates = sorted(path for path in tile_dir.joinpath(name).glob(f"{stem}.*") if path.is_file())
+        if candidates:
+            return candidates[0]
+    return None
+
+
+def backfill_row(param_csv: Path) -> dict[str, Any] | None:
+    """Return the index row of the dataset of a param CSV, or None if the CSV has no values.
+
+    Args:
+        param_csv (Path): `<tile>/structured/<name>_param.csv`.
+
+    Returns:
+        dict[str, Any] | None: row of `modules_vsm.result_index.index_row`.
+
+    """
+    with open(param_csv, encoding="utf_8", newline="") as f:
+        params = next(csv.DictReader(f), None)
+    if not params:
+        return None
+
+    tile_dir = param_csv.parent.parent
+    stem = param_csv.stem.removesuffix(PARAM_SUFFIX)
+    invoice_obj = _read_json(tile_dir.joinpath("invoice", "invoice.json"))
+    invoice_obj.setdefault("custom", {})
+    constant = {key: entry.get("value") for key, entry in _read_json(tile_dir.joinpath("meta", "metadata.json")).get("constant", {}).items()}
+    sample_size = StructuredDataProcesser().get_sample_size({"SAMPLE_SIZE": constant.get("sample_size")}, invoice_obj)
+
+    rawfile = _find_rawfile(tile_dir, stem)
+    return index_row(
+        file_name=rawfile.name if rawfile is not None else stem,
+        input_sha256=file_sha256(rawfile) if rawfile is not None else "",
+        manufacturer=SUFFIX_MANUFACTURERS.get(rawfile.suffix.lower()) if rawfile is not None else None,
+        invoice_custom=invoice_obj["custom"],
+        sample_size=sample_size,
+        values={key: float(value) for key, value in params.items() if value not in (None, "")},
+        data_dir=tile_dir.resolve(),
+        source="backfill",
+    )
+
+
+def backfill(index: ResultIndex, dirs: list[Path]) -> tuple[int, list[str]]:
+    """Add the datasets below the directories to the index.
+
+    Args:
+        index (ResultIndex): index written to.
+        dirs (list[Path]): directories searched for `structured/*_param.csv`.
+
+    Returns:
+        tuple[int, list[str]]: number of rows inserted or updated, and the param CSVs that could not be read with the reason.
+
+    """
+    written, skipped = 0, []
+    rows = []
+    for root in dirs:
+        for param_csv in sorted(root.glob(f"**/structured/*{PARAM_SUFFIX}.csv")):
+            try:
+                row = backfill_row(param_csv)
+            except (OSError, ValueError) as exc:
+                skipped.append(f"{param_csv}: {exc}")
+                continue
+            if row is None:
+                skipped.append(f"{param_csv}: no values")
+                continue
+            rows.append(row)
+            if len(rows) >= BATCH_ROWS:
+                written += index.upsert(rows)
+                rows.clear()
+    if rows:
+        written += index.upsert(rows)
+    return written, skipped
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Command line entry point; returns 1 if a param CSV could not be read."""
+    parser = argparse.ArgumentParser(description="Add processed datasets to the SQLite index of characteristic values.")
+    parser.add_argument("dirs", type=Path, nargs="+", help="directories searched for */structured/*_param.csv")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--db", type=Path, help="index database file")
+    target.add_argument("--config", type=Path, help="rdeconfig.yaml whose result_index_path is used")
+    args = parser.parse_args(argv)
+
+    index = ResultIndex(args.db if args.db is not None else ResultIndex.path_from_config(read_rdeconfig(args.config)))
+
+    written, skipped = backfill(index, args.dirs)
+    lines = [f"{written} rows written to {index.path}"]
+    lines += [f"skipped {reason}" for reason in skipped]
+    sys.stdout.write("\n".join(lines) + "\n")
+    return 1 if skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Percentile report over the per-tile timing records of finished runs.
+
+Every tile writes `logs/timings.json` (see `modules_vsm.timing`). This command
+collects them below one or more directories, e.g. the `data` directory of a
+batch run or the output root of the watch mode, and prints the p50/p95/p99 of
+the tile wall time and of each stage, per manufacturer (mpms, TAMAKAWA,
+LakeShore) and per input size bucket (powers of ten of the input bytes).
+
+Usage:
+    python -m modules.timings_report data
+    python -m modules.timings_report /data/rde --json report.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from modules_vsm.timing import TIMINGS_FORMAT, TIMINGS_NAME
+
+PERCENTILES = (50, 95, 99)
+# Name of the whole tile in the tables, next to the stage names.
+TILE_ROW = "(tile)"
+SIZE_UNITS = ("B", "kB", "MB", "GB", "TB")
+
+
+def load_timings(dirs: list[Path]) -> list[dict[str, Any]]:
+    """Return the timing records found below the given directories."""
+    records = []
+    for root in dirs:
+        for path in sorted(root.glob(f"**/logs/{TIMINGS_NAME}")):
+            try:
+                with open(path, encoding="utf_8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if record.get("format") == TIMINGS_FORMAT and record.get("spans") is not None:
+                records.append(record)
+    return records
+
+
+def _size_label(value: float) -> str:
+    exponent = int(math.log10(value))
+    unit = min(exponent // 3, len(SIZE_UNITS) - 1)
+    return f"{10 ** (exponent - 3 * unit)}{SIZE_UNITS[unit]}"
+
+
+def size_bucket(input_bytes: int | None) -> str:
+    """Return the power-of-ten bucket of an input size, e.g. "100kB-1MB"."""
+    if not input_bytes:
+        return "unknown"
+    exponent = int(math.floor(math.log10(input_bytes)))
+    return f"{_size_label(10 ** exponent)}-{_size_label(10 ** (exponent + 1))}"
+
+
+def _durations(record: dict[str, Any]) -> dict[str, float]:
+    root = record["spans"]
+    durations = {TILE_ROW: root["wall_sec"]}
+    for stage in root.get("children", []):
+        durations[stage["name"]] = stage["wall_sec"]
+    return durations
+
+
+def aggregate(records: list[dict[str, Any]], key: str) -> dict[str, dict[str, dict[str, float]]]:
+    """Return the percentiles of the tile and stage wall times per group.
+
+    Args:
+        records (list[dict[str, Any]]): contents of timings.json files.
+        key (str): "manufacturer" or "size".
+
+    Returns:
+        dict[str, dict[str, dict[str, float]]]: group -> row (tile or stage) ->
+            "count" and "p50", "p95", "p99" in seconds.
+
+    """
+    samples: dict[str, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        group = size_bucket(record.get("input_bytes")) if key == "size" else record.get("manufacturer") or "unknown"
+        for row, seconds in _durations(record).items():
+            samples[group][row].append(seconds)
+
+    result: dict[str, dict[str, dict[str, float]]] = {}
+    for group, rows in sorted(samples.items()):
+        result[group] = {}
+        for row, values in sorted(rows.items(), key=lambda item: (item[0] != TILE_ROW, item[0])):
+            result[group][row] = {
+                "count": len(values),
+                **{f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES), strict=True)},
+            }
+    return result
+
+
+def format_tables(report: dict[str, dict[str, dict[str, dict[str, float]]]]) -> str:
+    """Return the aggregated percentiles as text tables."""
+    lines = []
+    for key, groups in report.items():
+        for group, rows in groups.items():
+            lines.append(f"[{key}: {group}]")
+            lines.append(f"{'stage':<24}{'count':>8}" + "".join(f"{f'p{p} [s]':>12}" for p in PERCENTILES))
+            for row, values in rows.items():
+                lines.append(f"{row:<24}{int(values['count']):>8}" + "".join(f"{values[f'p{p}']:>12.3f}" for p in PERCENTILES))
+            lines.append("")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Aggregate the per-tile timings.json files into percentile tables.")
+    parser.add_argument("dirs", type=Path, nargs="+", help="directories searched for */logs/timings.json")
+    parser.add_argument("--json", type=Path, default=None, help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    records = load_timings(args.dirs)
+    report = {
+        "manufacturer": aggregate(records, "manufacturer"),
+        "size": aggregate(records, "size"),
+    }
+    sys.stdout.write(f"{len(records)} tiles\n\n" + format_tables(report))
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf_8") as f:
+            json.dump({"tiles": len(records), **report}, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
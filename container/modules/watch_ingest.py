@@ -0,0 +1,302 @@
+"""Directory-watch ingestion for the VSM structuring process.
+
+Instruments drop finished measurement files into a shared directory. This mode
+polls the directory, waits until a new file has stopped growing, builds an RDE
+data tree for it from template tasksupport and invoice files and runs the
+structuring process on a pool of warm worker processes.
+
+The number of files processed at once is bounded by `--concurrency`. Ready
+files wait in a queue of at most `--queue-size` entries; when it is full the
+watcher stops taking new files until a worker is free (backpressure). Every
+file gets a line in `<output-root>/ingest_log.jsonl` with its queue wait and
+processing time. Successfully processed files are not processed again after a
+restart; failed files are retried once the service is restarted.
+
+A crashed worker breaks the process pool. The pool is then replaced, and the
+files that were being processed are submitted again up to `CRASH_RETRIES`
+times before they are recorded as failed.
+
+Usage:
+    python -m modules.watch_ingest --watch /mnt/instrument --output-root /data/rde
+        --tasksupport templates/mpms/tasksupport --invoice invoice.json --concurrency 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from modules.batch_runner import warm_up_worker
+from modules.worker_daemon import run_job
+
+INGEST_LOG_NAME = "ingest_log.jsonl"
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_SETTLE_SECONDS = 2.0
+# Resubmissions of a file whose worker pool broke while it was processed.
+CRASH_RETRIES = 1
+# Names of files that are still being written by common transfer tools.
+PARTIAL_SUFFIXES = (".tmp", ".part", ".partial", ".crdownload")
+
+
+@dataclass
+class PendingFile:
+    """A file seen by the watcher, with the size and mtime it had when it last changed."""
+
+    path: Path
+    size: int
+    mtime_ns: int
+    changed_at: float
+    detected_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class IngestJob:
+    """A stable file waiting for a worker."""
+
+    path: Path
+    size: int
+    mtime_ns: int
+    detected_at: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class DirectoryWatcher:
+    """Poll a directory and report files that have stopped growing.
+
+    A file is stable when its size and mtime have not changed for `settle`
+    seconds. Only plain polling with `os.stat` is used, so the watcher works on
+    network shares where no change notification is available.
+
+    Args:
+        watch_dir (Path): directory to watch.
+        pattern (str): glob pattern of the measurement files.
+        settle (float): seconds without change after which a file is stable.
+
+    """
+
+    def __init__(self, watch_dir: Path, pattern: str = "*", settle: float = DEFAULT_SETTLE_SECONDS):
+        self.watch_dir = watch_dir
+        self.pattern = pattern
+        self.settle = settle
+        self.pending: dict[Path, PendingFile] = {}
+        self.done: set[tuple[str, int, int]] = set()
+
+    def _candidates(self) -> list[Path]:
+        return [
+            p for p in sorted(self.watch_dir.glob(self.pattern))
+            if p.is_file() and not p.name.startswith(".") and not p.name.lower().endswith(PARTIAL_SUFFIXES)
+        ]
+
+    def poll(self) -> list[PendingFile]:
+        """Scan the directory once and return the files that became stable since the last scan."""
+        now = time.monotonic()
+        stable = []
+        seen = set()
+        for path in self._candidates():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            seen.add(path)
+            if (path.name, stat.st_size, stat.st_mtime_ns) in self.done:
+                continue
+            pending = self.pending.get(path)
+            if pending is None or (pending.size, pending.mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+                detected_at = pending.detected_at if pending is not None else time.time()
+                self.pending[path] = PendingFile(path, stat.st_size, stat.st_mtime_ns, now, detected_at)
+                continue
+            if now - pending.changed_at >= self.settle:
+                stable.append(pending)
+                del self.pending[path]
+                self.done.add((path.name, pending.size, pending.mtime_ns))
+        # Files removed before they became stable are forgotten.
+        for path in set(self.pending) - seen:
+            del self.pending[path]
+        return stable
+
+
+class IngestService:
+    """Schedule stable files from a watched directory through the structuring process.
+
+    Args:
+        watcher (DirectoryWatcher): source of stable files.
+        output_root (Path): directory in which one RDE data tree per file is created.
+        tasksupport (Path): template tasksupport directory copied into each tree.
+        invoice (Path): template invoice.json copied into each tree.
+        concurrency (int): maximum number of files processed at once.
+        queue_size (int): maximum number of stable files waiting for a worker.
+
+    """
+
+    def __init__(
+        self,
+        watcher: DirectoryWatcher,
+        output_root: Path,
+        *,
+        tasksupport: Path,
+        invoice: Path,
+        concurrency: int = 1,
+        queue_size: int = 16,
+    ):
+        self.watcher = watcher
+        self.output_root = output_root
+        self.tasksupport = tasksupport
+        self.invoice = invoice
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.log_path = output_root.joinpath(INGEST_LOG_NAME)
+        self._executor: ProcessPoolExecutor | None = None
+
+    def load_done(self) -> None:
+        """Mark the files processed successfully according to the ingest log as done, so a restart does not process them again."""
+        if not self.log_path.exists():
+            return
+        with open(self.log_path, encoding="utf_8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["status"] == "success":
+                    self.watcher.done.add((record["file"], record["bytes"], record["mtime_ns"]))
+
+    def prepare_tree(self, job: IngestJob) -> Path:
+        """Create the RDE data tree of a file and return its `data` directory."""
+        data_dir = self.output_root.joinpath(f"{job.path.stem}-{job.mtime_ns}", "data")
+        data_dir.joinpath("inputdata").mkdir(parents=True, exist_ok=True)
+        data_dir.joinpath("invoice").mkdir(parents=True, exist_ok=True)
+        shutil.copy2(job.path, data_dir.joinpath("inputdata", job.path.name))
+        shutil.copyfile(self.invoice, data_dir.joinpath("invoice", "invoice.json"))
+        shutil.copytree(self.tasksupport, data_dir.joinpath("tasksupport"), dirs_exist_ok=True)
+        return data_dir
+
+    def write_log(self, record: dict[str, Any]) -> None:
+        """Append the record of a processed file to the ingest log."""
+        with open(self.log_path, "a", encoding="utf_8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def _watch(self, queue: asyncio.Queue[IngestJob | None], poll_interval: float, once: bool) -> None:
+        while True:
+            for pending in self.watcher.poll():
+                # Blocks while the queue is full, so no new files are taken on.
+                await queue.put(IngestJob(pending.path, pending.size, pending.mtime_ns, pending.detected_at))
+            if once and not self.watcher.pending:
+                break
+            await asyncio.sleep(poll_interval)
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Spawned rather than forked: the watcher runs the event loop and copy threads.
+        return ProcessPoolExecutor(
+            max_workers=self.concurrency,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_up_worker,
+        )
+
+    async def _run_job(self, data_dir: Path) -> dict[str, Any]:
+        """Run the structuring process of a tree on the pool, replacing the pool if a worker crashed."""
+        loop = asyncio.get_running_loop()
+        job = {"job_id": data_dir.parent.name, "input_dir": str(data_dir)}
+        retries = 0
+        while True:
+            if self._executor is None:
+                self._executor = self._new_executor()
+            executor = self._executor
+            try:
+                result: dict[str, Any] = await loop.run_in_executor(executor, run_job, job)
+            except BrokenProcessPool:
+                # All workers share the broken pool; the first of them to notice replaces it.
+                if self._executor is executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = self._new_executor()
+                retries += 1
+                if retries > CRASH_RETRIES:
+                    raise
+                continue
+            return result
+
+    async def _work(self, queue: asyncio.Queue[IngestJob | None]) -> None:
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            started = time.monotonic()
+            try:
+                # Copying a large file would block the watcher and the other workers.
+                data_dir = await asyncio.to_thread(self.prepare_tree, job)
+                result = await self._run_job(data_dir)
+                status, error = result["status"], result["error"]
+            except Exception as e:
+                status, error = "failed", str(e)
+            finished = time.monotonic()
+            self.write_log({
+                "file": job.path.name,
+                "bytes": job.size,
+                "mtime_ns": job.mtime_ns,
+                "output_dir": str(self.output_root.joinpath(f"{job.path.stem}-{job.mtime_ns}")),
+                "status": status,
+                "error": error,
+                "detected_at": job.detected_at,
+                "queue_wait_sec": round(started - job.enqueued_at, 6),
+                "processing_sec": round(finished - started, 6),
+            })
+
+    async def run(self, *, poll_interval: float = DEFAULT_POLL_INTERVAL, once: bool = False) -> None:
+        """Watch and process files until cancelled.
+
+        Args:
+            poll_interval (float): seconds between directory scans.
+            once (bool): stop once every file present at start has been processed.
+
+        """
+        self.output_root.mkdir(parents=True, exist_ok=True)
+        self.load_done()
+        queue: asyncio.Queue[IngestJob | None] = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = self._new_executor()
+        workers = [asyncio.create_task(self._work(queue)) for _ in range(self.concurrency)]
+        try:
+            await self._watch(queue, poll_interval, once)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Watch a directory and structure new VSM measurement files.")
+    parser.add_argument("--watch", type=Path, required=True, help="directory the instrument writes to")
+    parser.add_argument("--output-root", type=Path, required=True, help="directory for the RDE data trees")
+    parser.add_argument("--tasksupport", type=Path, required=True, help="template tasksupport directory")
+    parser.add_argument("--invoice", type=Path, required=True, help="template invoice.json")
+    parser.add_argument("--pattern", default="*", help="glob pattern of the measurement files")
+    parser.add_argument("-j", "--concurrency", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS, help="seconds without change before a file is processed")
+    parser.add_argument("--once", action="store_true", help="process the files present now and exit")
+    args = parser.parse_args(argv)
+
+    service = IngestService(
+        DirectoryWatcher(args.watch, args.pattern, args.settle),
+        args.output_root,
+        tasksupport=args.tasksupport,
+        invoice=args.invoice,
+        concurrency=args.concurrency,
+        queue_size=args.queue_size,
+    )
+    asyncio.run(service.run(poll_interval=args.poll_interval, once=args.once))
+
+
+if __name__ == "__main__":
+    main()
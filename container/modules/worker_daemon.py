@@ -0,0 +1,359 @@
+"""Long-lived worker that runs the VSM structuring process for queued jobs.
+
+Starting a container per file pays for the interpreter, the pandas, matplotlib,
+scikit-learn and rdetoolkit imports and the tasksupport setup every time. The
+worker imports everything once and then processes jobs from a spool directory
+in the same process, so that a job only costs the structuring itself.
+
+Spool layout:
+    incoming/<job_id>.json               job descriptors waiting to be processed
+    running/<job_id>@<host>@<pid>.json   job claimed by the worker process <pid> on <host>
+    done/<job_id>.json                   job descriptor together with its result
+
+A job descriptor is a JSON object with `input_dir`, the RDE `data` directory
+holding inputdata, invoice and tasksupport, and optionally `output_dir`, the
+directory in which the `data` output tree is created. Without `output_dir` the
+job is processed in place. Jobs are claimed by renaming, so several workers
+can serve the same spool directory.
+
+A worker requeues the jobs claimed by workers on its host that are no longer
+running, e.g. after a crash or a restart of the container, when it starts and
+every `RECOVERY_INTERVAL` seconds while it serves, so that a job is not stuck
+when no new worker starts. A job whose worker died `MAX_ATTEMPTS` times is
+reported as failed instead.
+
+Usage:
+    python -m modules.worker_daemon serve --spool /var/spool/vsm
+    python -m modules.worker_daemon submit --spool /var/spool/vsm --input-dir /path/to/data --wait
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import time
+import traceback
+import uuid
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+from rdetoolkit import workflows
+from rdetoolkit.rdelogger import LazyFileHandler
+
+from modules import datasets_process
+from modules.batch_runner import warm_up_worker
+from modules_vsm.manifest import refresh_manifests
+
+SPOOL_DIRS = ("incoming", "running", "done")
+INPUT_DIRS = ("inputdata", "invoice", "tasksupport")
+DEFAULT_POLL_INTERVAL = 0.2
+# Claims after which a job whose worker died is reported as failed instead of queued again.
+MAX_ATTEMPTS = 3
+# Seconds between checks for claims of dead workers while serving.
+RECOVERY_INTERVAL = 5.0
+OWNER_SEPARATOR = "@"
+
+
+def init_spool(spool: Path) -> None:
+    """Create the spool subdirectories."""
+    for name in SPOOL_DIRS:
+        spool.joinpath(name).mkdir(parents=True, exist_ok=True)
+
+
+def submit_job(spool: Path, input_dir: Path, output_dir: Path | None = None) -> str:
+    """Queue a job and return its id.
+
+    The descriptor is written to a temporary name first and renamed, so a
+    worker never reads a partially written job.
+
+    Args:
+        spool (Path): spool directory.
+        input_dir (Path): RDE `data` directory with inputdata, invoice and tasksupport.
+        output_dir (Path | None): directory in which the `data` output tree is created.
+
+    Returns:
+        str: job id.
+
+    """
+    init_spool(spool)
+    job_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    job = {"job_id": job_id, "input_dir": str(input_dir.resolve()), "output_dir": str(output_dir.resolve()) if output_dir else None}
+    tmp_path = spool.joinpath("incoming", f".{job_id}.tmp")
+    with open(tmp_path, "w", encoding="utf_8") as f:
+        json.dump(job, f)
+    tmp_path.rename(spool.joinpath("incoming", f"{job_id}.json"))
+    return job_id
+
+
+def wait_for_result(spool: Path, job_id: str, timeout: float | None = None, poll_interval: float = DEFAULT_POLL_INTERVAL) -> dict[str, Any]:
+    """Wait until a job is done and return its result record.
+
+    Raises:
+        TimeoutError: If the job is not done within `timeout` seconds.
+
+    """
+    result_path = spool.joinpath("done", f"{job_id}.json")
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not result_path.exists():
+        if deadline is not None and time.monotonic() > deadline:
+            err_msg = f"Job {job_id} did not finish within {timeout} s"
+            raise TimeoutError(err_msg)
+        time.sleep(poll_interval)
+    with open(result_path, encoding="utf_8") as f:
+        record: dict[str, Any] = json.load(f)
+    return record
+
+
+@contextlib.contextmanager
+def working_directory(path: Path) -> Generator[None, None, None]:
+    """Change the working directory for the duration of a job."""
+    cwd = Path.cwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def release_log_files() -> None:
+    """Close the rdetoolkit log files of the previous job.
+
+    rdetoolkit logs to the relative path data/logs/rdesys.log and opens the
+    file on the first message. Replacing the handlers whose file is open makes
+    the next message open the log of the job in the current working directory.
+
+    """
+    loggers = [logging.getLogger(), *(logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger))]
+    for logger in loggers:
+        for handler in list(logger.handlers):
+            if not isinstance(handler, LazyFileHandler):
+                continue
+            # `_handler` is the lazily opened FileHandler; the bundled stub does not declare it.
+            opened = getattr(handler, "_handler", None)
+            if opened is None:
+                continue
+            opened.close()
+            fresh = LazyFileHandler(handler.filename, handler.mode, handler.encoding)
+            fresh.setLevel(handler.level)
+            fresh.setFormatter(handler.formatter)
+            logger.removeHandler(handler)
+            logger.addHandler(fresh)
+
+
+def prepare_workdir(job: dict[str, Any]) -> Path:
+    """Return the working directory of a job, copying the inputs to the output directory if one is given."""
+    input_dir = Path(job["input_dir"])
+    if not job.get("output_dir"):
+        if input_dir.name != "data":
+            err_msg = f"Input directory must be an RDE 'data' directory when no output directory is given: {input_dir}"
+            raise ValueError(err_msg)
+        return input_dir.parent
+
+    output_dir = Path(job["output_dir"])
+    data_dir = output_dir.joinpath("data")
+    if data_dir.resolve() != input_dir.resolve():
+        for name in INPUT_DIRS:
+            if input_dir.joinpath(name).exists():
+                shutil.copytree(input_dir.joinpath(name), data_dir.joinpath(name), dirs_exist_ok=True)
+    return output_dir
+
+
+def run_job(job: dict[str, Any]) -> dict[str, Any]:
+    """Run the structuring process for one job and return the result record."""
+    start = time.perf_counter()
+    record: dict[str, Any] = {**job, "status": "success", "result": None, "error": None}
+    try:
+        workdir = prepare_workdir(job)
+        with working_directory(workdir):
+            release_log_files()
+            try:
+                result = workflows.run(custom_dataset_function=datasets_process.dataset)
+                refresh_manifests(Path("data"))
+            finally:
+                release_log_files()
+        record["result"] = json.loads(result)
+        if any(status.get("status") != "success" for status in record["result"].get("statuses", [])):
+            record["status"] = "failed"
+    except SystemExit as e:
+        # rdetoolkit exits the process on a structured error; the worker keeps running.
+        record["status"] = "failed"
+        record["error"] = f"Structuring process exited with code {e.code}"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+    record["elapsed_sec"] = round(time.perf_counter() - start, 6)
+    return record
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}{OWNER_SEPARATOR}{os.getpid()}"
+
+
+def _job_id(path: Path) -> str:
+    return path.stem.split(OWNER_SEPARATOR)[0]
+
+
+def _write_json(path: Path, data: dict[str, Any]) -> None:
+    """Write a JSON file under a temporary name and rename it, so readers never see it partially written."""
+    tmp_path = path.with_name(f".{path.stem}.tmp")
+    with open(tmp_path, "w", encoding="utf_8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    tmp_path.rename(path)
+
+
+def claim_next(spool: Path) -> tuple[Path, dict[str, Any]] | None:
+    """Claim the oldest queued job, or return None if there is none.
+
+    The claim is renamed to `running/<job_id>@<host>@<pid>.json`, so that the
+    owner of a claim is known without a separate, non-atomic write.
+    """
+    for path in sorted(spool.joinpath("incoming").glob("*.json")):
+        claimed = spool.joinpath("running", f"{path.stem}{OWNER_SEPARATOR}{_owner()}.json")
+        try:
+            path.rename(claimed)
+        except FileNotFoundError:
+            continue  # claimed by another worker
+        with open(claimed, encoding="utf_8") as f:
+            return claimed, json.load(f)
+    return None
+
+
+def owner_alive(claim: Path) -> bool:
+    """Return False if the worker that claimed the job is known to be gone.
+
+    Claims of other hosts cannot be checked and count as alive. A claim of
+    this process can only be left over from an earlier process with the same
+    pid, e.g. pid 1 of a restarted container, since a worker holds no claim
+    while it checks.
+    A claim without an owner (made by an older worker) counts as gone.
+    """
+    try:
+        _, host, pid = claim.stem.split(OWNER_SEPARATOR)
+    except ValueError:
+        return False
+    if host != socket.gethostname():
+        return True
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # running as another user
+    return True
+
+
+def recover_stale_claims(spool: Path) -> int:
+    """Queue the jobs of dead workers again, or report them as failed after `MAX_ATTEMPTS` claims.
+
+    Args:
+        spool (Path): spool directory.
+
+    Returns:
+        int: number of recovered claims.
+
+    """
+    recovered = 0
+    for claim in sorted(spool.joinpath("running").glob("*.json")):
+        if owner_alive(claim):
+            continue
+        job_id = _job_id(claim)
+        # Move the claim out of the way first, so that workers starting at the same time recover it only once.
+        recovering = claim.with_name(f".{job_id}.{uuid.uuid4().hex[:8]}.recovering")
+        try:
+            claim.rename(recovering)
+        except FileNotFoundError:
+            continue
+        with open(recovering, encoding="utf_8") as f:
+            job = json.load(f)
+        job["attempts"] = job.get("attempts", 0) + 1
+        if job["attempts"] >= MAX_ATTEMPTS:
+            err_msg = f"Worker died while processing the job ({job['attempts']} attempts)"
+            _write_json(spool.joinpath("done", f"{job_id}.json"), {**job, "status": "failed", "result": None, "error": err_msg})
+        else:
+            _write_json(spool.joinpath("incoming", f"{job_id}.json"), job)
+        recovering.unlink()
+        recovered += 1
+    return recovered
+
+
+def serve(
+    spool: Path,
+    *,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    recovery_interval: float = RECOVERY_INTERVAL,
+    once: bool = False,
+) -> int:
+    """Process jobs from the spool directory until interrupted.
+
+    Args:
+        spool (Path): spool directory.
+        poll_interval (float): seconds to sleep when no job is queued.
+        recovery_interval (float): seconds between checks for claims of dead workers.
+        once (bool): return when the queue is empty instead of waiting for new jobs.
+
+    Returns:
+        int: number of processed jobs.
+
+    """
+    init_spool(spool)
+    warm_up_worker()
+    processed = 0
+    next_recovery = 0.0
+    while True:
+        if time.monotonic() >= next_recovery:
+            recover_stale_claims(spool)
+            next_recovery = time.monotonic() + recovery_interval
+        claimed = claim_next(spool)
+        if claimed is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        running_path, job = claimed
+        record = run_job(job)
+        _write_json(spool.joinpath("done", f"{_job_id(running_path)}.json"), record)
+        running_path.unlink()
+        processed += 1
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Long-lived worker for the VSM structuring process.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="process jobs from a spool directory")
+    serve_parser.add_argument("--spool", type=Path, required=True)
+    serve_parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL)
+    serve_parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+
+    submit_parser = subparsers.add_parser("submit", help="queue a job")
+    submit_parser.add_argument("--spool", type=Path, required=True)
+    submit_parser.add_argument("--input-dir", type=Path, required=True)
+    submit_parser.add_argument("--output-dir", type=Path, default=None)
+    submit_parser.add_argument("--wait", action="store_true", help="wait for the job and print its result")
+    submit_parser.add_argument("--timeout", type=float, default=None)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.spool, poll_interval=args.poll_interval, once=args.once)
+        return
+
+    job_id = submit_job(args.spool, args.input_dir, args.output_dir)
+    if not args.wait:
+        sys.stdout.write(f"{job_id}\n")
+        return
+    record = wait_for_result(args.spool, job_id, args.timeout)
+    sys.stdout.write(json.dumps(record, indent=4, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
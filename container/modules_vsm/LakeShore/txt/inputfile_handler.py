@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import contextlib
 import re
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from typing import TextIO
 
 import pandas as pd
 from rdetoolkit.models.rde2types import MetaType, RdeOutputResourcePath
 from rdetoolkit.rde2util import CharDecEncoding
 
 from modules_vsm.inputfile_handler import FileReader as txtFileReader
+from modules_vsm.inputfile_handler import detect_encoding_from_head
+from modules_vsm.parsed_cache import cached_parse
+from modules_vsm.timing import span
 
 
 class FileReader(txtFileReader):
@@ -31,6 +37,45 @@ class FileReader(txtFileReader):
 
     """
 
+    data_separator = r"\s+"
+
+    def _read_header(self, f: TextIO) -> tuple[MetaType, int | None]:
+        """Read the metadata lines up to the ***DATA*** line.
+
+        Args:
+            f (TextIO): raw file opened in text mode.
+
+        Returns:
+            tuple[MetaType, int | None]: metadata, and the number of lines to skip before
+                the column header of the measurement data, or None if no data section was found.
+
+        """
+        meta: MetaType = {}
+        skiprows: int = 0
+        for lines in f:
+            tokens = re.split(": {1,}| {2,}|\t", lines)
+            tokens = [tok.strip() for tok in tokens]
+            if len(tokens) == 0 or tokens[0].startswith(";"):
+                continue
+            if tokens[0].startswith(("***", "H ")):
+                if tokens[0] == "***DATA***":
+                    return meta, skiprows + 1
+                continue
+            meta_key: None | str = None
+            for token in tokens:
+                if token and meta_key is None:
+                    meta_key = token
+                elif meta_key is not None:
+                    # 値をすべてstrとして扱うが必要ならここで変換を追加可能
+                    meta[meta_key] = token
+                    meta_key = None
+                elif token in ("***DATA***", "H [kOe]"):
+                    break
+            skiprows += 1
+
+        return meta, None
+
+    @cached_parse
     def _read_raw_data(self, raw_file_path: Path) -> tuple[MetaType, pd.DataFrame]:
         """Read raw file.
 
@@ -41,36 +86,40 @@ class FileReader(txtFileReader):
             tuple[MetaType, pd.DataFrame]: metadata and measurement data
 
         """
-        meta: MetaType = {}
         df_data: pd.DataFrame = pd.DataFrame()
 
-        enc = CharDecEncoding.detect_text_file_encoding(raw_file_path)
+        with span("detect_encoding"):
+            enc = CharDecEncoding.detect_text_file_encoding(raw_file_path)
         with open(raw_file_path, encoding=enc) as f:
-            skiprows: int = 0
-            for lines in f.readlines():
-                tokens = re.split(": {1,}| {2,}|\t", lines)
-                tokens = [tok.strip() for tok in tokens]
-                if len(tokens) == 0 or tokens[0].startswith(";"):
-                    continue
-                if tokens[0].startswith(("***", "H ")):
-                    if tokens[0] == "***DATA***":
-                        df_data = pd.read_csv(raw_file_path, skiprows=skiprows + 1, delim_whitespace=True)
-                        break
-                    continue
-                meta_key: None | str = None
-                for token in tokens:
-                    if token and meta_key is None:
-                        meta_key = token
-                    elif meta_key is not None:
-                        # 値をすべてstrとして扱うが必要ならここで変換を追加可能
-                        meta[meta_key] = token
-                        meta_key = None
-                    elif token in ("***DATA***", "H [kOe]"):
-                        break
-                skiprows += 1
+            meta, skiprows = self._read_header(f)
+        if skiprows is not None:
+            with span("parse") as timed:
+                df_data = pd.read_csv(raw_file_path, skiprows=skiprows, delim_whitespace=True)
+                if timed is not None:
+                    timed.rows = len(df_data)
 
         return meta, df_data
 
+    @contextlib.contextmanager
+    def _open_chunks(self, raw_file_path: Path, chunk_rows: int) -> Iterator[tuple[MetaType, Iterable[pd.DataFrame]]]:
+        enc = detect_encoding_from_head(raw_file_path)
+        with open(raw_file_path, encoding=enc) as f:
+            meta, skiprows = self._read_header(f)
+        if skiprows is None:
+            error_msg = f"Failed to read data from {raw_file_path}"
+            raise ValueError(error_msg)
+        with pd.read_csv(raw_file_path, skiprows=skiprows, delim_whitespace=True, encoding=enc, chunksize=chunk_rows) as chunks:
+            yield meta, chunks
+
+    def _resolve_rawfile(self, resource_paths: RdeOutputResourcePath, is_filename_mapping_rule: bool) -> tuple[Path, None]:
+        raw_file = resource_paths.rawfiles[0]
+
+        error_msg = "Invalid file extension. Only .txt files are allowed."
+        if raw_file.suffix.lower() != ".txt":
+            raise ValueError(error_msg)
+
+        return raw_file, None
+
     def read(
         self,
         resource_paths: RdeOutputResourcePath,
@@ -87,14 +136,8 @@ class FileReader(txtFileReader):
                 Metadata, measurement data, and optional fname_token .
 
         """
-        raw_file = resource_paths.rawfiles[0]
-
-        error_msg = "Invalid file extension. Only .txt files are allowed."
-        if raw_file.suffix.lower() != ".txt":
-            raise ValueError(error_msg)
-
+        raw_file, fname_token = self._resolve_rawfile(resource_paths, is_filename_mapping_rule)
         meta, df_data = self._read_raw_data(raw_file)
-        fname_token: list[str] | None = None
 
         return meta, df_data, fname_token
 
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
+import contextlib
 import csv
 import os
 import re
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from typing import TextIO
 
 import chardet
 import pandas as pd
 from rdetoolkit.models.rde2types import MetaType, RdeOutputResourcePath
 
 from modules_vsm.inputfile_handler import FileReader as vsmFileReader
+from modules_vsm.inputfile_handler import detect_encoding_from_head
+from modules_vsm.parsed_cache import cached_parse
+from modules_vsm.timing import span
 
 
 class FileReader(vsmFileReader):
@@ -33,6 +39,35 @@ class FileReader(vsmFileReader):
 
     """
 
+    def _read_header(self, f: TextIO) -> tuple[MetaType, list[str] | None]:
+        """Read the metadata lines up to the column header of the measurement data.
+
+        Args:
+            f (TextIO): raw file opened in text mode.
+
+        Returns:
+            tuple[MetaType, list[str] | None]: metadata, and the column names of the
+                measurement data or None if no data section was found.
+
+        """
+        meta: MetaType = {}
+
+        _header_with_date = ["DATE", "H(Oe)", "M(emu)", "Angle(degree)"]
+        _header = ["H(Oe)", "M(emu)", "Angle(degree)"]
+
+        for tokens in csv.reader(f):
+            stripped_tokens = [tok.strip() for tok in tokens]
+            if not stripped_tokens:
+                continue
+            if stripped_tokens[0].startswith("DATE"):
+                return meta, _header_with_date
+            if stripped_tokens[0].startswith("H(Oe)"):
+                return meta, _header
+            meta[stripped_tokens[0].replace("=", "")] = stripped_tokens[1:]
+
+        return meta, None
+
+    @cached_parse
     def _read_raw_data(self, raw_file_path: Path) -> tuple[MetaType, pd.DataFrame]:
         """Read raw VSM data file and extract metadata and measurement DataFrame.
 
@@ -43,32 +78,56 @@ class FileReader(vsmFileReader):
             Tuple[MetaType, pd.DataFrame]: Parsed metadata and measurement data.
 
         """
-        meta: MetaType = {}
         df_data: pd.DataFrame = pd.DataFrame()
 
-        _header_with_date = ["DATE", "H(Oe)", "M(emu)", "Angle(degree)"]
-        _header = ["H(Oe)", "M(emu)", "Angle(degree)"]
-
         # エンコーディングを検出
-        with open(raw_file_path, "rb") as f:
+        with span("detect_encoding"), open(raw_file_path, "rb") as f:
             enc = chardet.detect(f.read())["encoding"]
 
         # ファイルを読み込み、解析
         with open(raw_file_path, encoding=enc) as f:
-            for tokens in csv.reader(f):
-                stripped_tokens = [tok.strip() for tok in tokens]
-                if not stripped_tokens:
-                    continue
-                if stripped_tokens[0].startswith("DATE"):
-                    df_data = pd.read_csv(f, header=None, names=_header_with_date)
-                    break
-                if stripped_tokens[0].startswith("H(Oe)"):
-                    df_data = pd.read_csv(f, header=None, names=_header)
-                    break
-                meta[stripped_tokens[0].replace("=", "")] = stripped_tokens[1:]
+            meta, names = self._read_header(f)
+            if names is not None:
+                with span("parse") as timed:
+                    df_data = pd.read_csv(f, header=None, names=names)
+                    if timed is not None:
+                        timed.rows = len(df_data)
 
         return meta, df_data
 
+    @contextlib.contextmanager
+    def _open_chunks(self, raw_file_path: Path, chunk_rows: int) -> Iterator[tuple[MetaType, Iterable[pd.DataFrame]]]:
+        with open(raw_file_path, encoding=detect_encoding_from_head(raw_file_path)) as f:
+            meta, names = self._read_header(f)
+            if names is None:
+                error_msg = f"Failed to read data from {raw_file_path}"
+                raise ValueError(error_msg)
+            with pd.read_csv(f, header=None, names=names, chunksize=chunk_rows) as chunks:
+                yield meta, chunks
+
+    def _resolve_rawfile(self, resource_paths: RdeOutputResourcePath, is_filename_mapping_rule: bool) -> tuple[Path, list[str] | None]:
+        filename_token_min_length = 4
+        fname_token: list[str] | None = None
+
+        candidate_rawfile = resource_paths.rawfiles[0]
+        if is_filename_mapping_rule:
+            if candidate_rawfile.suffix.lower() != ".vsm":
+                error_msg = "Invalid file extension. Only .vsm files are allowed."
+                raise ValueError(error_msg)
+
+            src_base_name = os.path.basename(candidate_rawfile)
+            fname_token = [tok.strip() for tok in src_base_name.split("_", filename_token_min_length)]
+            if len(fname_token) < filename_token_min_length:
+                error_msg = f'Unknown filename pattern("{src_base_name}")'
+                raise ValueError(error_msg)
+
+            preparation_date = re.search(r'(19|20)\d{6}', fname_token[1])
+            if preparation_date is None:
+                error_msg = f'Unknown filename pattern("{src_base_name}")'
+                raise ValueError(error_msg)
+
+        return candidate_rawfile, fname_token
+
     def read(
         self,
         resource_paths: RdeOutputResourcePath,
@@ -87,28 +146,8 @@ class FileReader(vsmFileReader):
                 - fname_token (list[str] | None): parsed filename tokens, if applicable
 
         """
-        filename_token_min_length = 4
-        fname_token: list[str] | None = None
-
-        for candidate_rawfile in resource_paths.rawfiles:
-            if is_filename_mapping_rule:
-                if candidate_rawfile.suffix.lower() != ".vsm":
-                    error_msg = "Invalid file extension. Only .vsm files are allowed."
-                    raise ValueError(error_msg)
-
-                src_base_name = os.path.basename(candidate_rawfile)
-                fname_token = [tok.strip() for tok in src_base_name.split("_", filename_token_min_length)]
-                if len(fname_token) < filename_token_min_length:
-                    error_msg = f'Unknown filename pattern("{src_base_name}")'
-                    raise ValueError(error_msg)
-
-                preparation_date = re.search(r'(19|20)\d{6}', fname_token[1])
-                if preparation_date is None:
-                    error_msg = f'Unknown filename pattern("{src_base_name}")'
-                    raise ValueError(error_msg)
-
-            meta, df_data = self._read_raw_data(candidate_rawfile)
-            break
+        raw_file, fname_token = self._resolve_rawfile(resource_paths, is_filename_mapping_rule)
+        meta, df_data = self._read_raw_data(raw_file)
 
         return meta, df_data, fname_token
 
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+
+from modules_vsm.structured_handler import HIGH_FIELD_PERCENT, StructuredDataProcesser
+
+_processer = StructuredDataProcesser()
+
+
+@dataclass(frozen=True)
+class AnalysisOptions:
+    """Options of the analysis; the defaults are those of the pipeline.
+
+    Attributes:
+        spike_removal (bool): remove spikes with the Hampel filter and subtract the
+            linear background (invoice `spike_removal`).
+        threshold_percent (float): points above this percentage of the maximum field
+            are fitted for the background slope and Bs.
+        sample_size (tuple[float, ...]): height, width and thickness (mm) for the values
+            per volume, or height and width for Brt; empty for none.
+        correction_factor (float): factor of the corrected values per volume
+            (invoice `correction_factor`).
+
+    """
+
+    spike_removal: bool = False
+    threshold_percent: float = HIGH_FIELD_PERCENT
+    sample_size: tuple[float, ...] = ()
+    correction_factor: float = 1.0
+
+
+@dataclass(frozen=True)
+class AnalysisResult:
+    """Corrected curve and characteristic values of one magnetization curve.
+
+    Attributes:
+        field (np.ndarray): magnetic field (T) of the points kept after spike removal.
+        moment (np.ndarray): measured moment (emu) of these points.
+        background (np.ndarray): linear background (emu) of these points.
+        corrected_moment (np.ndarray): moment after the background correction (emu);
+            equals `moment` without spike removal.
+        hc (float): coercive force (T).
+        br (float): remanence (emu).
+        bs (float): saturation estimated from the high-field fit (emu).
+        ms (float): mean of the absolute maximum and minimum moment (emu).
+        physical_properties (dict[str, float]): values per volume or area, see
+            `StructuredDataProcesser.physical_property_values`.
+
+    """
+
+    field: np.ndarray
+    moment: np.ndarray
+    background: np.ndarray
+    corrected_moment: np.ndarray
+    hc: float
+    br: float
+    bs: float
+    ms: float
+    physical_properties: dict[str, float]
+
+    def characteristic_values(self) -> dict[str, float]:
+        """Return Hc, Br, Bs, Ms and the physical properties, as written to the param CSV (Hc as absolute value)."""
+        return {"Hc": abs(self.hc), "Br": self.br, "Ms": self.ms, "Bs": self.bs, **self.physical_properties}
+
+
+def analyze_curve(field: ArrayLike, moment: ArrayLike, options: AnalysisOptions | None = None) -> AnalysisResult:
+    """Analyze one magnetization curve without reading or writing files.
+
+    This is the analysis of the structuring pipeline (`StructuredDataProcesser.fit_curve`
+    and `physical_property_values`) for arrays, e.g. for a service or a notebook. The
+    values equal those of the param and graph CSVs for the same data and invoice options.
+
+    Args:
+        field (ArrayLike): magnetic field (Oe) in measurement order.
+        moment (ArrayLike): moment (emu), same length.
+        options (AnalysisOptions | None): analysis options, defaults if None.
+
+    Returns:
+        AnalysisResult: corrected curve and characteristic values.
+
+    Raises:
+        ValueError: If the arrays are empty, of different length, or have no points
+            in the high-field range.
+
+    Example:
+        options = AnalysisOptions(spike_removal=True, sample_size=(5.0, 5.0, 0.1))
+        result = analyze_curve(field_oe, moment_emu, options)
+        result.hc, result.br, result.physical_properties["Br_per_volume"]
+
+    """
+    options = options or AnalysisOptions()
+    x = np.asarray(field, dtype=float)
+    y = np.asarray(moment, dtype=float)
+    if x.ndim != 1 or x.shape != y.shape:
+        err_msg = f"field and moment must be 1-D arrays of the same length, got shapes {x.shape} and {y.shape}"
+        raise ValueError(err_msg)
+
+    df_fit, characteristic_values = _processer.fit_curve(
+        pd.DataFrame({"x": x}),
+        pd.DataFrame({"y": y}),
+        spike_removal=options.spike_removal,
+        percent=options.threshold_percent,
+    )
+    physical_properties = _processer.physical_property_values(list(options.sample_size), characteristic_values, options.correction_factor)
+    return AnalysisResult(
+        field=df_fit["x"].to_numpy(),
+        moment=df_fit["y"].to_numpy(),
+        background=df_fit["Background"].to_numpy(),
+        corrected_moment=df_fit["RM"].to_numpy(),
+        hc=float(characteristic_values["Hc"].iloc[-1]),
+        br=float(characteristic_values["Br"].iloc[-1]),
+        bs=float(characteristic_values["Bs"].iloc[-1]),
+        ms=float(characteristic_values["Ms"].iloc[-1]),
+        physical_properties=physical_properties,
+    )
+
+
+def analyze_curves(
+    curves: Iterable[tuple[ArrayLike, ArrayLike]],
+    options: AnalysisOptions | Sequence[AnalysisOptions] | None = None,
+    *,
+    return_exceptions: bool = False,
+) -> list[AnalysisResult | Exception]:
+    """Analyze a batch of magnetization curves.
+
+    Args:
+        curves (Iterable[tuple[ArrayLike, ArrayLike]]): (field, moment) pairs; a 2-D
+            field array and a 2-D moment array can be passed as `zip(fields, moments)`.
+        options (AnalysisOptions | Sequence[AnalysisOptions] | None): options for all
+            curves, or one per curve.
+        return_exceptions (bool): return the exception of a curve that cannot be
+            analyzed in its place, instead of raising it.
+
+    Returns:
+        list[AnalysisResult | Exception]: one result per curve, in order.
+
+    """
+    curves = list(curves)
+    if options is None or isinstance(options, AnalysisOptions):
+        per_curve = [options] * len(curves)
+    else:
+        per_curve = list(options)
+        if len(per_curve) != len(curves):
+            err_msg = f"Got {len(per_curve)} options for {len(curves)} curves"
+            raise ValueError(err_msg)
+
+    results: list[AnalysisResult | Exception] = []
+    for (x, y), curve_options in zip(curves, per_curve, strict=True):
+        try:
+            results.append(analyze_curve(x, y, curve_options))
+        except Exception as exc:
+            if not return_exceptions:
+                raise
+            results.append(exc)
+    return results
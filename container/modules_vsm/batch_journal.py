@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections.abc import Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+from modules_vsm.manifest import HASH_CHUNK_SIZE
+
+JOURNAL_FORMAT = "vsm-batch-journal/1"
+
+
+def hash_inputs(paths: Iterable[Path]) -> str:
+    """Return a SHA-256 over the names and contents of the input files of a tile.
+
+    Args:
+        paths (Iterable[Path]): input files; a directory stands for all files below it.
+
+    Returns:
+        str: hex digest.
+
+    """
+    sha256 = hashlib.sha256()
+    for path in paths:
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        for file in files:
+            sha256.update(str(file).encode("utf_8") + b"\0")
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+            sha256.update(b"\0")
+    return sha256.hexdigest()
+
+
+def outputs_intact(files: list[dict[str, Any]]) -> bool:
+    """Return True if every manifest entry still exists with its recorded size and modification time."""
+    for entry in files:
+        path = Path(entry["path"])
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return False
+        if stat.st_size != entry["bytes"] or stat.st_mtime_ns != entry.get("mtime_ns"):
+            return False
+    return True
+
+
+class BatchJournal:
+    """Append-only journal of the tiles a batch run has completed.
+
+    Each completed tile appends one JSON line with the hash of its inputs, its
+    workflow status and the files of its output manifest. Lines are flushed and
+    fsynced before the next tile is reported, so the journal survives a crash
+    of the batch driver or of the node; a line cut short by a crash is ignored
+    when the journal is loaded. A restarted batch skips the tiles whose entry
+    matches the current inputs and whose outputs are unchanged, and runs all
+    others again.
+
+    Args:
+        path (Path): journal file, created on the first entry.
+
+    Example:
+        journal = BatchJournal(Path("data/logs/batch_journal.jsonl"))
+        entry = journal.completed(idx, input_sha256)
+        if entry is None:
+            ...  # process the tile
+            journal.append(idx, input_sha256, status, manifest_files)
+
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._entries: dict[int, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, encoding="utf_8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("format") == JOURNAL_FORMAT:
+                    self._entries[entry["tile"]] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def completed(self, tile: int, input_sha256: str) -> dict[str, Any] | None:
+        """Return the entry of a tile if it was completed with the same inputs and its outputs are intact."""
+        entry = self._entries.get(tile)
+        if entry is None or entry["input_sha256"] != input_sha256:
+            return None
+        if not outputs_intact(entry["files"]):
+            return None
+        return entry
+
+    def append(self, tile: int, input_sha256: str, status: dict[str, Any], files: list[dict[str, Any]]) -> None:
+        """Durably record a completed tile.
+
+        Args:
+            tile (int): tile index.
+            input_sha256 (str): hash of the inputs, see `hash_inputs`.
+            status (dict[str, Any]): workflow status of the tile.
+            files (list[dict[str, Any]]): entries of the tile's output manifest.
+
+        """
+        entry = {
+            "format": JOURNAL_FORMAT,
+            "tile": tile,
+            "input_sha256": input_sha256,
+            "completed": datetime.now(UTC).isoformat(),
+            "status": status,
+            "files": files,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf_8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries[tile] = entry
+
+    def clear(self) -> None:
+        """Forget all entries and delete the journal file."""
+        with self._lock:
+            self._entries.clear()
+            self.path.unlink(missing_ok=True)
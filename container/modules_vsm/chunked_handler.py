@@ -0,0 +1,448 @@
+from __future__ import annotations
+
+import contextlib
+import math
+import tempfile
+from collections.abc import Generator, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, BinaryIO
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from rdetoolkit.models.rde2types import RdeOutputResourcePath
+
+from modules_vsm.live_handler import HAMPEL_SCALE, HAMPEL_THRESHOLD, HAMPEL_WINDOW, HIGH_FIELD_RATIO, OE_PER_TESLA
+from modules_vsm.manifest import current_stage, open_output
+
+if TYPE_CHECKING:
+    from modules_vsm.factory import VsmFactory
+
+FLOAT64_BYTES = 8
+# Stages whose files are written block by block by the chunked analysis.
+CHUNKED_STAGES = ("raw_csv", "graph_csv")
+# Stages that need the full curve in memory and are not run in chunked mode.
+UNSUPPORTED_STAGES = ("plot_data_pyramid",)
+
+
+@contextlib.contextmanager
+def _stage(name: str) -> Generator[None, None, None]:
+    """Record the files written in the block under the given stage in the manifest."""
+    token = current_stage.set(name)
+    try:
+        yield
+    finally:
+        current_stage.reset(token)
+
+
+class SpilledColumn:
+    """A float64 column stored in a file and read back one block at a time.
+
+    `integral` tells whether every block was read as an integer column, so
+    that the column can be written like the reader's dtype of the whole file.
+    """
+
+    def __init__(self, path: Path, rows: int, *, integral: bool = False):
+        self.path = path
+        self.rows = rows
+        self.integral = integral
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Return rows start to stop - 1 as a new array."""
+        start, stop = max(0, start), min(self.rows, stop)
+        if stop <= start:
+            return np.empty(0, dtype=np.float64)
+        return np.fromfile(self.path, dtype=np.float64, count=stop - start, offset=start * FLOAT64_BYTES)
+
+
+class ColumnSpill:
+    """Float64 columns written block by block to temporary files.
+
+    Args:
+        directory (Path): directory of the column files.
+
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.rows: dict[str, int] = {}
+        self.integral: dict[str, bool] = {}
+        self._files: dict[str, BinaryIO] = {}
+
+    def append(self, name: str, values: np.ndarray) -> None:
+        """Append a block of values to a column; the values are stored as float64 whatever their dtype."""
+        if name not in self._files:
+            self._files[name] = open(self.directory.joinpath(f"{name}.f8"), "wb")  # noqa: SIM115
+            self.rows[name] = 0
+            self.integral[name] = True
+        self._files[name].write(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        self.rows[name] += len(values)
+        self.integral[name] = self.integral[name] and np.issubdtype(values.dtype, np.integer)
+
+    def column(self, name: str) -> SpilledColumn:
+        """Return a column for reading."""
+        self._files[name].flush()
+        return SpilledColumn(self.directory.joinpath(f"{name}.f8"), self.rows[name], integral=self.integral[name])
+
+    def close(self) -> None:
+        """Close the column files."""
+        for f in self._files.values():
+            f.close()
+
+
+class FitMoments:
+    """Sufficient statistics of a simple linear regression, merged block by block.
+
+    The slope equals that of `LinearRegression` up to rounding, not bit for bit.
+    """
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.m2_x = 0.0
+        self.c_xy = 0.0
+
+    def add_block(self, x: np.ndarray, y: np.ndarray) -> None:
+        """Merge the statistics of a block of points (pairwise update of means and co-moments)."""
+        n_b = len(x)
+        if n_b == 0:
+            return
+        mean_x_b = float(np.mean(x))
+        mean_y_b = float(np.mean(y))
+        m2_x_b = float(np.sum((x - mean_x_b) ** 2))
+        c_xy_b = float(np.sum((x - mean_x_b) * (y - mean_y_b)))
+        n = self.n + n_b
+        delta_x = mean_x_b - self.mean_x
+        delta_y = mean_y_b - self.mean_y
+        weight = self.n * n_b / n
+        self.mean_x += delta_x * n_b / n
+        self.mean_y += delta_y * n_b / n
+        self.m2_x += m2_x_b + delta_x * delta_x * weight
+        self.c_xy += c_xy_b + delta_x * delta_y * weight
+        self.n = n
+
+    def slope_intercept(self) -> tuple[float, float]:
+        """Return the least-squares slope and intercept."""
+        slope = self.c_xy / self.m2_x if self.m2_x > 0 else 0.0
+        return slope, self.mean_y - slope * self.mean_x
+
+
+class ZeroCrossing:
+    """First sign change of a sequence that arrives in blocks, relative to the sign of its first value."""
+
+    def __init__(self) -> None:
+        self.sign: float | None = None
+        self.previous: tuple[float, float] | None = None
+        self.points: tuple[tuple[float, float], tuple[float, float]] | None = None
+
+    def add_block(self, key: np.ndarray, x: np.ndarray, y: np.ndarray) -> None:
+        """Search a block; `key` is the sequence whose sign is followed, (x, y) the points of the line through the change."""
+        if self.points is not None or len(key) == 0:
+            return
+        if self.sign is None:
+            self.sign = float(np.sign(key[0]))
+        changed = np.flatnonzero(np.sign(key) != self.sign)
+        if changed.size:
+            i = int(changed[0])
+            # The point before the change may be the last point of the previous block.
+            before = (float(x[i - 1]), float(y[i - 1])) if i > 0 else self.previous
+            if before is not None:
+                self.points = (before, (float(x[i]), float(y[i])))
+                return
+        self.previous = (float(x[-1]), float(y[-1]))
+
+    def line(self) -> tuple[float, float]:
+        """Return the slope and intercept of the line through the points around the sign change."""
+        if self.points is None:
+            err_msg = "No sign change found in the measurement data."
+            raise ValueError(err_msg)
+        (x0, y0), (x1, y1) = self.points
+        a = (y0 - y1) / (x0 - x1)
+        return a, y0 - a * x0
+
+
+def _restore_dtype(column: SpilledColumn, values: np.ndarray) -> np.ndarray:
+    return values.astype(np.int64) if column.integral else values
+
+
+def hampel_outliers(values: SpilledColumn, start: int, stop: int) -> np.ndarray:
+    """Return the Hampel outlier flags of rows start to stop - 1.
+
+    The block is read with a halo of `HAMPEL_WINDOW` values on each side, so
+    the result equals `StructuredDataProcesser.hampel` on the whole column.
+    """
+    n = len(values)
+    k = HAMPEL_WINDOW
+    lo = max(0, start - k)
+    halo = values.read(lo, stop + k)
+    rows = np.arange(start, stop)
+    medians = np.empty(len(rows))
+    mads = np.empty(len(rows))
+
+    # Rows whose window lies inside the file use a full window of 2k + 1 values.
+    full = (rows >= k) & (rows <= n - 1 - k)
+    if full.any():
+        windows = sliding_window_view(halo, 2 * k + 1)[rows[full] - k - lo]
+        medians[full] = np.median(windows, axis=1)
+        mads[full] = np.median(np.abs(windows - medians[full, None]), axis=1)
+    # Windows at the start and end of the file are cut off.
+    for j in np.flatnonzero(~full):
+        kernel = halo[max(0, rows[j] - k) - lo: min(n - 1, rows[j] + k) + 1 - lo]
+        medians[j] = np.median(kernel)
+        mads[j] = np.median(np.abs(kernel - medians[j]))
+
+    block = halo[start - lo: stop - lo]
+    outliers: np.ndarray = np.abs(block - medians) > HAMPEL_THRESHOLD * (HAMPEL_SCALE * mads)
+    return outliers
+
+
+class ChunkedAnalyzer:
+    """Out-of-core variant of the analysis for measurement files too large to hold in memory.
+
+    The input file is read in blocks of `chunk_rows` rows. The field and moment
+    columns are spilled to temporary float64 files, which the following passes
+    read back one block at a time:
+
+    1. parse the file, spill the columns and find the moment column (the last row, as in `analyze`);
+    2. write the raw CSV, apply the Hampel filter with overlapping halos and find the field and moment extremes;
+    3. accumulate the high-field linear fit as merged sufficient statistics;
+    4. apply the background correction, write the graph CSV and find the zero crossings
+       of the field and the corrected moment across block boundaries.
+
+    Peak memory depends on `chunk_rows` and `chunked_preview_points`, not on the
+    file length. The raw CSV and the field of the graph CSV equal those of
+    `StructuredDataProcesser.analyze`. The slope of the merged fit is summed in a
+    different order than the least-squares fit of the whole selection, so it can
+    differ in the last bits; the corrected moment of the graph CSV and Hc and Br
+    then differ by about 1e-15 of the largest moment, which the three significant
+    digits of the param CSV and the metadata do not show. The curves returned for
+    the graphs are thinned to at most `chunked_preview_points` points.
+
+    Example:
+        chunked = ChunkedAnalyzer(config)
+        values = chunked.analyze(
+            module,
+            resource_paths,
+            is_filename_mapping_rule=is_filename_mapping_rule,
+            invoice_obj=invoice_obj,
+            csv_path_raw=csv_path_raw,
+            csv_path_graph=csv_path_graph,
+        )
+
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config: dict = config
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether chunked processing is enabled in rdeconfig.yaml."""
+        return bool(self.config['vsm'].get('chunked_processing', False))
+
+    @property
+    def chunk_rows(self) -> int:
+        """Return the number of rows per block."""
+        return max(1, int(self.config['vsm'].get('chunk_rows', 100_000)))
+
+    @property
+    def preview_points(self) -> int:
+        """Return the maximum number of points of the curves used for the graphs."""
+        return max(2, int(self.config['vsm'].get('chunked_preview_points', 20_000)))
+
+    @property
+    def spill_dir(self) -> str | None:
+        """Return the directory of the temporary column files (default: the system temporary directory)."""
+        spill_dir = self.config['vsm'].get('chunk_spill_dir')
+        return str(spill_dir) if spill_dir else None
+
+    def _blocks(self, length: int) -> Iterator[tuple[int, int]]:
+        for start in range(0, length, self.chunk_rows):
+            yield start, min(length, start + self.chunk_rows)
+
+    def analyze(
+        self,
+        module: VsmFactory,
+        resource_paths: RdeOutputResourcePath,
+        *,
+        is_filename_mapping_rule: bool,
+        invoice_obj: dict,
+        csv_path_raw: Path,
+        csv_path_graph: Path,
+    ) -> dict[str, Any]:
+        """Analyze the input file block by block and write the raw and graph CSVs.
+
+        Args:
+            module (VsmFactory): handler objects.
+            resource_paths (RdeOutputResourcePath): resource paths.
+            is_filename_mapping_rule (bool): filename mapping rule.
+            invoice_obj (dict): invoice data.
+            csv_path_raw (Path): path of the raw CSV.
+            csv_path_graph (Path): path of the graph CSV.
+
+        Returns:
+            dict[str, Any]: the pipeline values meta, fname_token, columns, df_data,
+                fit_data, characteristic_values, moment_flag and physical_props.
+                df_data and fit_data are thinned for the graphs.
+
+        """
+        spike_removal = bool(invoice_obj["custom"].get("spike_removal", False))
+        with tempfile.TemporaryDirectory(prefix="vsm-chunks-", dir=self.spill_dir) as tmp_dir:
+            spill = ColumnSpill(Path(tmp_dir))
+            try:
+                meta, fname_token, columns, moment_flag = self._spill_columns(module, resource_paths, is_filename_mapping_rule, spill)
+                x_col, rm_col, dc_rm_col = columns
+                y_col = rm_col if moment_flag else dc_rm_col
+                y_name = "y_rm" if moment_flag else "y_dc"
+                if y_name not in spill.rows or spill.rows[y_name] == 0:
+                    error_msg = "no data lines"
+                    raise ValueError(error_msg)
+                x, y = spill.column("x"), spill.column(y_name)
+
+                df_data = self._write_raw_csv(csv_path_raw, x, y, x_col, y_col)
+                fx, fy, extremes = self._filter(x, y, spike_removal, spill)
+                moments = self._fit_high_field(fx, fy, extremes[0])
+                slope, bs = moments.slope_intercept()
+                fit_data, hc, br = self._write_graph_csv(csv_path_graph, fx, fy, slope, spike_removal)
+            finally:
+                spill.close()
+
+        ms = float((abs(extremes[1]) + abs(extremes[2])) / 2)
+        characteristic_values = pd.DataFrame({"Hc": [hc], "Br": [br], "Bs": [bs], "Ms": [ms]})
+        characteristic_values, physical_props = module.structured_processer.add_physical_properties(characteristic_values, meta, invoice_obj)
+        return {
+            "meta": meta,
+            "fname_token": fname_token,
+            "columns": columns,
+            "df_data": df_data,
+            "fit_data": fit_data,
+            "characteristic_values": characteristic_values,
+            "moment_flag": moment_flag,
+            "physical_props": physical_props,
+        }
+
+    def _spill_columns(
+        self,
+        module: VsmFactory,
+        resource_paths: RdeOutputResourcePath,
+        is_filename_mapping_rule: bool,
+        spill: ColumnSpill,
+    ) -> tuple[Any, list[str] | None, tuple[str | None, str | None, str | None], bool]:
+        columns: tuple[str | None, str | None, str | None] | None = None
+        last_rm = math.nan
+        with module.file_reader.read_chunks(resource_paths, is_filename_mapping_rule, self.chunk_rows) as (meta, chunks, fname_token):
+            for df_chunk in chunks:
+                if columns is None:
+                    columns = module.file_reader.identify_columns(df_chunk)
+                x_col, rm_col, dc_rm_col = columns
+                if x_col is None:
+                    error_msg = "Magnetic field column not found in the measurement data"
+                    raise ValueError(error_msg)
+                # Spilled with the dtype of the block, so that integer columns are written back as integers.
+                spill.append("x", df_chunk[x_col].to_numpy())
+                if rm_col is not None:
+                    spill.append("y_rm", df_chunk[rm_col].to_numpy())
+                    if len(df_chunk):
+                        last_rm = float(df_chunk[rm_col].iloc[-1])
+                if dc_rm_col is not None:
+                    spill.append("y_dc", df_chunk[dc_rm_col].to_numpy())
+        if columns is None:
+            error_msg = "no data lines"
+            raise ValueError(error_msg)
+        return meta, fname_token, columns, not np.isnan(last_rm)
+
+    def _stride(self, length: int) -> int:
+        return max(1, math.ceil(length / self.preview_points))
+
+    def _write_raw_csv(self, csv_path_raw: Path, x: SpilledColumn, y: SpilledColumn, x_col: str | None, y_col: str | None) -> pd.DataFrame:
+        """Write the raw CSV and return its thinned copy.
+
+        A column that was read as integers in every block is written as integers,
+        as `write_raw_csv` writes the column read from the whole file.
+        """
+        stride = self._stride(len(x))
+        preview: list[pd.DataFrame] = []
+        with _stage("raw_csv"), open_output(csv_path_raw, "w", newline="") as f:
+            for start, stop in self._blocks(len(x)):
+                df_block = pd.DataFrame({
+                    x_col: _restore_dtype(x, x.read(start, stop)),
+                    y_col: _restore_dtype(y, y.read(start, stop)),
+                })
+                df_block.to_csv(f, header=start == 0, index=False)
+                preview.append(df_block.iloc[(-start) % stride::stride])
+        return pd.concat(preview, ignore_index=True)
+
+    def _filter(self, x: SpilledColumn, y: SpilledColumn, spike_removal: bool, spill: ColumnSpill) -> tuple[SpilledColumn, SpilledColumn, tuple[float, float, float]]:
+        """Apply the spike removal and return the remaining points with the maximum field and the moment extremes."""
+        xmax, ymax, ymin = -np.inf, -np.inf, np.inf
+        for start, stop in self._blocks(len(x)):
+            bx, by = x.read(start, stop), y.read(start, stop)
+            if spike_removal:
+                keep = ~hampel_outliers(y, start, stop) & ~np.isnan(by)
+                bx, by = bx[keep], by[keep]
+                spill.append("fx", bx)
+                spill.append("fy", by)
+            if len(bx) and not np.isnan(bx).all():
+                xmax = max(xmax, float(np.nanmax(bx)))
+            if len(by) and not np.isnan(by).all():
+                ymax = max(ymax, float(np.nanmax(by)))
+                ymin = min(ymin, float(np.nanmin(by)))
+        if spike_removal:
+            x, y = spill.column("fx"), spill.column("fy")
+        return x, y, (xmax, ymax, ymin)
+
+    def _fit_high_field(self, x: SpilledColumn, y: SpilledColumn, xmax: float) -> FitMoments:
+        """Fit the descending points above `HIGH_FIELD_RATIO` of the maximum field, as `_extract_high_field_data`."""
+        moments = FitMoments()
+        previous = math.nan
+        for start, stop in self._blocks(len(x)):
+            bx, by = x.read(start, stop), y.read(start, stop)
+            diff = np.diff(bx, prepend=previous)
+            diff[np.isnan(diff)] = -1
+            selected = (bx > xmax * HIGH_FIELD_RATIO) & (diff < 0)
+            moments.add_block(bx[selected], by[selected])
+            previous = float(bx[-1])
+        if moments.n == 0:
+            err_msg = "No sample points found for linear regression (df_fit_20)."
+            raise ValueError(err_msg)
+        return moments
+
+    def _write_graph_csv(
+        self,
+        csv_path_graph: Path,
+        x: SpilledColumn,
+        y: SpilledColumn,
+        slope: float,
+        spike_removal: bool,
+    ) -> tuple[pd.DataFrame, float, float]:
+        """Write the corrected curve and return its thinned copy with Hc and Br."""
+        stride = self._stride(len(x))
+        field_crossing, moment_crossing = ZeroCrossing(), ZeroCrossing()
+        preview: list[pd.DataFrame] = []
+        with _stage("graph_csv"), open_output(csv_path_graph, "w", newline="") as f:
+            for start, stop in self._blocks(len(x)):
+                bx, by = x.read(start, stop), y.read(start, stop)
+                background = bx * slope
+                rm = by - background if spike_removal else by
+                if spike_removal:
+                    keep = ~np.isnan(rm)
+                    bx, by, background, rm = bx[keep], by[keep], background[keep], rm[keep]
+                field = bx / OE_PER_TESLA
+                pd.DataFrame({"Magnetic Field (T)": field, "Magnetization (emu)": rm}).to_csv(f, header=start == 0, index=False)
+                field_crossing.add_block(field, field, rm)
+                moment_crossing.add_block(rm, field, rm)
+                # Rows whose position in the column is a multiple of the stride.
+                offset = (-start) % stride
+                preview.append(pd.DataFrame({
+                    "x": field[offset::stride],
+                    "y": by[offset::stride],
+                    "Background": background[offset::stride],
+                    "RM": rm[offset::stride],
+                }))
+
+        br = field_crossing.line()[1]
+        a, b = moment_crossing.line()
+        return pd.concat(preview, ignore_index=True), -b / a, br
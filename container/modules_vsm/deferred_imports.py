@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import functools
+import importlib
+from typing import TYPE_CHECKING, cast
+
+if TYPE_CHECKING:
+    from types import ModuleType
+
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+    from sklearn.linear_model import LinearRegression
+
+# Non-interactive backend; figures are only written to files, also from stage threads and worker processes.
+MATPLOTLIB_BACKEND = "Agg"
+
+
+@functools.cache
+def load_matplotlib() -> ModuleType:
+    """Import matplotlib with the Agg backend at first use.
+
+    matplotlib and its font cache take a noticeable part of the start-up time,
+    so it is only imported by the stages that draw graphs. Tiles that are
+    rejected before plotting, or runs without graph outputs, do not load it.
+
+    Returns:
+        ModuleType: the `matplotlib` module.
+
+    """
+    matplotlib = importlib.import_module("matplotlib")
+    matplotlib.use(MATPLOTLIB_BACKEND)
+    importlib.import_module("matplotlib.figure")
+    importlib.import_module("matplotlib.ticker")
+    return matplotlib
+
+
+def new_figure() -> tuple[Figure, Axes]:
+    """Return a figure with one axes in the style of the VSM graphs.
+
+    The figure is created without pyplot, so that plotting is safe outside the main thread.
+    """
+    matplotlib = load_matplotlib()
+    fig = cast("Figure", matplotlib.figure.Figure())
+    ax = fig.subplots(1, 1)
+    ax.yaxis.set_major_formatter(matplotlib.ticker.ScalarFormatter(useMathText=True))
+    ax.ticklabel_format(style="sci", axis="y", scilimits=(0, 0))
+    ax.grid(ls=":")
+    return fig, ax
+
+
+def linear_regression() -> LinearRegression:
+    """Return a new scikit-learn `LinearRegression`, importing scikit-learn (and SciPy) at first use."""
+    return cast("LinearRegression", importlib.import_module("sklearn.linear_model").LinearRegression())
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import importlib
 from pathlib import Path
 from typing import Any
 
@@ -8,30 +9,29 @@ from rdetoolkit.exceptions import StructuredError
 
 from modules_vsm.graph_handler import GraphPlotter
 from modules_vsm.inputfile_handler import FileReader as VsmFileReader
-from modules_vsm.LakeShore.txt.inputfile_handler import FileReader as txtFileReader
-from modules_vsm.LakeShore.txt.meta_handler import MetaParser as txtMetaParser
 from modules_vsm.meta_handler import MetaParser as VsmMetaParser
-from modules_vsm.mpms.dat.inputfile_handler import FileReader as datFileReader
-from modules_vsm.mpms.dat.meta_handler import MetaParser as datMetaParser
+from modules_vsm.parsed_cache import ParsedInputCache
+from modules_vsm.pyramid_handler import PyramidWriter
+from modules_vsm.resample_handler import GridResampler
 from modules_vsm.structured_handler import StructuredDataProcesser
-from modules_vsm.TAMAKAWA.vsm.inputfile_handler import FileReader as vsmFileReader
-from modules_vsm.TAMAKAWA.vsm.meta_handler import MetaParser as vsmMetaParser
+from modules_vsm.tasksupport_cache import freeze, tasksupport_cache
 
+# Modules of the FileReader and MetaParser classes; only the handlers of the configured manufacturer are imported.
 MPMS_SUFFIX_CLASS_MAPPING = {
     "mpms": {
-        ".dat": (datFileReader, datMetaParser),
+        ".dat": ("modules_vsm.mpms.dat.inputfile_handler", "modules_vsm.mpms.dat.meta_handler"),
     },
 }
 
 TAMAKAWA_SUFFIX_CLASS_MAPPING = {
     "TAMAKAWA": {
-        ".vsm": (vsmFileReader, vsmMetaParser),
+        ".vsm": ("modules_vsm.TAMAKAWA.vsm.inputfile_handler", "modules_vsm.TAMAKAWA.vsm.meta_handler"),
     },
 }
 
 LakeShore_SUFFIX_CLASS_MAPPING = {
     "LakeShore": {
-        ".txt": (txtFileReader, txtMetaParser),
+        ".txt": ("modules_vsm.LakeShore.txt.inputfile_handler", "modules_vsm.LakeShore.txt.meta_handler"),
     },
 }
 
@@ -45,11 +45,16 @@ class VsmFactory:
         meta_parser: VsmMetaParser,
         graph_plotter: GraphPlotter,
         structured_processer: StructuredDataProcesser,
+        *,
+        pyramid_writer: PyramidWriter,
+        grid_resampler: GridResampler,
     ):
         self.file_reader = file_reader
         self.meta_parser = meta_parser
         self.graph_plotter = graph_plotter
         self.structured_processer = structured_processer
+        self.pyramid_writer = pyramid_writer
+        self.grid_resampler = grid_resampler
 
     @staticmethod
     def get_config(rawfile: Path, path_tasksupport: Path) -> Any:
@@ -72,14 +77,9 @@ class VsmFactory:
         if not rdeconfig_file.exists():
             err_msg = f"File not found: {rdeconfig_file}"
             raise StructuredError(err_msg)
-        try:
-            with open(rdeconfig_file) as file:
-                config = yaml.safe_load(file)
-        except Exception:
-            err_msg = f"Invalid configuration file: {rdeconfig_file}"
-            raise StructuredError(err_msg) from None
 
-        return config
+        # Parsed once per process and shared, so the returned config is read-only.
+        return tasksupport_cache.load(rdeconfig_file, read_rdeconfig)
 
     @staticmethod
     def get_objects(rawfile: Path, path_tasksupport: Path, config: dict) -> VsmFactory:
@@ -100,6 +100,8 @@ class VsmFactory:
                 MetaParser (class): Parses metadata and saves it to a specified path.
                 GraphPlotter (class): Utility for plotting data using various types of plots.
                 StructuredDataProcessor (class): Template class for parsing structured data.
+                PyramidWriter (class): Writes plot data as a level-of-detail pyramid.
+                GridResampler (class): Resamples the corrected loop onto a fixed field grid.
 
         """
         suffix = rawfile.suffix.lower()
@@ -118,26 +120,44 @@ class VsmFactory:
         # Obtain classes according to manufacturer and file extension
         class_filereader, class_metaparser = get_classes(manufacturer, suffix)
 
-        return VsmFactory(
-            class_filereader(),
-            class_metaparser(config=config),
-            GraphPlotter(config=config),
-            StructuredDataProcesser(),
+        # The handlers keep no per-file state, so one instance per configuration is reused.
+        return tasksupport_cache.pooled(
+            (manufacturer, suffix),
+            config,
+            lambda: VsmFactory(
+                class_filereader(parsed_cache=ParsedInputCache(config=config)),
+                class_metaparser(config=config),
+                GraphPlotter(config=config),
+                StructuredDataProcesser(),
+                pyramid_writer=PyramidWriter(config=config),
+                grid_resampler=GridResampler(config=config),
+            ),
         )
 
 
+def read_rdeconfig(rdeconfig_file: Path) -> Any:
+    """Parse rdeconfig.yaml into a read-only configuration."""
+    try:
+        with open(rdeconfig_file) as file:
+            return freeze(yaml.safe_load(file))
+    except Exception:
+        err_msg = f"Invalid configuration file: {rdeconfig_file}"
+        raise StructuredError(err_msg) from None
+
+
 def get_classes(manufacturer: str, suffix: str) -> tuple[type[VsmFileReader], type[VsmMetaParser]]:
     """Get the appropriate FileReader, MetaParser classes based on the manufacturer and file suffix."""
     try:
         match manufacturer:
             case "mpms":
-                return MPMS_SUFFIX_CLASS_MAPPING[manufacturer][suffix]
+                reader_module, parser_module = MPMS_SUFFIX_CLASS_MAPPING[manufacturer][suffix]
             case "TAMAKAWA":
-                return TAMAKAWA_SUFFIX_CLASS_MAPPING[manufacturer][suffix]
+                reader_module, parser_module = TAMAKAWA_SUFFIX_CLASS_MAPPING[manufacturer][suffix]
             case "LakeShore":
-                return LakeShore_SUFFIX_CLASS_MAPPING[manufacturer][suffix]
+                reader_module, parser_module = LakeShore_SUFFIX_CLASS_MAPPING[manufacturer][suffix]
             case _:
                 raise KeyError
     except KeyError:
         err_msg = f"Unsupported combination of manufacturer '{manufacturer}' and file extension '{suffix}'"
         raise StructuredError(err_msg) from None
+    return importlib.import_module(reader_module).FileReader, importlib.import_module(parser_module).MetaParser
@@ -1,15 +1,25 @@
 from __future__ import annotations
 
 import os
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import matplotlib.pyplot as plt
 import pandas as pd
-from matplotlib.axes import Axes
-from matplotlib.figure import Figure
-from matplotlib.ticker import ScalarFormatter
 
+from modules_vsm import time_budget
+from modules_vsm.deferred_imports import new_figure
 from modules_vsm.interfaces import IGraphPlotter
+from modules_vsm.manifest import open_output
+from modules_vsm.timing import span
+
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure
+
+# Points per second assumed for the raw data graph (a marker on every point), drawn before
+# any graph has been timed. Measured about 1e6 on a desktop; kept low for slower hosts.
+ESTIMATED_PLOT_POINTS_PER_SEC = 200000
 
 
 class GraphPlotter(IGraphPlotter[pd.DataFrame]):
@@ -39,11 +49,24 @@ class GraphPlotter(IGraphPlotter[pd.DataFrame]):
         self.config: dict = config
 
     def _init_figure(self) -> tuple[Figure, Axes]:
-        fig, ax = plt.subplots(1, 1)
-        ax.yaxis.set_major_formatter(ScalarFormatter(useMathText=True))
-        ax.ticklabel_format(style="sci", axis="y", scilimits=(0, 0))
-        ax.grid(ls=":")
-        return fig, ax
+        # matplotlib is imported here, at the first graph, not when the module is imported.
+        return new_figure()
+
+    def _skip_over_budget(self, label: str, expected: float) -> bool:
+        """Return True if an optional graph, expected to take `expected` seconds, would exceed the time budget."""
+        if not time_budget.exceeded(expected):
+            return False
+        time_budget.degrade("skip_image", f"{label} not drawn")
+        return True
+
+    def _fit_to_budget(self, df: pd.DataFrame, label: str, expected: float) -> pd.DataFrame:
+        """Return every n-th row (`degraded_plot_points` rows) if the graph would exceed the time budget."""
+        max_points = self.config['vsm'].get('degraded_plot_points', time_budget.DEFAULT_DEGRADED_PLOT_POINTS)
+        if len(df) <= max_points or not time_budget.exceeded(expected):
+            return df
+        decimated = df.iloc[:: -(-len(df) // max_points)]
+        time_budget.degrade("decimate_plot", f"{label}: {len(df)} -> {len(decimated)} points")
+        return decimated
 
     def _plot_original(self, bname: str, figfmt: str, outdir: str, df_raw: pd.DataFrame) -> None:
         """Plottting raw measurement data.
@@ -62,8 +85,8 @@ class GraphPlotter(IGraphPlotter[pd.DataFrame]):
         ax.plot(df_raw.iloc[:, 0], df_raw.iloc[:, 1], marker='o', markersize=2)
         fig.tight_layout()
         graph_raw = os.path.join(outdir, f"{bname}_raw.{figfmt}")
-        fig.savefig(graph_raw)
-        plt.close(fig)
+        with open_output(graph_raw, "wb") as f:
+            fig.savefig(f, format=figfmt)
 
     def _plot_corrected(
         self,
@@ -118,8 +141,8 @@ class GraphPlotter(IGraphPlotter[pd.DataFrame]):
 
         fig.tight_layout()
         graph_hyst = os.path.join(outdir, f"{bname}_{m_key.lower()}.{figfmt}")
-        fig.savefig(graph_hyst)
-        plt.close(fig)
+        with open_output(graph_hyst, "wb") as f:
+            fig.savefig(f, format=figfmt)
 
     def plot_corrected_original(
         self,
@@ -151,13 +174,19 @@ class GraphPlotter(IGraphPlotter[pd.DataFrame]):
             dc_rm_col (str | None): column name for demagnetization-corrected moment data in df_data
 
         """
-        df_original = pd.DataFrame()
-        df_original["Magnetic Field (Oe)"] = df_data[x_col]
-        if moment_flag:
-            df_original["Moment (emu)"] = df_data[rm_col]
-        else:
-            df_original[dc_rm_col] = df_data[dc_rm_col]
-        self._plot_original(raw_basename, "png", str(out_dir_other_img), df_original)
+        # Seconds of the last graph, to decide whether the next one fits into the time budget.
+        # No graph has been drawn before the first one, so its time is estimated from the rows.
+        with span("plot_original", rows=len(df_data)):
+            start = time.perf_counter()
+            df_original = pd.DataFrame()
+            df_original["Magnetic Field (Oe)"] = df_data[x_col]
+            if moment_flag:
+                df_original["Moment (emu)"] = df_data[rm_col]
+            else:
+                df_original[dc_rm_col] = df_data[dc_rm_col]
+            df_original = self._fit_to_budget(df_original, "raw data graph", len(df_original) / ESTIMATED_PLOT_POINTS_PER_SEC)
+            self._plot_original(raw_basename, "png", str(out_dir_other_img), df_original)
+            last_plot_sec = time.perf_counter() - start
 
         # corrected データ生成
         df_corrected = pd.DataFrame()
@@ -168,10 +197,18 @@ class GraphPlotter(IGraphPlotter[pd.DataFrame]):
         plot_bs = self.config['vsm'].get('plot_bs_curve', True)
         plot_ms = self.config['vsm'].get('plot_ms_curve', True)
 
-        if "Ms" in characteristic_values.columns and plot_ms:
-            out_dir = out_dir_main_img if main_key == "ms" else out_dir_other_img
-            self._plot_corrected(raw_basename, "png", str(out_dir), df_corrected, characteristic_values, invoice_obj, m_key="Ms")
-
-        if "Bs" in characteristic_values.columns and plot_bs:
-            out_dir = out_dir_main_img if main_key == "bs" else out_dir_other_img
-            self._plot_corrected(raw_basename, "png", str(out_dir), df_corrected, characteristic_values, invoice_obj, m_key="Bs")
+        # With a time budget for the graph stage, the image that is not the main image is
+        # skipped and the others are decimated once the next graph would exceed it.
+        for m_key, enabled in (("Ms", plot_ms), ("Bs", plot_bs)):
+            if m_key not in characteristic_values.columns or not enabled:
+                continue
+            is_main = main_key == m_key.lower()
+            label = f"{m_key} curve graph"
+            if not is_main and self._skip_over_budget(label, last_plot_sec):
+                continue
+            df_plot = self._fit_to_budget(df_corrected, label, last_plot_sec) if is_main else df_corrected
+            out_dir = out_dir_main_img if is_main else out_dir_other_img
+            with span(f"plot_corrected_{m_key.lower()}", rows=len(df_plot)):
+                start = time.perf_counter()
+                self._plot_corrected(raw_basename, "png", str(out_dir), df_plot, characteristic_values, invoice_obj, m_key=m_key)
+                last_plot_sec = time.perf_counter() - start
@@ -1,14 +1,38 @@
+import contextlib
 import datetime
 import json
 import re
+import tempfile
+from abc import abstractmethod
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 from typing import Any
 
 import chardet
-from rdetoolkit.models.rde2types import MetaType
+import pandas as pd
+from rdetoolkit.models.rde2types import MetaType, RdeOutputResourcePath
 from rdetoolkit.rde2util import CharDecEncoding
 
 from modules_vsm.interfaces import IInputFileParser
+from modules_vsm.manifest import open_output
+from modules_vsm.parsed_cache import ParsedInputCache
+
+# Bytes used to detect the encoding of a file that is read in chunks. Only the
+# header holds text; the measurement data are numbers.
+ENCODING_SAMPLE_BYTES = 1 << 20
+
+
+def detect_encoding_from_head(raw_file_path: Path) -> str:
+    """Detect the encoding of a file from its first `ENCODING_SAMPLE_BYTES`, without reading the whole file."""
+    with open(raw_file_path, "rb") as f:
+        head = f.read(ENCODING_SAMPLE_BYTES)
+    # Cut at a line end so that no multi-byte character is split.
+    if len(head) == ENCODING_SAMPLE_BYTES and b"\n" in head:
+        head = head[: head.rfind(b"\n") + 1]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sample = Path(tmp_dir, raw_file_path.name)
+        sample.write_bytes(head)
+        return CharDecEncoding.detect_text_file_encoding(sample)
 
 
 class FileReader(IInputFileParser):
@@ -32,6 +56,78 @@ class FileReader(IInputFileParser):
 
     """
 
+    # Separator of the measurement data rows, used to parse rows appended to a growing file.
+    data_separator = ","
+
+    def __init__(self, parsed_cache: ParsedInputCache | None = None):
+        self.parsed_cache = parsed_cache
+
+    @abstractmethod
+    def _read_raw_data(self, raw_file_path: Path) -> tuple[MetaType, pd.DataFrame | None]:
+        """Read the metadata and the measurement data (None if the file has none) of the raw file."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _open_chunks(self, raw_file_path: Path, chunk_rows: int) -> contextlib.AbstractContextManager[tuple[MetaType, Iterable[pd.DataFrame]]]:
+        """Open the raw file and yield its metadata with an iterable of row blocks of at most `chunk_rows` rows."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _resolve_rawfile(self, resource_paths: RdeOutputResourcePath, is_filename_mapping_rule: bool) -> tuple[Path, list[str] | None]:
+        """Select the raw file to read and the column names fixed by the filename mapping rule, if any."""
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def read_chunks(
+        self,
+        resource_paths: RdeOutputResourcePath,
+        is_filename_mapping_rule: bool,
+        chunk_rows: int,
+    ) -> Iterator[tuple[MetaType, Iterable[pd.DataFrame], list[str] | None]]:
+        """Read the input file in blocks of rows instead of one DataFrame.
+
+        The file name is checked as in `read`. The metadata are parsed when the
+        context is entered; the measurement data are parsed while the blocks are
+        iterated, so only one block is in memory at a time.
+
+        Args:
+            resource_paths (RdeOutputResourcePath): resource paths.
+            is_filename_mapping_rule (bool): filename mapping rule.
+            chunk_rows (int): number of rows per block.
+
+        Yields:
+            tuple[MetaType, Iterable[pd.DataFrame], list[str] | None]: metadata,
+                blocks of measurement data and optional fname_token.
+
+        Example:
+            with file_reader.read_chunks(resource_paths, False, 100_000) as (meta, chunks, fname_token):
+                for df_chunk in chunks:
+                    ...
+
+        """
+        raw_file, fname_token = self._resolve_rawfile(resource_paths, is_filename_mapping_rule)
+        with self._open_chunks(raw_file, chunk_rows) as (meta, chunks):
+            yield meta, chunks, fname_token
+
+    def read_snapshot(self, raw_file_path: Path) -> tuple[MetaType, pd.DataFrame | None]:
+        """Read a copy of a file that is still being written.
+
+        Args:
+            raw_file_path (Path): copy of the raw file, ending with a complete line.
+
+        Returns:
+            tuple[MetaType, pd.DataFrame | None]: metadata and the measurement data
+                read so far, or None while the data section and its first row are not written yet.
+
+        """
+        try:
+            meta, df_data = self._read_raw_data(raw_file_path)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError):
+            return {}, None
+        if df_data is None or len(df_data.columns) == 0:
+            return meta, None
+        return meta, df_data
+
     def read_invoice(self, raw_file_path: Path) -> Any:
         """Read invoice file.
 
@@ -64,7 +160,7 @@ class FileReader(IInputFileParser):
         if preparation_date:
             invoice_obj["custom"]["sample_year"] = preparation_date.group()[:4]
             invoice_obj["custom"]["sample_month"] = preparation_date.group()[4:6]
-        with open(dst_invoice_json, "w", encoding=enc) as fout:
+        with open_output(dst_invoice_json, "w", encoding=enc) as fout:
             json.dump(invoice_obj, fout, indent=4, ensure_ascii=False)
 
     def _overwrite_measured_date(
@@ -95,5 +191,5 @@ class FileReader(IInputFileParser):
             date_str = str(date_str)
         tdate = datetime.datetime.strptime(date_str, date_format)
         invoice_obj["custom"]["measurement_measured_date"] = tdate.strftime("%Y-%m-%d")
-        with open(dst_invoice_json, "w", encoding=enc) as fout:
+        with open_output(dst_invoice_json, "w", encoding=enc) as fout:
             json.dump(invoice_obj, fout, indent=4, ensure_ascii=False)
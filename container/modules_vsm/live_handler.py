@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from rdetoolkit.models.rde2types import MetaType
+from rdetoolkit.rde2util import CharDecEncoding
+
+from modules_vsm.deferred_imports import new_figure
+from modules_vsm.inputfile_handler import FileReader
+
+# Same parameters as StructuredDataProcesser._preprocess_data and _extract_high_field_data.
+HAMPEL_WINDOW = 2
+HAMPEL_THRESHOLD = 3.0
+HAMPEL_SCALE = 1.4826
+HIGH_FIELD_RATIO = 0.8
+OE_PER_TESLA = 1e4
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Replace a file in one step, so that a viewer never sees a half written file."""
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+class TailFollower:
+    """Read a measurement file that the instrument is still appending to.
+
+    The header and the rows written so far are parsed once by the file reader,
+    from a snapshot that ends at the last complete line. After that only the
+    bytes behind the remembered offset are read, and only complete lines are
+    parsed, with the columns and separator of the data section.
+
+    Args:
+        file_reader (FileReader): reader of the file format.
+        raw_file_path (Path): measurement file.
+
+    Example:
+        follower = TailFollower(file_reader, rawfile)
+        new_rows = follower.poll()
+
+    """
+
+    def __init__(self, file_reader: FileReader, raw_file_path: Path):
+        self.file_reader = file_reader
+        self.raw_file_path = raw_file_path
+        self.meta: MetaType | None = None
+        self.columns: list[str] = []
+        self.encoding = "utf_8"
+        self.offset = 0
+        self.rows = 0
+
+    def _read_complete_lines(self) -> bytes:
+        size = self.raw_file_path.stat().st_size
+        if size < self.offset:
+            err_msg = f"File was truncated while following: {self.raw_file_path}"
+            raise ValueError(err_msg)
+        with open(self.raw_file_path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        return data[: data.rfind(b"\n") + 1]
+
+    def _start(self) -> pd.DataFrame | None:
+        prefix = self._read_complete_lines()
+        if not prefix:
+            return None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot = Path(tmp_dir, self.raw_file_path.name)
+            snapshot.write_bytes(prefix)
+            meta, df_data = self.file_reader.read_snapshot(snapshot)
+            if df_data is None:
+                return None
+            self.encoding = CharDecEncoding.detect_text_file_encoding(snapshot)
+        self.meta = meta
+        self.columns = [str(c) for c in df_data.columns]
+        self.offset = len(prefix)
+        self.rows = len(df_data)
+        return df_data
+
+    def poll(self) -> pd.DataFrame | None:
+        """Return the rows appended since the last call, or None while the data section has not started.
+
+        The first call that finds the data section returns every row written so far.
+        """
+        if self.meta is None:
+            return self._start()
+
+        appended = self._read_complete_lines()
+        if not appended:
+            return pd.DataFrame(columns=self.columns)
+        self.offset += len(appended)
+        text = appended.decode(self.encoding)
+        if not text.strip():
+            return pd.DataFrame(columns=self.columns)
+        df_rows = pd.read_csv(io.StringIO(text), header=None, names=self.columns, sep=self.file_reader.data_separator)
+        self.rows += len(df_rows)
+        return df_rows
+
+
+class GrowingArray:
+    """Float array with amortized appends."""
+
+    def __init__(self, capacity: int = 1024):
+        self._data = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    def append(self, value: float) -> None:
+        """Append a value, doubling the capacity when the array is full."""
+        if self.size == len(self._data):
+            self._data = np.concatenate([self._data, np.empty_like(self._data)])
+        self._data[self.size] = value
+        self.size += 1
+
+    def view(self) -> np.ndarray:
+        """Return the values as an array view (valid until the next append)."""
+        return self._data[: self.size]
+
+
+class LiveLoopAnalyzer:
+    """Provisional characteristic values of a hysteresis loop, updated row by row.
+
+    The analysis follows `StructuredDataProcesser._generic_plot`, but keeps its
+    state between updates instead of working on the whole file:
+
+    - The Hampel filter of the spike removal is evaluated for a row once the
+      `HAMPEL_WINDOW` rows after it are known.
+    - The high-field linear fit (descending rows above 80% of the maximum field)
+      keeps running means and co-moments. When the maximum field grows, the
+      candidate rows are filtered again and the sums rebuilt from them.
+    - Br and Hc are the first sign changes of the field and of the corrected
+      moment; scanning continues from where the previous update stopped, and
+      restarts only when the background slope changes.
+    - A new sweep segment starts whenever the field changes direction.
+
+    After `finish` the values equal those of the full analysis of the same data.
+
+    Args:
+        spike_removal (bool): apply the Hampel filter and the background correction.
+
+    """
+
+    def __init__(self, *, spike_removal: bool):
+        self.spike_removal = spike_removal
+        self.x = GrowingArray()
+        self.y = GrowingArray()
+        self.segment_starts: list[int] = []
+        self._direction = 0.0
+        self._pending: list[tuple[float, float]] = []
+        self._window_y: list[float] = []
+        self._raw_rows = 0
+        self._final_rows = 0
+        self._xmax = -np.inf
+        self._ymax = -np.inf
+        self._ymin = np.inf
+        self._candidates: list[tuple[float, float]] = []
+        self._fit: tuple[int, float, float, float, float] = (0, 0.0, 0.0, 0.0, 0.0)
+        self._br_index: int | None = None
+        self._br_scan = 1
+        self._hc_index: int | None = None
+        self._hc_scan = 1
+        self._hc_slope: float | None = None
+
+    @property
+    def rows(self) -> int:
+        """Return the number of rows included in the provisional values."""
+        return self.x.size
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> None:
+        """Add rows appended to the measurement."""
+        for xi, yi in zip(x.tolist(), y.tolist(), strict=True):
+            self._raw_rows += 1
+            if not self.spike_removal:
+                self._add_row(xi, yi)
+                continue
+            self._pending.append((xi, yi))
+            self._window_y.append(yi)
+            while self._pending and self._final_rows + HAMPEL_WINDOW < self._raw_rows:
+                self._finalize_pending()
+
+    def finish(self) -> None:
+        """Evaluate the last rows, whose Hampel window is cut off by the end of the measurement."""
+        while self._pending:
+            self._finalize_pending()
+
+    def _finalize_pending(self) -> None:
+        i = self._final_rows
+        # _window_y holds the raw values from row i - HAMPEL_WINDOW (or 0) onwards.
+        first = max(0, i - HAMPEL_WINDOW)
+        kernel = np.asarray(self._window_y[: i + HAMPEL_WINDOW + 1 - first])
+        xi, yi = self._pending.pop(0)
+        median = np.median(kernel)
+        std = HAMPEL_SCALE * np.median(np.abs(kernel - median))
+        self._final_rows += 1
+        if i >= HAMPEL_WINDOW:
+            self._window_y.pop(0)
+        if not np.abs(yi - median) > HAMPEL_THRESHOLD * std:
+            self._add_row(xi, yi)
+
+    def _add_row(self, xi: float, yi: float) -> None:
+        if np.isnan(xi) or np.isnan(yi):
+            return
+        n = self.x.size
+        diff = xi - self.x.view()[-1] if n else -1.0
+        if diff != 0:
+            direction = np.sign(diff)
+            if n > 1 and direction != self._direction:
+                self.segment_starts.append(n - 1)
+            self._direction = direction
+        if n == 0:
+            self.segment_starts.append(0)
+        self.x.append(xi)
+        self.y.append(yi)
+        self._ymax = max(self._ymax, yi)
+        self._ymin = min(self._ymin, yi)
+
+        if xi > self._xmax:
+            self._xmax = xi
+            threshold = self._xmax * HIGH_FIELD_RATIO
+            kept = [(cx, cy) for cx, cy in self._candidates if cx > threshold]
+            if len(kept) != len(self._candidates):
+                self._candidates = kept
+                self._fit = (0, 0.0, 0.0, 0.0, 0.0)
+                for cx, cy in kept:
+                    self._accumulate(cx, cy)
+        if diff < 0 and xi > self._xmax * HIGH_FIELD_RATIO:
+            self._candidates.append((xi, yi))
+            self._accumulate(xi, yi)
+
+    def _accumulate(self, xi: float, yi: float) -> None:
+        """Add a point to the running means and co-moments of the high-field fit."""
+        n, mean_x, mean_y, m2_x, c_xy = self._fit
+        n += 1
+        dx = xi - mean_x
+        mean_x += dx / n
+        mean_y += (yi - mean_y) / n
+        m2_x += dx * (xi - mean_x)
+        c_xy += dx * (yi - mean_y)
+        self._fit = (n, mean_x, mean_y, m2_x, c_xy)
+
+    def fit(self) -> tuple[float, float] | None:
+        """Return the slope and intercept of the high-field fit, or None without sample points."""
+        n, mean_x, mean_y, m2_x, c_xy = self._fit
+        if n == 0:
+            return None
+        slope = c_xy / m2_x if m2_x > 0 else 0.0
+        return slope, mean_y - slope * mean_x
+
+    def _corrected(self, slope: float) -> np.ndarray:
+        y = self.y.view()
+        return y - slope * self.x.view() if self.spike_removal else y
+
+    def _scan_crossings(self, slope: float) -> None:
+        n = self.x.size
+        if self._br_index is None and n > self._br_scan:
+            x = self.x.view()
+            changed = np.flatnonzero(np.sign(x[self._br_scan:]) != np.sign(x[0]))
+            self._br_index = self._br_scan + int(changed[0]) if changed.size else None
+            self._br_scan = n
+        curve_slope = slope if self.spike_removal else 0.0
+        if self._hc_slope != curve_slope:
+            # The corrected curve changed, so the first sign change is searched again.
+            self._hc_slope, self._hc_index, self._hc_scan = curve_slope, None, 1
+        if self._hc_index is None and n > self._hc_scan:
+            rm = self._corrected(slope)
+            changed = np.flatnonzero(np.sign(rm[self._hc_scan:]) != np.sign(rm[0]))
+            self._hc_index = self._hc_scan + int(changed[0]) if changed.size else None
+            self._hc_scan = n
+
+    def _line_through(self, idx: int, rm: np.ndarray) -> tuple[float, float]:
+        x = self.x.view()
+        x0, x1 = x[idx - 1] / OE_PER_TESLA, x[idx] / OE_PER_TESLA
+        a = (rm[idx - 1] - rm[idx]) / (x0 - x1)
+        return float(a), float(rm[idx - 1] - a * x0)
+
+    def values(self) -> dict[str, Any]:
+        """Return the provisional characteristic values; values that cannot be determined yet are None."""
+        fit = self.fit()
+        result: dict[str, Any] = {"Hc": None, "Br": None, "Bs": None, "Ms": None, "slope": None}
+        if self.x.size == 0:
+            return result
+        result["Ms"] = float((abs(self._ymax) + abs(self._ymin)) / 2)
+        if fit is None:
+            return result
+        slope, intercept = fit
+        result["slope"], result["Bs"] = slope, intercept
+        self._scan_crossings(slope)
+        rm = self._corrected(slope)
+        if self._br_index is not None:
+            result["Br"] = self._line_through(self._br_index, rm)[1]
+        if self._hc_index is not None:
+            a, b = self._line_through(self._hc_index, rm)
+            result["Hc"] = -b / a
+        return result
+
+    def segments(self) -> list[tuple[int, int]]:
+        """Return the first and last row of each sweep segment."""
+        ends = [*self.segment_starts[1:], self.x.size - 1]
+        return list(zip(self.segment_starts, ends, strict=True))
+
+    def corrected_curve(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the field (T) and the corrected moment of the rows so far."""
+        fit = self.fit()
+        rm = self._corrected(fit[0]) if fit is not None else self.y.view()
+        return self.x.view() / OE_PER_TESLA, rm
+
+
+class LivePlotter:
+    """Re-render the provisional loop at most every `live_plot_interval` seconds.
+
+    Args:
+        config (dict): configuration data.
+
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config: dict = config
+        self._rendered_at: float | None = None
+        self._rendered_rows = -1
+
+    @property
+    def min_interval(self) -> float:
+        """Return the minimum interval between two renders in seconds."""
+        return float(self.config['vsm'].get('live_plot_interval', 5.0))
+
+    def update(self, save_path: Path, title: str, analyzer: LiveLoopAnalyzer, *, force: bool = False) -> bool:
+        """Render the loop if it changed and the interval has passed (or `force` is set).
+
+        Returns:
+            bool: True if the graph was rendered.
+
+        """
+        now = time.monotonic()
+        if analyzer.rows == self._rendered_rows:
+            return False
+        if not force and self._rendered_at is not None and now - self._rendered_at < self.min_interval:
+            return False
+
+        field, rm = analyzer.corrected_curve()
+        values = analyzer.values()
+        fig, ax = new_figure()
+        ax.set_xlabel("Magnetic Field (T)")
+        ax.set_ylabel("Magnetization (emu)")
+        ax.set_title(f"{title} (live, {analyzer.rows} rows)")
+        ax.plot(field, rm, marker='o', markersize=2)
+        if values["Hc"] is not None:
+            ax.axvline(values["Hc"], color="gray", ls="--", lw=0.8)
+        if values["Br"] is not None:
+            ax.axhline(values["Br"], color="gray", ls="--", lw=0.8)
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=save_path.suffix.lstrip(".") or "png")
+        write_atomic(save_path, buffer.getvalue())
+        self._rendered_at = now
+        self._rendered_rows = analyzer.rows
+        return True
+
+
+def write_live_status(save_path: Path, follower: TailFollower, analyzer: LiveLoopAnalyzer, *, complete: bool) -> None:
+    """Write the provisional values of a followed file as JSON."""
+    status = {
+        "file": follower.raw_file_path.name,
+        "rows": follower.rows,
+        "analyzed_rows": analyzer.rows,
+        "segments": analyzer.segments(),
+        "complete": complete,
+        "updated_at": datetime.now(UTC).isoformat(),
+        **analyzer.values(),
+    }
+    write_atomic(save_path, json.dumps(status, indent=4, ensure_ascii=False).encode())
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import threading
+from collections.abc import Generator, Iterable
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import IO, Any
+
+from modules_vsm.timing import add_bytes
+
+MANIFEST_FORMAT = "vsm-manifest/1"
+HASH_CHUNK_SIZE = 1 << 20
+# Suffix of outputs that are still being written; they are renamed to the final name when complete.
+PARTIAL_SUFFIX = ".part"
+
+# Stage that is currently writing; set by the pipeline scheduler for each stage.
+current_stage: ContextVar[str | None] = ContextVar("current_stage", default=None)
+# Manifest of the running tile; outputs are not recorded when no manifest is active.
+current_manifest: ContextVar[OutputManifest | None] = ContextVar("current_manifest", default=None)
+
+
+class HashingWriter(io.RawIOBase):
+    """Binary file writer that computes SHA-256 and the byte count of everything written.
+
+    Args:
+        raw (IO[bytes]): underlying binary file.
+
+    """
+
+    def __init__(self, raw: IO[bytes]):
+        super().__init__()
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        """Return True, the writer only supports writing."""
+        return True
+
+    def write(self, b: Any) -> int:
+        """Write bytes to the underlying file and feed them to the hash."""
+        data = memoryview(b).cast("B")
+        self.sha256.update(data)
+        written = self.raw.write(data)
+        self.size += len(data)
+        return len(data) if written is None else written
+
+    def flush(self) -> None:
+        """Flush the underlying file."""
+        if not self.closed:
+            self.raw.flush()
+
+    def close(self) -> None:
+        """Flush and close the underlying file."""
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            self.raw.close()
+
+
+class OutputManifest:
+    """Collect path, size, SHA-256 and producing stage of every written output.
+
+    Writers open their files through `open_output`, which hashes the data while
+    it is written, so the manifest is complete without a second read pass over
+    the output tree. The manifest is thread safe because stages run in parallel.
+
+    Example:
+        manifest = OutputManifest()
+        with manifest.activate():
+            ...  # run the pipeline
+        manifest.write(resource_paths.logs.joinpath("manifest.json"))
+
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, path: Path, size: int, sha256: str, stage: str | None) -> None:
+        """Record an output. A later write of the same path replaces the earlier entry.
+
+        The bytes are also counted in the current timing span.
+
+        """
+        entry = {"path": str(path), "bytes": size, "sha256": sha256, "stage": stage, "mtime_ns": path.stat().st_mtime_ns}
+        with self._lock:
+            self._entries[str(path)] = entry
+        add_bytes(size)
+
+    def record_file(self, path: Path, stage: str | None = None) -> None:
+        """Hash and record a file written by a third-party writer that cannot be wrapped."""
+        size, sha256 = hash_file(path)
+        self.record(path, size, sha256, stage if stage is not None else current_stage.get())
+
+    @property
+    def entries(self) -> list[dict[str, Any]]:
+        """Return the recorded entries sorted by path."""
+        with self._lock:
+            return [self._entries[k] for k in sorted(self._entries)]
+
+    @contextlib.contextmanager
+    def activate(self) -> Generator[OutputManifest, None, None]:
+        """Make this manifest the target of `open_output` in the current context."""
+        token = current_manifest.set(self)
+        try:
+            yield self
+        finally:
+            current_manifest.reset(token)
+
+    def write(self, save_path: Path) -> None:
+        """Write the manifest as JSON.
+
+        Args:
+            save_path (Path): The path where the manifest will be saved.
+
+        """
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "created": datetime.now(UTC).isoformat(),
+            "files": self.entries,
+        }
+        tmp_path = partial_path(save_path)
+        with open(tmp_path, "w", encoding="utf_8") as f:
+            json.dump(manifest, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, save_path)
+
+
+def hash_file(path: Path) -> tuple[int, str]:
+    """Return the byte count and SHA-256 hex digest of a file."""
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+            size += len(chunk)
+    return size, sha256.hexdigest()
+
+
+def refresh_manifest(manifest_path: Path) -> int:
+    """Re-hash the entries of a manifest whose files were modified after they were recorded.
+
+    rdetoolkit rewrites some outputs after the dataset function returns (e.g. it
+    replaces `${filename}` in invoice.json). Only files whose size or mtime
+    changed are read again.
+
+    Args:
+        manifest_path (Path): manifest.json to update in place.
+
+    Returns:
+        int: number of refreshed entries.
+
+    """
+    with open(manifest_path, encoding="utf_8") as f:
+        manifest = json.load(f)
+
+    refreshed = 0
+    for entry in manifest["files"]:
+        path = Path(entry["path"])
+        if not path.exists():
+            continue
+        stat = path.stat()
+        if stat.st_mtime_ns == entry.get("mtime_ns") and stat.st_size == entry["bytes"]:
+            continue
+        entry["bytes"], entry["sha256"] = hash_file(path)
+        entry["mtime_ns"] = path.stat().st_mtime_ns
+        entry["post_processed"] = True
+        refreshed += 1
+
+    if refreshed:
+        tmp_path = partial_path(manifest_path)
+        with open(tmp_path, "w", encoding="utf_8") as f:
+            json.dump(manifest, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+    return refreshed
+
+
+def refresh_manifests(data_dir: Path) -> None:
+    """Refresh every per-tile manifest under an RDE data directory."""
+    for manifest_path in sorted(data_dir.glob("**/logs/manifest.json")):
+        refresh_manifest(manifest_path)
+
+
+def partial_path(path: Path) -> Path:
+    """Return the hidden file an output is written to before it is published under its name."""
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}{PARTIAL_SUFFIX}")
+
+
+def remove_partial_outputs(dirs: Iterable[Path]) -> int:
+    """Delete outputs left half-written in the given directories by an interrupted run.
+
+    Args:
+        dirs (Iterable[Path]): output directories of a tile.
+
+    Returns:
+        int: number of deleted files.
+
+    """
+    removed = 0
+    for out_dir in dirs:
+        if not out_dir.is_dir():
+            continue
+        for path in out_dir.glob(f".*{PARTIAL_SUFFIX}"):
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+@contextlib.contextmanager
+def open_output(
+    path: Path | str,
+    mode: str = "w",
+    *,
+    encoding: str | None = None,
+    newline: str | None = None,
+) -> Generator[IO[Any], None, None]:
+    """Open an output file for writing and record it in the active manifest on close.
+
+    The data is written to a hidden partial file that replaces `path` only when
+    the block completes, so an exception or a crash never leaves a half-written
+    output under the final name.
+
+    Args:
+        path (Path | str): output file path.
+        mode (str): "w" for text or "wb" for binary.
+        encoding (str | None): text encoding, as for `open`.
+        newline (str | None): newline translation, as for `open`.
+
+    Yields:
+        IO[Any]: a writable file object.
+
+    """
+    path = Path(path)
+    tmp_path = partial_path(path)
+    writer = HashingWriter(open(tmp_path, "wb"))  # noqa: SIM115
+    buffered = io.BufferedWriter(writer)
+    fout: IO[Any] = buffered if "b" in mode else io.TextIOWrapper(buffered, encoding=encoding, newline=newline)
+    try:
+        try:
+            yield fout
+        finally:
+            fout.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    manifest = current_manifest.get()
+    if manifest is not None:
+        manifest.record(path, writer.size, writer.sha256.hexdigest(), current_stage.get())
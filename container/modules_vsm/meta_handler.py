@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
 
 from rdetoolkit import rde2util
 from rdetoolkit.models.rde2types import MetaType, RepeatedMetaType
 
 from modules_vsm.interfaces import IMetaParser
+from modules_vsm.manifest import current_manifest, partial_path
 
 
 class MetaParser(IMetaParser[MetaType]):
@@ -55,4 +57,11 @@ class MetaParser(IMetaParser[MetaType]):
         meta_obj.assign_vals(const_meta_info)
         meta_obj.assign_vals(repeated_meta_info)
 
-        meta_obj.writefile(str(save_path))
+        tmp_path = partial_path(save_path)
+        meta_obj.writefile(str(tmp_path))
+        os.replace(tmp_path, save_path)
+
+        # rdetoolkit writes the file itself, so it is hashed after writing.
+        manifest = current_manifest.get()
+        if manifest is not None:
+            manifest.record_file(save_path)
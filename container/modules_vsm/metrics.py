@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import atexit
+import contextlib
+import json
+import math
+import os
+import socket
+import threading
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+from modules_vsm.timing import TileTimings
+
+# Directory of the Prometheus text file; overrides `metrics_dir` of rdeconfig.yaml.
+METRICS_DIR_ENV = "VSM_METRICS_DIR"
+METRICS_FILE = "vsm.prom"
+# Raw counters of each process, merged into METRICS_FILE on every flush.
+STATE_DIR = "state"
+DEFAULT_FLUSH_INTERVAL = 15.0
+# Upper bounds in seconds of the latency histograms.
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Type and help text of every exported metric.
+METRICS = {
+    "vsm_tiles_total": ("counter", "Tiles processed by the dataset function, by manufacturer and status."),
+    "vsm_tile_duration_seconds": ("histogram", "Wall time of the dataset function per tile."),
+    "vsm_stage_duration_seconds": ("histogram", "Wall time of each pipeline stage."),
+    "vsm_cache_requests_total": ("counter", "Lookups of the result and parsed input caches, by result."),
+    "vsm_rejected_inputs_total": ("counter", "Tiles that failed, by failed stage and exception type."),
+    "vsm_degradations_total": ("counter", "Degradations applied to stay within the stage time budgets, by stage and action."),
+    "vsm_input_bytes_total": ("counter", "Bytes of the input files of processed tiles."),
+    "vsm_output_bytes_total": ("counter", "Bytes written to the outputs of processed tiles."),
+}
+
+# Series key: metric name and sorted label pairs.
+SeriesKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+class MetricsRegistry:
+    """In-process counters and histograms of the structuring process.
+
+    Updates are cheap dictionary operations under a lock; nothing is written
+    until `MetricsExporter` flushes. Counter and histogram values only grow, so
+    the states of several processes (batch workers, daemon workers) can be
+    summed into one exposition.
+
+    Example:
+        registry.inc("vsm_cache_requests_total", cache="result", result="hit")
+        registry.observe("vsm_stage_duration_seconds", 0.42, stage="graph")
+
+    """
+
+    def __init__(self) -> None:
+        self._counters: dict[SeriesKey, float] = {}
+        # Per series: cumulative counts per bucket (the last one is +Inf), then sum.
+        self._histograms: dict[SeriesKey, list[float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, str]) -> SeriesKey:
+        if name not in METRICS:
+            err_msg = f"Unknown metric: {name}"
+            raise ValueError(err_msg)
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        """Add to a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Add an observation to a histogram with `DURATION_BUCKETS`."""
+        key = self._key(name, labels)
+        with self._lock:
+            buckets = self._histograms.setdefault(key, [0.0] * (len(DURATION_BUCKETS) + 2))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[len(DURATION_BUCKETS)] += 1
+            buckets[-1] += value
+
+    def state(self) -> dict[str, Any]:
+        """Return the values as JSON-serializable lists."""
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+
+def merge_states(states: list[dict[str, Any]]) -> tuple[dict[SeriesKey, float], dict[SeriesKey, list[float]]]:
+    """Sum the states of several processes."""
+    counters: dict[SeriesKey, float] = {}
+    histograms: dict[SeriesKey, list[float]] = {}
+    for state in states:
+        for name, labels, value in state["counters"]:
+            key = (name, tuple((k, v) for k, v in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, values in state["histograms"]:
+            key = (name, tuple((k, v) for k, v in labels))
+            merged = histograms.setdefault(key, [0.0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+    return counters, histograms
+
+
+def _labels(pairs: tuple[tuple[str, str], ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+    items = [*pairs, *extra]
+    if not items:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped, strict=True)) + "}"
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render(counters: dict[SeriesKey, float], histograms: dict[SeriesKey, list[float]]) -> str:
+    """Return the metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted(k for k in (counters if kind == "counter" else histograms) if k[0] == name)
+        if not series:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for key in series:
+            labels = key[1]
+            if kind == "counter":
+                lines.append(f"{name}{_labels(labels)} {_number(counters[key])}")
+                continue
+            values = histograms[key]
+            for bound, count in zip((*DURATION_BUCKETS, math.inf), values[:-1], strict=True):
+                lines.append(f"{name}_bucket{_labels(labels, (('le', _number(bound)),))} {_number(count)}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(values[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {_number(values[-2])}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf_8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class MetricsExporter:
+    """Periodically write the registry as a Prometheus text file.
+
+    Every process writes its raw state to `<metrics_dir>/state/` and then
+    renders the sum of all states into `<metrics_dir>/vsm.prom`, so batch
+    workers in separate processes appear as one set of series. The file is
+    meant for the textfile collector of the Prometheus node exporter. Rates
+    such as tiles per second are derived from the counters with `rate()`.
+
+    Args:
+        registry (MetricsRegistry): the metrics to export.
+        metrics_dir (Path): directory of `vsm.prom`.
+        interval (float): seconds between flushes.
+
+    """
+
+    def __init__(self, registry: MetricsRegistry, metrics_dir: Path, interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.registry = registry
+        self.metrics_dir = metrics_dir
+        self.interval = interval
+        self.state_path = metrics_dir.joinpath(STATE_DIR, f"{socket.gethostname()}_{os.getpid()}.json")
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="vsm-metrics", daemon=True)
+
+    def start(self) -> None:
+        """Start the flush thread; the metrics are also flushed when the process exits."""
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Stop the flush thread and flush a last time."""
+        self._stop.set()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the state of this process and the merged text file."""
+        with self._lock:
+            _write_atomic(self.state_path, json.dumps(self.registry.state()))
+            states = []
+            for path in sorted(self.state_path.parent.glob("*.json")):
+                try:
+                    with open(path, encoding="utf_8") as f:
+                        states.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+            _write_atomic(self.metrics_dir.joinpath(METRICS_FILE), render(*merge_states(states)))
+
+
+registry = MetricsRegistry()
+_exporter: MetricsExporter | None = None
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(config: Any) -> MetricsExporter | None:
+    """Start the exporter of this process once, if a metrics directory is configured."""
+    global _exporter  # noqa: PLW0603
+    metrics_dir = os.environ.get(METRICS_DIR_ENV) or config['vsm'].get('metrics_dir')
+    if not metrics_dir:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            interval = float(config['vsm'].get('metrics_flush_interval', DEFAULT_FLUSH_INTERVAL))
+            _exporter = MetricsExporter(registry, Path(metrics_dir).expanduser(), interval)
+            _exporter.start()
+        return _exporter
+
+
+def record_tile(timings: dict[str, Any], manufacturer: str, status: str, reason: str | None = None) -> None:
+    """Update the tile, stage and byte metrics from the contents of `timings.json`.
+
+    Args:
+        timings (dict[str, Any]): see `TileTimings.to_dict`.
+        manufacturer (str): `manufacturer` of rdeconfig.yaml.
+        status (str): "success" or "failed".
+        reason (str | None): failed stage and exception type of a failed tile.
+
+    """
+    registry.inc("vsm_tiles_total", manufacturer=manufacturer, status=status)
+    if reason is not None:
+        registry.inc("vsm_rejected_inputs_total", manufacturer=manufacturer, reason=reason)
+    if timings.get("input_bytes") is not None:
+        registry.inc("vsm_input_bytes_total", timings["input_bytes"], manufacturer=manufacturer)
+    root = timings.get("spans")
+    if root is None:
+        return
+    registry.observe("vsm_tile_duration_seconds", root["wall_sec"], manufacturer=manufacturer)
+    registry.inc("vsm_output_bytes_total", root["bytes_written"], manufacturer=manufacturer)
+    for stage in root.get("children", []):
+        registry.observe("vsm_stage_duration_seconds", stage["wall_sec"], stage=stage["name"])
+
+
+def failure_reason(timings: dict[str, Any], exc: BaseException) -> str:
+    """Return the failed stage and the type of the original exception, e.g. "read:ValueError"."""
+    root = timings.get("spans") or {}
+    stage = next((span["name"] for span in root.get("children", []) if span.get("failed")), "dataset")
+    cause = exc.__cause__ if exc.__cause__ is not None else exc
+    return f"{stage}:{type(cause).__name__}"
+
+
+@contextlib.contextmanager
+def track_tile(timings: TileTimings, manufacturer: str) -> Generator[None, None, None]:
+    """Record the tile in the metrics when the block ends, as failed if it raises.
+
+    Enter it before `timings.activate()`, so that the span tree is complete.
+    """
+    try:
+        yield
+    except Exception as exc:
+        result = timings.to_dict()
+        record_tile(result, manufacturer, "failed", failure_reason(result, exc))
+        raise
+    record_tile(timings.to_dict(), manufacturer, "success")
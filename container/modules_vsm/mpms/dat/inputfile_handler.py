@@ -1,14 +1,20 @@
 from __future__ import annotations
 
+import contextlib
 import csv
 import re
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from typing import TextIO
 
 import pandas as pd
 from rdetoolkit.models.rde2types import MetaType, RdeOutputResourcePath
 from rdetoolkit.rde2util import CharDecEncoding
 
 from modules_vsm.inputfile_handler import FileReader as datFileReader
+from modules_vsm.inputfile_handler import detect_encoding_from_head
+from modules_vsm.parsed_cache import cached_parse
+from modules_vsm.timing import span
 
 
 class FileReader(datFileReader):
@@ -58,6 +64,36 @@ class FileReader(datFileReader):
             vv = tokens[1:]
         return kk, vv
 
+    def _read_header(self, f: TextIO) -> tuple[MetaType, bool]:
+        """Read the metadata lines up to the [Data] section.
+
+        Args:
+            f (TextIO): raw file opened in text mode.
+
+        Returns:
+            tuple[MetaType, bool]: meta data, and whether the [Data] section was found.
+                The file is then positioned at the column header line.
+
+        """
+        min_token_length = 3
+
+        meta: MetaType = {}
+        for line_tokens in csv.reader(f):
+            tokens = [tok.strip() for tok in line_tokens]
+            if not tokens or tokens[0].startswith(";"):
+                continue
+            if tokens[0].startswith("["):
+                if tokens[0].lower() == "[data]":
+                    return meta, True
+                continue
+
+            kk, vv = self._parse_tokens(tokens, min_token_length)
+            if kk and vv is not None:
+                meta[kk] = vv
+
+        return meta, False
+
+    @cached_parse
     def _read_raw_data(
         self,
         raw_file_path: Path,
@@ -72,46 +108,31 @@ class FileReader(datFileReader):
             pd.DataFrame | None: measurement data or None if not found
 
         """
-        min_token_length = 3
-
-        meta: MetaType = {}
         df_data: pd.DataFrame | None = None
 
-        enc = CharDecEncoding.detect_text_file_encoding(raw_file_path)
+        with span("detect_encoding"):
+            enc = CharDecEncoding.detect_text_file_encoding(raw_file_path)
         with open(raw_file_path, encoding=enc) as f:
-            for line_tokens in csv.reader(f):
-                tokens = [tok.strip() for tok in line_tokens]
-                if not tokens or tokens[0].startswith(";"):
-                    continue
-                if tokens[0].startswith("["):
-                    if tokens[0].lower() == "[data]":
-                        df_data = pd.read_csv(f)
-                        break
-                    continue
-
-                kk, vv = self._parse_tokens(tokens, min_token_length)
-                if kk and vv is not None:
-                    meta[kk] = vv
+            meta, has_data = self._read_header(f)
+            if has_data:
+                with span("parse") as timed:
+                    df_data = pd.read_csv(f)
+                    if timed is not None:
+                        timed.rows = len(df_data)
 
         return meta, df_data
 
-    def read(
-        self,
-        resource_paths: RdeOutputResourcePath,
-        is_filename_mapping_rule: bool = False,
-    ) -> tuple[MetaType, pd.DataFrame, list[str]]:
-        """Read dat file.
-
-        Args:
-            resource_paths (RdeOutputResourcePath): resource paths
-            is_filename_mapping_rule (bool): filename mapping rule
-
-        Returns:
-            dict[str, str | list[str]]: meta data
-            pd.DataFrame: measurement data
-            list[str]: fname_token parsed from filename
-
-        """
+    @contextlib.contextmanager
+    def _open_chunks(self, raw_file_path: Path, chunk_rows: int) -> Iterator[tuple[MetaType, Iterable[pd.DataFrame]]]:
+        with open(raw_file_path, encoding=detect_encoding_from_head(raw_file_path)) as f:
+            meta, has_data = self._read_header(f)
+            if not has_data:
+                error_msg = f"Failed to read data from {raw_file_path}"
+                raise ValueError(error_msg)
+            with pd.read_csv(f, chunksize=chunk_rows) as chunks:
+                yield meta, chunks
+
+    def _resolve_rawfile(self, resource_paths: RdeOutputResourcePath, is_filename_mapping_rule: bool) -> tuple[Path, list[str]]:
         token_length_expected = 4
         raw_file = resource_paths.rawfiles[0]
 
@@ -130,6 +151,27 @@ class FileReader(datFileReader):
             error_msg = f'Unknown filename pattern("{src_base_name}")'
             raise ValueError(error_msg)
 
+        return raw_file, fname_token
+
+    def read(
+        self,
+        resource_paths: RdeOutputResourcePath,
+        is_filename_mapping_rule: bool = False,
+    ) -> tuple[MetaType, pd.DataFrame, list[str]]:
+        """Read dat file.
+
+        Args:
+            resource_paths (RdeOutputResourcePath): resource paths
+            is_filename_mapping_rule (bool): filename mapping rule
+
+        Returns:
+            dict[str, str | list[str]]: meta data
+            pd.DataFrame: measurement data
+            list[str]: fname_token parsed from filename
+
+        """
+        raw_file, fname_token = self._resolve_rawfile(resource_paths, is_filename_mapping_rule)
+
         meta, df_data = self._read_raw_data(raw_file)
         if df_data is None:
             error_msg = f"Failed to read data from {raw_file}"
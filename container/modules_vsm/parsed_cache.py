@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import inspect
+import json
+import math
+import shutil
+import sys
+import tempfile
+from collections.abc import Callable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, TypeVar
+
+import numpy as np
+import pandas as pd
+from rdetoolkit.models.rde2types import MetaType
+
+from modules_vsm import metrics
+from modules_vsm.manifest import HASH_CHUNK_SIZE
+
+if TYPE_CHECKING:
+    from modules_vsm.inputfile_handler import FileReader
+
+PARSED_CACHE_FORMAT = "vsm-parsed/1"
+
+ReaderT = TypeVar("ReaderT", bound="FileReader")
+DataT = TypeVar("DataT", pd.DataFrame, pd.DataFrame | None)
+
+
+@functools.cache
+def reader_version(reader_cls: type) -> str:
+    """Return a digest of the source of a reader class and its base classes, so that a parser change invalidates the cache."""
+    sha256 = hashlib.sha256()
+    for cls in reader_cls.__mro__:
+        module = sys.modules.get(cls.__module__)
+        if module is None or not cls.__module__.startswith("modules_vsm"):
+            continue
+        source_file = inspect.getsourcefile(module)
+        if source_file:
+            sha256.update(cls.__qualname__.encode())
+            sha256.update(Path(source_file).read_bytes())
+    return sha256.hexdigest()
+
+
+class ParsedInputCache:
+    """Cache of parsed input files, so that a re-analysis does not parse the raw text again.
+
+    An entry holds the metadata as JSON and every numeric column of the
+    measurement data as its own `.npy` file, which is memory-mapped on load, so
+    the returned DataFrame references the cached columns without copying. Other
+    columns (e.g. comments) are kept as JSON. The key is the SHA-256 of the file
+    contents together with the reader class and `reader_version`.
+
+    Example:
+        parsed_cache = ParsedInputCache(config)
+        file_reader = FileReader(parsed_cache=parsed_cache)
+
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config: dict = config
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether the parsed input cache is enabled in rdeconfig.yaml."""
+        return bool(self.config['vsm'].get('parsed_input_cache', False))
+
+    @property
+    def cache_dir(self) -> Path:
+        """Return the cache directory."""
+        cache_dir = self.config['vsm'].get('parsed_input_cache_dir')
+        return Path(cache_dir) if cache_dir else Path.home().joinpath(".cache", "rde_vsm", "parsed")
+
+    def make_key(self, raw_file_path: Path, reader_cls: type) -> str:
+        """Return the cache key of a raw file parsed by a reader class."""
+        sha256 = hashlib.sha256()
+        sha256.update(f"{PARSED_CACHE_FORMAT}\0{reader_cls.__module__}.{reader_cls.__qualname__}\0{reader_version(reader_cls)}\0".encode())
+        with open(raw_file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir.joinpath(key[:2], key)
+
+    def load(self, key: str) -> tuple[MetaType, pd.DataFrame] | None:
+        """Return the cached metadata and measurement data, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(entry_dir.joinpath("entry.json"), encoding="utf_8") as f:
+                entry = json.load(f)
+            columns: dict[str, Any] = {}
+            for i, column in enumerate(entry["columns"]):
+                if column["kind"] == "npy":
+                    columns[column["name"]] = np.load(entry_dir.joinpath(f"col_{i}.npy"), mmap_mode="r", allow_pickle=False)
+                else:
+                    columns[column["name"]] = np.array([np.nan if v is None else v for v in column["values"]], dtype=object)
+        except (OSError, ValueError, KeyError):
+            metrics.registry.inc("vsm_cache_requests_total", cache="parsed_input", result="miss")
+            return None
+        metrics.registry.inc("vsm_cache_requests_total", cache="parsed_input", result="hit")
+        return entry["meta"], pd.DataFrame(columns, copy=False)
+
+    def store(self, key: str, meta: MetaType, df_data: pd.DataFrame) -> bool:
+        """Store parsed data. Data that cannot be restored exactly is not stored.
+
+        Returns:
+            bool: True if the entry was stored.
+
+        """
+        entry_dir = self._entry_dir(key)
+        if entry_dir.exists():
+            return False
+        names = [str(c) for c in df_data.columns]
+        if names != list(df_data.columns) or len(set(names)) != len(names) or not isinstance(df_data.index, pd.RangeIndex) or df_data.index.start != 0:
+            return False
+
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=entry_dir.parent))
+        try:
+            columns = []
+            for i, name in enumerate(names):
+                values = df_data[name].to_numpy()
+                if values.dtype.kind in "biuf":
+                    np.save(tmp_dir.joinpath(f"col_{i}.npy"), values, allow_pickle=False)
+                    columns.append({"name": name, "kind": "npy", "dtype": values.dtype.str})
+                elif values.dtype == object:
+                    json_values = [None if isinstance(v, float) and math.isnan(v) else v for v in values.tolist()]
+                    columns.append({"name": name, "kind": "json", "values": json_values})
+                else:
+                    err_msg = f"Unsupported column dtype: {values.dtype}"
+                    raise TypeError(err_msg)
+            entry = {
+                "format": PARSED_CACHE_FORMAT,
+                "created": datetime.now(UTC).isoformat(),
+                "meta": meta,
+                "columns": columns,
+            }
+            with open(tmp_dir.joinpath("entry.json"), "w", encoding="utf_8") as f:
+                json.dump(entry, f, ensure_ascii=False, allow_nan=False)
+            tmp_dir.rename(entry_dir)
+        except (OSError, ValueError, TypeError):
+            # Another process stored the same key first, or the data cannot be cached.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+        return True
+
+
+def cached_parse(func: Callable[[ReaderT, Path], tuple[MetaType, DataT]]) -> Callable[[ReaderT, Path], tuple[MetaType, DataT]]:
+    """Decorate a reader's `_read_raw_data` so that it goes through the reader's parsed input cache."""
+
+    @functools.wraps(func)
+    def wrapper(self: ReaderT, raw_file_path: Path) -> tuple[MetaType, DataT]:
+        parsed_cache = self.parsed_cache
+        if parsed_cache is None or not parsed_cache.enabled:
+            return func(self, raw_file_path)
+
+        key = parsed_cache.make_key(raw_file_path, type(self))
+        cached = parsed_cache.load(key)
+        if cached is not None:
+            return cached
+
+        meta, df_data = func(self, raw_file_path)
+        if df_data is not None:
+            parsed_cache.store(key, meta, df_data)
+        return meta, df_data
+
+    return wrapper
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from collections.abc import Generator
+from contextvars import ContextVar
+from pathlib import Path
+from types import FrameType
+from typing import Any
+
+from modules_vsm.manifest import open_output
+
+# Fraction of tiles to profile (0 to 1); overrides `profile_rate` of rdeconfig.yaml.
+PROFILE_RATE_ENV = "VSM_PROFILE"
+# Switch-like values accepted for the rate, e.g. VSM_PROFILE=on profiles every tile.
+RATE_ON_VALUES = frozenset({"true", "on", "yes"})
+RATE_OFF_VALUES = frozenset({"false", "off", "no", ""})
+# Directory for the profiles; overrides `profile_dir` of rdeconfig.yaml.
+PROFILE_DIR_ENV = "VSM_PROFILE_DIR"
+DEFAULT_PROFILE_INTERVAL = 0.005
+DIAGNOSTICS_DIR = "diagnostics"
+
+# Function key of pstats: (file name, first line, function name).
+FunctionKey = tuple[str, int, str]
+
+logger = logging.getLogger(__name__)
+
+# Profiler of the running tile; stage threads register themselves with it.
+current_profiler: ContextVar[TileProfiler | None] = ContextVar("current_profiler", default=None)
+
+
+def profile_rate(config: Any) -> float:
+    """Return the fraction of tiles to profile from the environment or rdeconfig.yaml."""
+    rate = os.environ.get(PROFILE_RATE_ENV)
+    source = PROFILE_RATE_ENV
+    if rate is None:
+        rate = config['vsm'].get('profile_rate', 0.0)
+        source = "profile_rate"
+    return min(1.0, max(0.0, _parse_rate(rate, source)))
+
+
+def _parse_rate(rate: Any, source: str) -> float:
+    """Return the rate as a number; a value that is not a number or a switch disables profiling."""
+    if isinstance(rate, str):
+        switch = rate.strip().lower()
+        if switch in RATE_ON_VALUES:
+            return 1.0
+        if switch in RATE_OFF_VALUES:
+            return 0.0
+    try:
+        return float(rate)
+    except (TypeError, ValueError):
+        logger.warning("Invalid %s %r; profiling is disabled", source, rate)
+        return 0.0
+
+
+def profile_dir(config: Any, default: Path) -> Path:
+    """Return the directory the profiles of a tile are written to."""
+    out_dir = os.environ.get(PROFILE_DIR_ENV) or config['vsm'].get('profile_dir')
+    return default if not out_dir else Path(out_dir).expanduser()
+
+
+class TileProfiler:
+    """Statistical profiler of one tile based on periodic stack samples.
+
+    A background thread records the call stacks of the threads processing the
+    tile every `interval` seconds (`sys._current_frames`), so the stages
+    running in parallel threads are covered and the overhead does not depend
+    on the number of function calls. When the tile is done, two files are
+    written:
+
+    - `<name>.pstats`: the samples as a `pstats` profile. The times are the
+      sampled times; the call counts are numbers of samples, not calls.
+    - `<name>.collapsed.txt`: one line per distinct stack, the frames from the
+      outermost call separated by ";", followed by the number of samples, as
+      read by flame graph tools.
+
+    Args:
+        name (str): file name stem of the profiles.
+        out_dir (Path): diagnostics directory.
+        interval (float): seconds between samples.
+
+    Example:
+        profiler = TileProfiler(raw_basename, resource_paths.logs.joinpath("diagnostics"))
+        with profiler.activate():
+            ...  # run the pipeline
+
+    """
+
+    def __init__(self, name: str, out_dir: Path, interval: float = DEFAULT_PROFILE_INTERVAL):
+        self.name = name
+        self.out_dir = out_dir
+        self.interval = interval
+        # Samples and sampled seconds per stack, stored from the outermost frame.
+        self.samples: collections.Counter[tuple[FunctionKey, ...]] = collections.Counter()
+        self.seconds: collections.defaultdict[tuple[FunctionKey, ...], float] = collections.defaultdict(float)
+        self._threads: set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @classmethod
+    def sample(cls, name: str, config: Any, default_dir: Path) -> TileProfiler | None:
+        """Return a profiler for the tile with probability `profile_rate`, else None."""
+        rate = profile_rate(config)
+        if rate <= 0.0 or random.random() >= rate:  # noqa: S311
+            return None
+        interval = float(config['vsm'].get('profile_interval', DEFAULT_PROFILE_INTERVAL))
+        return cls(name, profile_dir(config, default_dir), interval)
+
+    @contextlib.contextmanager
+    def track_thread(self) -> Generator[None, None, None]:
+        """Sample the current thread while the block runs."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads.add(ident)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads.discard(ident)
+
+    @contextlib.contextmanager
+    def activate(self) -> Generator[TileProfiler, None, None]:
+        """Sample the current thread and the stage threads until the block ends, then write the profiles."""
+        sampler = threading.Thread(target=self._run, name="vsm-profiler", daemon=True)
+        token = current_profiler.set(self)
+        sampler.start()
+        try:
+            with self.track_thread():
+                yield self
+        finally:
+            self._stop.set()
+            sampler.join()
+            current_profiler.reset(token)
+        self.write()
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frames = sys._current_frames()  # noqa: SLF001
+            with self._lock:
+                threads = list(self._threads)
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = _stack(frame)
+                self.samples[stack] += 1
+                self.seconds[stack] += elapsed
+
+    def stats(self) -> dict[FunctionKey, tuple[int, int, float, float, dict[FunctionKey, tuple[int, int, float, float]]]]:
+        """Return the samples in the format of `pstats.Stats.stats`."""
+        calls: collections.Counter[FunctionKey] = collections.Counter()
+        own: collections.defaultdict[FunctionKey, float] = collections.defaultdict(float)
+        total: collections.defaultdict[FunctionKey, float] = collections.defaultdict(float)
+        edges: dict[FunctionKey, dict[FunctionKey, list[float]]] = collections.defaultdict(dict)
+        for stack, count in self.samples.items():
+            seconds = self.seconds[stack]
+            own[stack[-1]] += seconds
+            # A recursive function is counted once per sample.
+            for func in set(stack):
+                calls[func] += count
+                total[func] += seconds
+            for caller, callee in set(zip(stack, stack[1:], strict=False)):
+                edge = edges[callee].setdefault(caller, [0, 0, 0.0, 0.0])
+                edge[0] += count
+                edge[1] += count
+                edge[3] += seconds
+                if callee == stack[-1]:
+                    edge[2] += seconds
+        return {
+            func: (
+                calls[func],
+                calls[func],
+                own[func],
+                total[func],
+                {caller: (int(e[0]), int(e[1]), e[2], e[3]) for caller, e in edges[func].items()},
+            )
+            for func in calls
+        }
+
+    def collapsed(self) -> str:
+        """Return the samples as collapsed stacks."""
+        lines = [
+            ";".join(f"{func} ({Path(filename).name}:{line})" for filename, line, func in stack) + f" {count}"
+            for stack, count in self.samples.most_common()
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write(self) -> tuple[Path, Path]:
+        """Write the `.pstats` and the collapsed stack file and return their paths."""
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        pstats_path = self.out_dir.joinpath(f"{self.name}.pstats")
+        collapsed_path = self.out_dir.joinpath(f"{self.name}.collapsed.txt")
+        with open_output(pstats_path, "wb") as f:
+            marshal.dump(self.stats(), f)
+        with open_output(collapsed_path, "w", encoding="utf_8") as f:
+            f.write(self.collapsed())
+        return pstats_path, collapsed_path
+
+
+def _stack(frame: FrameType | None) -> tuple[FunctionKey, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+@contextlib.contextmanager
+def track_thread() -> Generator[None, None, None]:
+    """Sample the current thread for the profiler of the running tile, if the tile is profiled."""
+    profiler = current_profiler.get()
+    if profiler is None:
+        yield
+        return
+    with profiler.track_thread():
+        yield
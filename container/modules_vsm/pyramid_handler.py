@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import IO
+
+import numpy as np
+import pandas as pd
+
+from modules_vsm.manifest import open_output
+
+# One record per plotted point: original row index, field and moment.
+PYRAMID_RECORD_FIELDS = [("index", "<u4"), ("x", "<f4"), ("y", "<f4")]
+PYRAMID_RECORD_DTYPE = np.dtype(PYRAMID_RECORD_FIELDS)
+PYRAMID_FORMAT = "vsm-lod/1"
+
+
+class PyramidWriter:
+    """Write plot data as a level-of-detail pyramid for interactive viewers.
+
+    Each curve is stored as successive 2x decimated levels. Zoom level 0 is the
+    coarsest level and holds a single tile; every finer level doubles the number
+    of tiles, each tile covering an equal slice of the field range. Tiles are
+    written back to back into `<name>_lod.bin` as packed records
+    (`PYRAMID_RECORD_DTYPE`), and `<name>_lod.json` indexes their byte offsets so
+    that a viewer can fetch only the tiles of the current zoom with range requests.
+
+    Example:
+        pyramid_writer = PyramidWriter(config=config)
+        pyramid_writer.write_pyramid(df_data, fit_data, "sample", struct_dir, ...)
+
+    """
+
+    def __init__(self, config: dict[str, str | None]):
+        self.config: dict = config
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether the pyramid output is requested in rdeconfig.yaml."""
+        return bool(self.config['vsm'].get('plot_data_pyramid', False))
+
+    @property
+    def min_points(self) -> int:
+        """Return the number of points below which no coarser level is built."""
+        return int(self.config['vsm'].get('plot_data_pyramid_min_points', 512))
+
+    def build_levels(self, x: np.ndarray, y: np.ndarray) -> list[np.ndarray]:
+        """Decimate a curve into levels, finest first.
+
+        Args:
+            x (np.ndarray): field values.
+            y (np.ndarray): moment values.
+
+        Returns:
+            list[np.ndarray]: record arrays, level i keeps every 2**i-th point.
+
+        """
+        records = np.empty(len(x), dtype=PYRAMID_RECORD_DTYPE)
+        records["index"] = np.arange(len(x))
+        records["x"] = x
+        records["y"] = y
+        records = records[np.isfinite(records["x"]) & np.isfinite(records["y"])]
+
+        levels = [records]
+        while len(levels[-1]) > self.min_points:
+            levels.append(levels[-1][::2])
+        return levels
+
+    def _split_tiles(self, records: np.ndarray, n_tiles: int, x_min: float, x_max: float) -> list[np.ndarray]:
+        """Split records into equal field-range tiles, keeping the point order inside each tile."""
+        if n_tiles == 1 or x_max <= x_min:
+            return [records] + [records[:0]] * (n_tiles - 1)
+        tile_ids = np.floor((records["x"] - x_min) / (x_max - x_min) * n_tiles).astype(np.int64)
+        np.clip(tile_ids, 0, n_tiles - 1, out=tile_ids)
+        order = np.argsort(tile_ids, kind="stable")
+        bounds = np.searchsorted(tile_ids[order], np.arange(n_tiles + 1))
+        return [records[order[bounds[i]:bounds[i + 1]]] for i in range(n_tiles)]
+
+    def _write_series(self, fout: IO[bytes], offset: int, x: np.ndarray, y: np.ndarray, labels: tuple[str, str]) -> tuple[dict, int]:
+        """Write every tile of one curve and return its index entry and the next byte offset."""
+        levels = self.build_levels(x, y)
+        finest = levels[0]
+        x_min = float(finest["x"].min()) if len(finest) else 0.0
+        x_max = float(finest["x"].max()) if len(finest) else 0.0
+        y_min = float(finest["y"].min()) if len(finest) else 0.0
+        y_max = float(finest["y"].max()) if len(finest) else 0.0
+
+        index_levels = []
+        for zoom, records in enumerate(reversed(levels)):
+            n_tiles = 2 ** zoom
+            width = (x_max - x_min) / n_tiles
+            tiles = []
+            for i, tile in enumerate(self._split_tiles(records, n_tiles, x_min, x_max)):
+                data = tile.tobytes()
+                fout.write(data)
+                tiles.append({
+                    "x_min": x_min + i * width,
+                    "x_max": x_min + (i + 1) * width,
+                    "offset": offset,
+                    "count": len(tile),
+                })
+                offset += len(data)
+            index_levels.append({"zoom": zoom, "stride": 2 ** (len(levels) - 1 - zoom), "tiles": tiles})
+
+        series = {
+            "x_label": labels[0],
+            "y_label": labels[1],
+            "points": len(finest),
+            "x_range": [x_min, x_max],
+            "y_range": [y_min, y_max],
+            "levels": index_levels,
+        }
+        return series, offset
+
+    def write_pyramid(
+        self,
+        df_data: pd.DataFrame,
+        fit_data: pd.DataFrame,
+        raw_basename: str,
+        out_dir: Path,
+        moment_flag: bool,
+        *,
+        x_col: str | None,
+        rm_col: str | None,
+        dc_rm_col: str | None,
+    ) -> None:
+        """Write the corrected and raw curves as a tiled level-of-detail pyramid.
+
+        Args:
+            df_data (pd.DataFrame): measurement data
+            fit_data (pd.DataFrame): corrected data (x in T, RM in emu)
+            raw_basename (str): rawFilePath name
+            out_dir (Path): output directory
+            moment_flag (bool): flag indicating whether moment data should be used
+            x_col (str | None): column name for magnetic field data in df_data
+            rm_col (str | None): column name for moment (emu) data in df_data
+            dc_rm_col (str | None): column name for demagnetization-corrected moment data in df_data
+
+        """
+        y_col = rm_col if moment_flag else dc_rm_col
+        curves = {
+            "corrected": (fit_data["x"], fit_data["RM"], ("Magnetic Field (T)", "Magnetization (emu)")),
+            "raw": (df_data[x_col], df_data[y_col], ("Magnetic Field (Oe)", str(y_col))),
+        }
+
+        bin_path = out_dir.joinpath(f"{raw_basename}_lod.bin")
+        index: dict = {
+            "format": PYRAMID_FORMAT,
+            "data_file": bin_path.name,
+            "record_dtype": [list(field) for field in PYRAMID_RECORD_FIELDS],
+            "series": {},
+        }
+
+        offset = 0
+        with open_output(bin_path, "wb") as fout:
+            for name, (x, y, labels) in curves.items():
+                x_arr = np.asarray(x, dtype=np.float64)
+                y_arr = np.asarray(y, dtype=np.float64)
+                index["series"][name], offset = self._write_series(fout, offset, x_arr, y_arr, labels)
+
+        with open_output(out_dir.joinpath(f"{raw_basename}_lod.json"), "w", encoding="utf_8") as f:
+            json.dump(index, f, indent=4)
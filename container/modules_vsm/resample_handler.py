@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from modules_vsm.manifest import open_output
+
+BRANCH_NAMES = ("descending", "ascending")
+
+
+class GridResampler:
+    """Resample the corrected hysteresis loop onto a fixed field grid.
+
+    Each branch of the loop (field sweeping down, field sweeping up) is
+    interpolated onto the same grid of field values, so that curves measured on
+    different field points can be stacked, differenced or averaged directly.
+    The result is saved as a float32 `.npy` array of shape (3, points):
+    row 0 is the field grid (T), row 1 the descending branch and row 2 the
+    ascending branch (emu). Grid points outside the measured range of a branch
+    are NaN.
+
+    Example:
+        grid_resampler = GridResampler(config=config)
+        grid_resampler.write_grid_npy(fit_data, "sample", struct_dir)
+
+    """
+
+    def __init__(self, config: dict[str, str | None]):
+        self.config: dict = config
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether the grid output is requested in rdeconfig.yaml."""
+        return bool(self.config['vsm'].get('field_grid_resampling', False))
+
+    def field_grid(self) -> np.ndarray:
+        """Return the configured field grid in tesla."""
+        grid_min = float(self.config['vsm'].get('field_grid_min', -2.0))
+        grid_max = float(self.config['vsm'].get('field_grid_max', 2.0))
+        points = int(self.config['vsm'].get('field_grid_points', 401))
+        min_grid_points = 2
+        if points < min_grid_points or grid_max <= grid_min:
+            err_msg = f"Invalid field grid: min={grid_min}, max={grid_max}, points={points}"
+            raise ValueError(err_msg)
+        return np.linspace(grid_min, grid_max, points)
+
+    def split_branches(self, x: np.ndarray, y: np.ndarray) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+        """Split a loop into its longest descending and ascending runs.
+
+        Steps without field change are attached to the preceding direction, so a
+        plateau at the field maximum does not break a branch.
+
+        Args:
+            x (np.ndarray): field values.
+            y (np.ndarray): moment values.
+
+        Returns:
+            dict[str, tuple[np.ndarray, np.ndarray]]: branch name to (x, y), x sorted ascending.
+
+        """
+        min_branch_points = 2
+        branches: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        if len(x) < min_branch_points:
+            return branches
+
+        step = np.sign(np.diff(x))
+        # Forward-fill zero steps with the last non-zero direction.
+        nonzero = np.where(step != 0, np.arange(len(step)), 0)
+        np.maximum.accumulate(nonzero, out=nonzero)
+        step = step[nonzero]
+
+        change = np.flatnonzero(np.diff(step)) + 1
+        starts = np.concatenate(([0], change))
+        ends = np.concatenate((change, [len(step)]))
+
+        for name, direction in zip(BRANCH_NAMES, (-1, 1), strict=True):
+            runs = [(s, e) for s, e in zip(starts, ends, strict=True) if step[s] == direction]
+            if not runs:
+                continue
+            s, e = max(runs, key=lambda run: run[1] - run[0])
+            bx, by = x[s:e + 1], y[s:e + 1]
+            order = np.argsort(bx, kind="stable")
+            branches[name] = (bx[order], by[order])
+        return branches
+
+    def resample(self, x: np.ndarray, y: np.ndarray, grid: np.ndarray) -> np.ndarray:
+        """Interpolate both branches of a loop onto the grid.
+
+        Args:
+            x (np.ndarray): field values (T).
+            y (np.ndarray): moment values (emu).
+            grid (np.ndarray): field grid (T).
+
+        Returns:
+            np.ndarray: float32 array of shape (3, len(grid)).
+
+        """
+        out = np.full((1 + len(BRANCH_NAMES), len(grid)), np.nan, dtype=np.float32)
+        out[0] = grid
+        mask = np.isfinite(x) & np.isfinite(y)
+        branches = self.split_branches(x[mask], y[mask])
+        for row, name in enumerate(BRANCH_NAMES, start=1):
+            if name in branches:
+                bx, by = branches[name]
+                out[row] = np.interp(grid, bx, by, left=np.nan, right=np.nan)
+        return out
+
+    def write_grid_npy(self, fit_data: pd.DataFrame, raw_basename: str, out_dir: Path) -> np.ndarray:
+        """Resample the corrected loop and save it as `<name>_grid.npy`.
+
+        Args:
+            fit_data (pd.DataFrame): corrected data (x in T, RM in emu)
+            raw_basename (str): rawFilePath name
+            out_dir (Path): output directory
+
+        Returns:
+            np.ndarray: the saved array.
+
+        """
+        grid = self.field_grid()
+        out = self.resample(
+            np.asarray(fit_data["x"], dtype=np.float64),
+            np.asarray(fit_data["RM"], dtype=np.float64),
+            grid,
+        )
+        with open_output(out_dir.joinpath(f"{raw_basename}_grid.npy"), "wb") as f:
+            np.save(f, out)
+        return out
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import Generator, Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from rdetoolkit.models.rde2types import RdeOutputResourcePath
+
+from modules_vsm import metrics
+from modules_vsm.manifest import HASH_CHUNK_SIZE, OutputManifest, current_stage, open_output
+
+RESULT_CACHE_FORMAT = "vsm-result-cache/2"
+# Invoice custom fields that change the analysis or its outputs.
+ANALYSIS_INVOICE_KEYS = (
+    "spike_removal",
+    "background_removal",
+    "feature_acquisition",
+    "correction_factor",
+    "sample_size_height",
+    "sample_size_width",
+    "sample_size_thickness",
+)
+# rdeconfig.yaml `vsm` keys that do not change any cached output: concurrency,
+# caches, profiling, metrics and where or how the stages run.
+IGNORED_CONFIG_KEYS = (
+    "pipeline_workers",
+    "isolated_stages",
+    "result_cache",
+    "result_cache_dir",
+    "result_cache_max_bytes",
+    "result_index",
+    "result_index_path",
+    "parsed_input_cache",
+    "parsed_input_cache_dir",
+    "chunk_spill_dir",
+    "memory_profile",
+    "memory_profile_top",
+    "profile_rate",
+    "profile_dir",
+    "profile_interval",
+    "metrics_dir",
+    "metrics_flush_interval",
+    "live_plot_interval",
+)
+# Stages whose outputs are restored from the cache on a hit.
+CACHED_STAGES = ("analyze", "param_csv", "raw_csv", "graph_csv", "graph", "field_grid", "plot_data_pyramid")
+# Output directories of a tile that cached files are restored to.
+OUTPUT_KINDS = ("struct", "main_image", "other_image")
+
+
+@functools.cache
+def code_version() -> str:
+    """Return a digest of the structuring source code, so that a code change invalidates the cache."""
+    sha256 = hashlib.sha256()
+    root = Path(__file__).resolve().parent.parent
+    for path in sorted([*root.glob("modules_vsm/**/*.py"), *root.glob("modules/*.py")]):
+        sha256.update(path.relative_to(root).as_posix().encode())
+        sha256.update(path.read_bytes())
+    return sha256.hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of analysis results and the files derived from them.
+
+    The key covers the raw file bytes and name, the analysis-relevant invoice
+    custom fields (`ANALYSIS_INVOICE_KEYS`), the `vsm` section of rdeconfig.yaml
+    and the code version. An entry holds the analysis results (corrected curve,
+    characteristic values, physical properties) and the files written by the
+    `CACHED_STAGES`, so a hit restores the structured CSVs, graphs and optional
+    outputs and only the metadata and invoice are produced again.
+
+    Entries are directories under `result_cache_dir`; the least recently used
+    entries are evicted when the total size exceeds `result_cache_max_bytes`.
+    Hit, miss, store and eviction counts are kept in `stats.json`.
+
+    Example:
+        cache = ResultCache(config)
+        key = cache.make_key(rawfile, invoice_obj)
+        entry = cache.load(key)
+
+    """
+
+    def __init__(self, config: dict[str, Any]):
+        self.config: dict = config
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether the result cache is enabled in rdeconfig.yaml."""
+        return bool(self.config['vsm'].get('result_cache', False))
+
+    @property
+    def cache_dir(self) -> Path:
+        """Return the cache directory."""
+        cache_dir = self.config['vsm'].get('result_cache_dir')
+        return Path(cache_dir) if cache_dir else Path.home().joinpath(".cache", "rde_vsm", "results")
+
+    @property
+    def max_bytes(self) -> int:
+        """Return the maximum total size of the cache entries."""
+        return int(self.config['vsm'].get('result_cache_max_bytes', 1 << 30))
+
+    def make_key(self, rawfile: Path, invoice_obj: dict) -> str:
+        """Return the cache key of a tile.
+
+        Args:
+            rawfile (Path): measurement file.
+            invoice_obj (dict): invoice data.
+
+        Returns:
+            str: SHA-256 hex digest.
+
+        """
+        raw_sha256 = hashlib.sha256()
+        with open(rawfile, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                raw_sha256.update(chunk)
+        vsm_config = {k: v for k, v in self.config['vsm'].items() if k not in IGNORED_CONFIG_KEYS}
+        custom = invoice_obj.get("custom") or {}
+        key_source = {
+            "format": RESULT_CACHE_FORMAT,
+            "code": code_version(),
+            "raw_sha256": raw_sha256.hexdigest(),
+            # Graph titles and output file names contain the file name.
+            "raw_name": rawfile.name,
+            "invoice": {k: custom.get(k) for k in ANALYSIS_INVOICE_KEYS},
+            "config": vsm_config,
+        }
+        return hashlib.sha256(json.dumps(key_source, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir.joinpath(key[:2], key)
+
+    def _entries(self) -> Iterable[Path]:
+        return self.cache_dir.glob("??/*/entry.json")
+
+    @contextlib.contextmanager
+    def _locked(self) -> Generator[None, None, None]:
+        """Serialize updates of the statistics and eviction between processes."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir.joinpath(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _count(self, **increments: int) -> None:
+        stats_path = self.cache_dir.joinpath("stats.json")
+        with self._locked():
+            stats = self.stats()
+            for name, value in increments.items():
+                stats[name] = stats.get(name, 0) + value
+            with open(stats_path, "w", encoding="utf_8") as f:
+                json.dump(stats, f, indent=4)
+
+    def stats(self) -> dict[str, int]:
+        """Return the hit, miss, store and eviction counts."""
+        stats_path = self.cache_dir.joinpath("stats.json")
+        if not stats_path.exists():
+            return {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        with open(stats_path, encoding="utf_8") as f:
+            stats: dict[str, int] = json.load(f)
+        return stats
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        """Return the entry of a key, or None on a miss.
+
+        Returns:
+            dict[str, Any] | None: entry with the analysis results under "values"
+                and the cached files under "files".
+
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(entry_dir.joinpath("entry.json"), encoding="utf_8") as f:
+                entry: dict[str, Any] = json.load(f)
+            with np.load(entry_dir.joinpath("result.npz"), allow_pickle=False) as arrays:
+                fit_data = pd.DataFrame({str(c): arrays[f"fit_{i}"] for i, c in enumerate(arrays["fit_columns"])})
+                characteristic_values = pd.DataFrame({str(c): arrays[f"char_{i}"] for i, c in enumerate(arrays["char_columns"])})
+            # The physical properties are appended as the formatted strings, as by `add_physical_properties`.
+            characteristic_values = pd.concat([characteristic_values, pd.DataFrame([entry["physical_props"]])], axis=1)
+        except (OSError, ValueError, KeyError):
+            self._count(misses=1)
+            metrics.registry.inc("vsm_cache_requests_total", cache="result", result="miss")
+            return None
+
+        # The entry mtime is the LRU timestamp.
+        os.utime(entry_dir.joinpath("entry.json"))
+        self._count(hits=1)
+        metrics.registry.inc("vsm_cache_requests_total", cache="result", result="hit")
+        entry["dir"] = str(entry_dir)
+        entry["values"] = {
+            "fit_data": fit_data,
+            "characteristic_values": characteristic_values,
+            "moment_flag": entry["moment_flag"],
+            "physical_props": entry["physical_props"],
+        }
+        return entry
+
+    def restore(self, entry: dict[str, Any], resource_paths: RdeOutputResourcePath) -> None:
+        """Copy the cached files of an entry to the output directories of a tile.
+
+        The files are written through `open_output`, so they appear in the
+        tile's manifest under the stage that originally produced them.
+        """
+        entry_dir = Path(entry["dir"])
+        for item in entry["files"]:
+            token = current_stage.set(item["stage"])
+            try:
+                src = entry_dir.joinpath("files", item["kind"], item["name"])
+                dst = Path(getattr(resource_paths, item["kind"])).joinpath(item["name"])
+                with open(src, "rb") as fin, open_output(dst, "wb") as fout:
+                    shutil.copyfileobj(fin, fout, HASH_CHUNK_SIZE)
+            finally:
+                current_stage.reset(token)
+
+    def store(self, key: str, values: dict[str, Any], manifest: OutputManifest, resource_paths: RdeOutputResourcePath) -> bool:
+        """Store the results of a tile that was computed on a miss.
+
+        Args:
+            key (str): cache key.
+            values (dict[str, Any]): values produced by the pipeline.
+            manifest (OutputManifest): manifest of the tile, used to find the files of the cached stages.
+            resource_paths (RdeOutputResourcePath): output directories of the tile.
+
+        Returns:
+            bool: True if the entry was stored.
+
+        """
+        entry_dir = self._entry_dir(key)
+        if entry_dir.exists():
+            return False
+        entry_dir.parent.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=entry_dir.parent))
+        try:
+            files = self._copy_outputs(tmp_dir, manifest, resource_paths)
+            fit_data: pd.DataFrame = values["fit_data"]
+            # Only the numeric columns; the physical property strings are kept in entry.json.
+            characteristic_values: pd.DataFrame = values["characteristic_values"].drop(columns=list(values["physical_props"]), errors="ignore")
+            arrays = {
+                "fit_columns": np.array([str(c) for c in fit_data.columns]),
+                "char_columns": np.array([str(c) for c in characteristic_values.columns]),
+                **{f"fit_{i}": fit_data[c].to_numpy(dtype=np.float64) for i, c in enumerate(fit_data.columns)},
+                **{f"char_{i}": characteristic_values[c].to_numpy(dtype=np.float64) for i, c in enumerate(characteristic_values.columns)},
+            }
+            np.savez(tmp_dir.joinpath("result.npz"), **arrays)
+            size = sum(p.stat().st_size for p in tmp_dir.rglob("*") if p.is_file())
+            entry = {
+                "format": RESULT_CACHE_FORMAT,
+                "created": datetime.now(UTC).isoformat(),
+                "bytes": size,
+                "moment_flag": bool(values["moment_flag"]),
+                "physical_props": values["physical_props"],
+                "files": files,
+            }
+            with open(tmp_dir.joinpath("entry.json"), "w", encoding="utf_8") as f:
+                json.dump(entry, f, indent=4, ensure_ascii=False)
+            tmp_dir.rename(entry_dir)
+        except (OSError, ValueError, TypeError):
+            # Another process stored the same key first, or the results cannot be cached.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        self._count(stores=1)
+        self.evict()
+        return True
+
+    def _copy_outputs(self, tmp_dir: Path, manifest: OutputManifest, resource_paths: RdeOutputResourcePath) -> list[dict[str, str]]:
+        """Copy the files written by the cached stages into a new entry and return their descriptions."""
+        out_dirs = {kind: Path(getattr(resource_paths, kind)).resolve() for kind in OUTPUT_KINDS}
+        files = []
+        for item in manifest.entries:
+            if item["stage"] not in CACHED_STAGES:
+                continue
+            path = Path(item["path"]).resolve()
+            kind = next((k for k, d in out_dirs.items() if path.parent == d), None)
+            if kind is None:
+                continue
+            dst = tmp_dir.joinpath("files", kind, path.name)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, dst)
+            files.append({"kind": kind, "name": path.name, "stage": item["stage"], "sha256": item["sha256"]})
+        return files
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until the cache fits in `max_bytes`.
+
+        Returns:
+            int: number of removed entries.
+
+        """
+        with self._locked():
+            entries = []
+            for entry_json in self._entries():
+                try:
+                    with open(entry_json, encoding="utf_8") as f:
+                        size = int(json.load(f)["bytes"])
+                    entries.append((entry_json.stat().st_mtime_ns, size, entry_json.parent))
+                except (OSError, ValueError, KeyError):
+                    continue
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, entry_dir in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+                removed += 1
+        if removed:
+            self._count(evictions=removed)
+        return removed
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import sqlite3
+from collections.abc import Generator, Iterable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+
+from modules_vsm.manifest import HASH_CHUNK_SIZE
+from modules_vsm.structured_handler import StructuredDataProcesser
+
+# Seconds a writer waits for the lock held by another process (batch workers share one index).
+LOCK_TIMEOUT = 30.0
+# Param CSV columns and their index columns.
+VALUE_COLUMNS = {
+    "Hc": "hc",
+    "Br": "br",
+    "Ms": "ms",
+    "Bs": "bs",
+    "Brt": "brt",
+    "Br_per_volume": "br_per_volume",
+    "Br_per_volume_corrected": "br_per_volume_corrected",
+    "Ms_per_volume": "ms_per_volume",
+    "Ms_per_volume_corrected": "ms_per_volume_corrected",
+    "Bs_per_volume": "bs_per_volume",
+}
+# Invoice custom fields set from the file name tokens of the filename mapping rule.
+FILENAME_TOKEN_KEYS = ("sputtering_apparatus", "specimen_label", "sample_year", "sample_month")
+COLUMNS = (
+    "file_name",
+    "input_sha256",
+    "manufacturer",
+    "measured_date",
+    "sputtering_apparatus",
+    "specimen_label",
+    "sample_year",
+    "sample_month",
+    "sample_height",
+    "sample_width",
+    "sample_thickness",
+    *VALUE_COLUMNS.values(),
+    "data_dir",
+    "source",
+    "indexed_at",
+)
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    input_sha256 TEXT NOT NULL DEFAULT '',
+    manufacturer TEXT,
+    measured_date TEXT,
+    sputtering_apparatus TEXT,
+    specimen_label TEXT,
+    sample_year TEXT,
+    sample_month TEXT,
+    sample_height REAL,
+    sample_width REAL,
+    sample_thickness REAL,
+    {", ".join(f"{column} REAL" for column in VALUE_COLUMNS.values())},
+    data_dir TEXT,
+    source TEXT NOT NULL,
+    indexed_at TEXT NOT NULL,
+    UNIQUE (file_name, input_sha256)
+);
+CREATE INDEX IF NOT EXISTS results_hc ON results (hc);
+CREATE INDEX IF NOT EXISTS results_br ON results (br);
+CREATE INDEX IF NOT EXISTS results_ms ON results (ms);
+CREATE INDEX IF NOT EXISTS results_bs ON results (bs);
+CREATE INDEX IF NOT EXISTS results_measured_date ON results (measured_date);
+CREATE INDEX IF NOT EXISTS results_manufacturer ON results (manufacturer, measured_date);
+CREATE INDEX IF NOT EXISTS results_specimen ON results (specimen_label);
+CREATE INDEX IF NOT EXISTS results_apparatus ON results (sputtering_apparatus, sample_year, sample_month);
+CREATE INDEX IF NOT EXISTS results_sample_date ON results (sample_year, sample_month);
+"""
+# Built from the column constants only; the values are bound as parameters. A backfilled row
+# (rounded param CSV values) replaces only another backfilled row, never a row of the pipeline.
+UPSERT = (
+    f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "  # noqa: S608
+    "ON CONFLICT (file_name, input_sha256) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[2:])
+    + " WHERE excluded.source = 'pipeline' OR results.source = 'backfill'"
+)
+
+_processer = StructuredDataProcesser()
+
+
+def file_sha256(path: Path) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def index_row(
+    *,
+    file_name: str,
+    input_sha256: str,
+    manufacturer: str | None,
+    invoice_custom: dict[str, Any],
+    sample_size: list[float],
+    values: dict[str, float],
+    data_dir: Path | None,
+    source: str,
+) -> dict[str, Any]:
+    """Return the index row of one processed file.
+
+    Args:
+        file_name (str): name of the measurement file.
+        input_sha256 (str): SHA-256 of the measurement file, or "" if unknown.
+        manufacturer (str | None): `manufacturer` of rdeconfig.yaml.
+        invoice_custom (dict[str, Any]): invoice custom fields after the invoice was rewritten.
+        sample_size (list[float]): height, width and thickness (mm), as used for the values per volume.
+        values (dict[str, float]): characteristic values by param CSV column, e.g. Hc, Br, Brt.
+        data_dir (Path | None): output directory of the tile.
+        source (str): "pipeline" or "backfill".
+
+    Returns:
+        dict[str, Any]: column name to value.
+
+    """
+    row: dict[str, Any] = dict.fromkeys(COLUMNS)
+    row.update({
+        "file_name": file_name,
+        "input_sha256": input_sha256,
+        "manufacturer": manufacturer or None,
+        "measured_date": invoice_custom.get("measurement_measured_date"),
+        "data_dir": str(data_dir) if data_dir is not None else None,
+        "source": source,
+        "indexed_at": datetime.now(UTC).isoformat(timespec="seconds"),
+    })
+    for key in FILENAME_TOKEN_KEYS:
+        value = invoice_custom.get(key)
+        row[key] = str(value) if value is not None else None
+    for column, size in zip(("sample_height", "sample_width", "sample_thickness"), sample_size, strict=False):
+        row[column] = float(size)
+    for key, column in VALUE_COLUMNS.items():
+        value = values.get(key)
+        if value is not None and not pd.isna(value):
+            # Hc is indexed as absolute value, as in the param CSV.
+            row[column] = abs(float(value)) if key == "Hc" else float(value)
+    return row
+
+
+def pipeline_row(values: dict[str, Any], manufacturer: str, input_sha256: str, data_dir: Path) -> dict[str, Any]:
+    """Return the index row of a tile from the values of the structuring pipeline.
+
+    The physical properties are recalculated from the characteristic values, so that
+    the index keeps full precision instead of the two digits of the param CSV.
+    """
+    invoice_obj = values["invoice_obj"]
+    characteristic_values: pd.DataFrame = values["characteristic_values"]
+    sample_size = _processer.get_sample_size(_processer.parse_header(values.get("meta") or {}), invoice_obj)
+    correction_factor = invoice_obj["custom"].get("correction_factor") or 1
+    row_values = {key: float(characteristic_values[key].iloc[-1]) for key in ("Hc", "Br", "Ms", "Bs") if key in characteristic_values.columns}
+    row_values.update(_processer.physical_property_values(sample_size, characteristic_values, correction_factor))
+    return index_row(
+        file_name=values["rawfile"].name,
+        input_sha256=input_sha256,
+        manufacturer=manufacturer,
+        invoice_custom=invoice_obj["custom"],
+        sample_size=sample_size,
+        values=row_values,
+        data_dir=data_dir,
+        source="pipeline",
+    )
+
+
+class ResultIndex:
+    """SQLite index of the characteristic values of all processed files.
+
+    One row per measurement file, identified by its name and SHA-256, holds Hc, Br,
+    Ms, Bs and the values per volume or area together with the sample size, the
+    manufacturer, the measured date and the file name tokens (sputtering apparatus,
+    specimen label, sample year and month), so that runs can be searched and
+    compared without opening the param CSVs of every dataset. Processing the same
+    file again updates its row; a backfilled row does not replace a row of the
+    pipeline. The database uses write-ahead logging, so that it
+    can be queried while batch workers write to it.
+
+    Args:
+        path (Path): database file; created with its parent directories if missing.
+
+    Example:
+        index = ResultIndex.from_config(config)
+        if index is not None:
+            index.upsert([row])
+
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @classmethod
+    def from_config(cls, config: Any) -> ResultIndex | None:
+        """Return the index of `result_index_path` if `result_index` is enabled in rdeconfig.yaml, else None."""
+        if not config['vsm'].get('result_index', False):
+            return None
+        return cls(cls.path_from_config(config))
+
+    @staticmethod
+    def path_from_config(config: Any) -> Path:
+        """Return the database file of `result_index_path` in rdeconfig.yaml."""
+        path = config['vsm'].get('result_index_path')
+        return Path(path) if path else Path.home().joinpath(".cache", "rde_vsm", "index.sqlite")
+
+    @contextlib.contextmanager
+    def connect(self) -> Generator[sqlite3.Connection, None, None]:
+        """Open the database, creating the table and its indexes, and commit on success."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def upsert(self, rows: Iterable[dict[str, Any]]) -> int:
+        """Insert the rows, or update the rows of the same file name and SHA-256.
+
+        A row with source "backfill" does not update a row with source "pipeline".
+
+        Args:
+            rows (Iterable[dict[str, Any]]): rows of `index_row`.
+
+        Returns:
+            int: number of rows inserted or updated.
+
+        """
+        params = [tuple(row[column] for column in COLUMNS) for row in rows]
+        with self.connect() as connection:
+            written = connection.executemany(UPSERT, params).rowcount
+        return max(written, 0)
+
+    def add(self, row: dict[str, Any]) -> bool:
+        """Write the row of a processed tile; a failure is not an error of the tile.
+
+        Returns:
+            bool: True if the row was written, False if the index could not be written
+                (e.g. locked for longer than `LOCK_TIMEOUT` or on a read-only file system).
+
+        """
+        try:
+            self.upsert([row])
+        except (sqlite3.Error, OSError):
+            return False
+        return True
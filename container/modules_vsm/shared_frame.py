@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import contextlib
+import gc
+import itertools
+import os
+import secrets
+import threading
+from collections.abc import Generator, Sequence
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+import pandas as pd
+
+# Column offsets inside a block are aligned for vectorized access.
+COLUMN_ALIGNMENT = 64
+# Shared memory blocks appear as files here on Linux; used to find blocks left by a crashed worker.
+SHM_DIR = Path("/dev/shm")  # noqa: S108
+
+
+@dataclass(frozen=True)
+class SharedFrameDescriptor:
+    """Picklable description of a DataFrame stored in a shared memory block.
+
+    Attributes:
+        name (str): name of the shared memory block.
+        columns (tuple[str, ...]): column names.
+        dtypes (tuple[str, ...]): numpy dtype strings of the columns.
+        offsets (tuple[int, ...]): byte offsets of the columns in the block.
+        rows (int): number of rows.
+
+    """
+
+    name: str
+    columns: tuple[str, ...]
+    dtypes: tuple[str, ...]
+    offsets: tuple[int, ...]
+    rows: int
+
+
+def _release(shm: shared_memory.SharedMemory, *, unlink: bool) -> None:
+    if unlink:
+        with contextlib.suppress(FileNotFoundError):
+            shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        # Arrays of the frame may still be referenced, e.g. from a traceback.
+        gc.collect()
+        with contextlib.suppress(BufferError):
+            shm.close()
+
+
+class SharedFrameArena:
+    """Owner of the shared memory blocks used to hand DataFrames to worker processes.
+
+    Numeric columns are copied once into a block; workers attach to the block by
+    its descriptor and get a DataFrame that references the shared pages without
+    copying (`attach_frame`). The parent keeps no view of its blocks, so they can
+    be closed and unlinked as soon as the tile is done. Every block is named with
+    the arena prefix, also the blocks a worker creates for its results
+    (`share_frame` with the prefix), so `cleanup` removes all of them, including
+    those of a worker that crashed before it could report them.
+
+    Example:
+        with SharedFrameArena() as arena:
+            descriptor = arena.share(df_data, [x_col, rm_col])
+            future = executor.submit(worker, descriptor, arena.prefix)
+
+    """
+
+    def __init__(self) -> None:
+        self.prefix = f"vsm_{os.getpid()}_{secrets.token_hex(4)}_"
+        self._blocks: dict[str, shared_memory.SharedMemory] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.cleanup()
+
+    def share(self, df: pd.DataFrame, columns: Sequence[str | None] | None = None) -> SharedFrameDescriptor:
+        """Copy numeric columns of a DataFrame into a new block owned by the arena."""
+        shm, descriptor = share_frame(df, self.prefix, columns)
+        with self._lock:
+            self._blocks[shm.name] = shm
+        return descriptor
+
+    def take(self, descriptor: SharedFrameDescriptor) -> pd.DataFrame:
+        """Copy a DataFrame out of a block created by a worker and unlink the block."""
+        shm = shared_memory.SharedMemory(name=descriptor.name)
+        try:
+            return frame_view(shm, descriptor).copy()
+        finally:
+            _release(shm, unlink=True)
+
+    def cleanup(self) -> None:
+        """Unlink every block of the arena."""
+        with self._lock:
+            blocks = list(self._blocks.values())
+            self._blocks.clear()
+        for shm in blocks:
+            _release(shm, unlink=True)
+        # Blocks created by workers that never reported them.
+        if SHM_DIR.is_dir():
+            for path in SHM_DIR.glob(f"{self.prefix}*"):
+                with contextlib.suppress(FileNotFoundError):
+                    shared_memory.SharedMemory(name=path.name).unlink()
+
+
+_block_counter = itertools.count()
+
+
+def share_frame(
+    df: pd.DataFrame,
+    prefix: str,
+    columns: Sequence[str | None] | None = None,
+) -> tuple[shared_memory.SharedMemory, SharedFrameDescriptor]:
+    """Copy numeric columns of a DataFrame into a new shared memory block.
+
+    Args:
+        df (pd.DataFrame): data with a default RangeIndex, which is not stored.
+        prefix (str): block name prefix, normally `SharedFrameArena.prefix`.
+        columns (Sequence[str | None] | None): columns to share; None entries are
+            ignored. Defaults to all columns.
+
+    Returns:
+        tuple[SharedMemory, SharedFrameDescriptor]: the block, owned by the caller, and its descriptor.
+
+    Raises:
+        TypeError: If a column is not numeric.
+        ValueError: If the DataFrame does not have a default RangeIndex.
+
+    """
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        err_msg = "Only DataFrames with a default RangeIndex can be shared"
+        raise ValueError(err_msg)
+    names = [c for c in (df.columns if columns is None else columns) if c is not None]
+    arrays = [np.ascontiguousarray(df[c].to_numpy()) for c in names]
+    for name, values in zip(names, arrays, strict=True):
+        if values.dtype.kind not in "biuf":
+            err_msg = f"Column {name!r} of dtype {values.dtype} cannot be shared"
+            raise TypeError(err_msg)
+
+    offsets = []
+    size = 0
+    for values in arrays:
+        offsets.append(size)
+        size += -(-values.nbytes // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+    shm = shared_memory.SharedMemory(name=f"{prefix}{os.getpid()}_{next(_block_counter)}", create=True, size=max(size, 1))
+    try:
+        for offset, values in zip(offsets, arrays, strict=True):
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf, offset=offset)[:] = values
+    except BaseException:
+        _release(shm, unlink=True)
+        raise
+    descriptor = SharedFrameDescriptor(
+        name=shm.name,
+        columns=tuple(str(c) for c in names),
+        dtypes=tuple(values.dtype.str for values in arrays),
+        offsets=tuple(offsets),
+        rows=len(df),
+    )
+    return shm, descriptor
+
+
+def frame_view(shm: shared_memory.SharedMemory, descriptor: SharedFrameDescriptor) -> pd.DataFrame:
+    """Return a DataFrame whose columns reference a shared memory block without copying."""
+    columns: dict[str, np.ndarray] = {
+        name: np.ndarray((descriptor.rows,), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for name, dtype, offset in zip(descriptor.columns, descriptor.dtypes, descriptor.offsets, strict=True)
+    }
+    return pd.DataFrame(columns, copy=False)
+
+
+@contextlib.contextmanager
+def attach_frame(descriptor: SharedFrameDescriptor) -> Generator[pd.DataFrame, None, None]:
+    """Attach to a shared DataFrame in a worker; the block is closed, not unlinked, on exit.
+
+    The DataFrame must not be used after the context is left.
+    """
+    shm = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        yield frame_view(shm, descriptor)
+    finally:
+        _release(shm, unlink=False)
@@ -2,13 +2,22 @@ from __future__ import annotations
 
 import csv
 from pathlib import Path
-from typing import Any, cast
+from typing import TYPE_CHECKING, Any, cast
 
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
+from numpy.lib.stride_tricks import sliding_window_view
 
+from modules_vsm.deferred_imports import linear_regression
 from modules_vsm.interfaces import IStructuredDataProcesser
+from modules_vsm.manifest import open_output
+from modules_vsm.timing import span
+
+if TYPE_CHECKING:
+    from sklearn.linear_model import LinearRegression
+
+# Points above this percentage of the maximum field are used for the background fit and Bs.
+HIGH_FIELD_PERCENT = 80.0
 
 
 class StructuredDataProcesser(IStructuredDataProcesser):
@@ -40,23 +49,37 @@ class StructuredDataProcesser(IStructuredDataProcesser):
                 - Binary array where 1 indicates an outlier.
 
         """
-        array_size = len(x)
-        idx = np.arange(array_size)
         output_x = x.copy()
         output_idx = np.zeros_like(x)
+        self._hampel_windowed(x, k, thr, output_x=output_x, output_idx=output_idx)
+        return output_x, output_idx
+
+    def _hampel_windowed(self, x: np.ndarray, k: int, thr: float, *, output_x: np.ndarray, output_idx: np.ndarray) -> None:
+        """Apply the Hampel filter on a sliding window view.
 
-        for i in range(array_size):
-            mask = (idx >= (idx[i] - k)) & (idx <= (idx[i] + k))
-            kernel = x[mask]
+        The medians are computed for all rows at once instead of one masked
+        kernel per row. The windows near the ends of the array are cut off as
+        in the per-row evaluation, so the flags and replaced values are the same.
+        """
+        array_size = len(x)
+        # Rows with a full window of 2k + 1 values.
+        full = np.arange(k, array_size - k)
+        if len(full) > 0:
+            windows = sliding_window_view(x, 2 * k + 1)[full - k]
+            medians = np.median(windows, axis=1)
+            stds = 1.4826 * np.median(np.abs(windows - medians[:, None]), axis=1)
+            outliers = np.abs(x[full] - medians) > thr * stds
+            output_idx[full[outliers]] = 1
+            output_x[full[outliers]] = medians[outliers]
+        # Rows near the ends, whose window is cut off.
+        for i in sorted({*range(min(k, array_size)), *range(max(0, array_size - k), array_size)}):
+            kernel = x[max(0, i - k):i + k + 1]
             median = np.median(kernel)
             std = 1.4826 * np.median(np.abs(kernel - median))
-
             if np.abs(x[i] - median) > thr * std:
                 output_idx[i] = 1
                 output_x[i] = median
 
-        return output_x, output_idx
-
     def _calc_slope_intersept(self, _df: pd.DataFrame) -> tuple[float, float]:
         """Calculate the slope and intercept of a line using the first two points in the DataFrame.
 
@@ -86,14 +109,14 @@ class StructuredDataProcesser(IStructuredDataProcesser):
             error_msg = "No sample points found for linear regression (df_sub)"
             raise ValueError(error_msg)
 
-        model = LinearRegression()
+        model = linear_regression()
         x_ = df_sub[["x"]]
         y_ = df_sub[["y"]]
         model.fit(x_, y_)
         return model
 
-    def estimate_max_from_upper_limit(self, df_fit: pd.DataFrame) -> float:
-        """Estimate the saturation magnetic flux density (Bs) using the upper 20% of the high magnetic field range."""
+    def estimate_max_from_upper_limit(self, df_fit: pd.DataFrame, percent: float = HIGH_FIELD_PERCENT) -> float:
+        """Estimate the saturation magnetic flux density (Bs) using the upper 20% (above `percent`) of the high magnetic field range."""
         # Make a copy of the input DataFrame to avoid modifying the original.
         df_fit = df_fit.copy()
         df_fit["diff"] = df_fit["x"].diff()
@@ -101,14 +124,14 @@ class StructuredDataProcesser(IStructuredDataProcesser):
 
         # Get the subset of data from the upper 20% of the magnetic field range.
         xmax = df_fit["x"].max()
-        df_fit_20 = df_fit[(df_fit["x"] > xmax * 0.8) & (df_fit["diff"] < 0)]
+        df_fit_20 = df_fit[(df_fit["x"] > xmax * (percent / 100)) & (df_fit["diff"] < 0)]
 
         if len(df_fit_20) == 0:
             error_msg = "No sample points found for linear regression (df_fit_20)."
             raise ValueError(error_msg)
 
         # Perform linear regression on the selected data.
-        model_1 = LinearRegression()
+        model_1 = linear_regression()
         x_1 = df_fit_20[["x"]]
         y_1 = df_fit_20[["y"]]
         model_1.fit(x_1, y_1)
@@ -129,35 +152,35 @@ class StructuredDataProcesser(IStructuredDataProcesser):
         """
         return float((abs(values.max()) + abs(values.min())) / 2)
 
-    def _preprocess_data(self, x: pd.DataFrame, y: pd.DataFrame, invoice_obj: dict) -> pd.DataFrame:
+    def _preprocess_data(self, x: pd.DataFrame, y: pd.DataFrame, spike_removal: bool) -> pd.DataFrame:
         df = pd.DataFrame({
             "x": x.squeeze(),
             "y": y.squeeze(),
         })
-        if invoice_obj["custom"].get("spike_removal"):
+        if spike_removal:
             filtered_y, outliers = self.hampel(np.asarray(df["y"]), k=2, thr=3)
             df.loc[outliers == 1, "y"] = np.nan
             df.dropna(subset=["y"], inplace=True)
             df.reset_index(drop=True, inplace=True)
         return df
 
-    def _extract_high_field_data(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _extract_high_field_data(self, df: pd.DataFrame, percent: float = HIGH_FIELD_PERCENT) -> pd.DataFrame:
         df = df.copy()
         df["diff"] = df["x"].diff().fillna(-1)
         xmax = df["x"].max()
-        df_20 = df[(df["x"] > xmax * 0.8) & (df["diff"] < 0)]
+        df_20 = df[(df["x"] > xmax * (percent / 100)) & (df["diff"] < 0)]
         if df_20.empty:
             err_msg = "No sample points found for linear regression (df_fit_20)."
             raise ValueError(err_msg)
         return cast(pd.DataFrame, df_20)
 
     def _fit_linear_regression(self, df: pd.DataFrame) -> LinearRegression:
-        model = LinearRegression()
+        model = linear_regression()
         model.fit(df[["x"]], df[["y"]])
         return model
 
-    def _calculate_physical_properties(self, df: pd.DataFrame) -> tuple[float, float]:
-        bs = self.estimate_max_from_upper_limit(df)
+    def _calculate_physical_properties(self, df: pd.DataFrame, percent: float = HIGH_FIELD_PERCENT) -> tuple[float, float]:
+        bs = self.estimate_max_from_upper_limit(df, percent)
         ms = self.mean_abs_extremes(df["y"])
         return bs, ms
 
@@ -214,18 +237,45 @@ class StructuredDataProcesser(IStructuredDataProcesser):
                 df_fit: Dataframe by fitting.
                 characteristic_values: Hc (Coercive force), Br (Remanence), Bs (Residual magnetic flux density).
 
+        """
+        return self.fit_curve(x, y, spike_removal=bool(invoice_obj["custom"].get("spike_removal", False)))
+
+    def fit_curve(
+        self,
+        x: pd.DataFrame,
+        y: pd.DataFrame,
+        *,
+        spike_removal: bool,
+        percent: float = HIGH_FIELD_PERCENT,
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Correct the background of a magnetization curve and obtain its characteristic values.
+
+        Args:
+            x (pd.DataFrame): magnetic field (Oe).
+            y (pd.DataFrame): moment (emu).
+            spike_removal (bool): remove spikes with the Hampel filter and subtract the background.
+            percent (float): points above this percentage of the maximum field are fitted for the
+                background slope and Bs.
+
+        Returns:
+            tuple[pd.DataFrame, pd.DataFrame]:
+                df_fit: x (T), y, Background and RM (corrected moment) per point.
+                characteristic_values: Hc, Br, Bs, Ms.
+
         """
         if x.empty or y.empty:
             error_msg = "no data lines"
             raise ValueError(error_msg)
 
-        df = self._preprocess_data(x, y, invoice_obj)
-        df_20 = self._extract_high_field_data(df)
+        with span("preprocess", rows=len(x)):
+            df = self._preprocess_data(x, y, spike_removal)
+        df_20 = self._extract_high_field_data(df, percent)
         model = self._fit_linear_regression(df_20)
         slope = model.coef_[0]
 
-        bs, ms = self._calculate_physical_properties(df)
-        df = self._background_correction(df, slope, invoice_obj["custom"].get("spike_removal", False))
+        bs, ms = self._calculate_physical_properties(df, percent)
+        with span("background_correction", rows=len(df)):
+            df = self._background_correction(df, slope, spike_removal)
 
         hc, br = self._calculate_intercepts(df)
 
@@ -259,26 +309,41 @@ class StructuredDataProcesser(IStructuredDataProcesser):
 
     def calculate_physical_properties(self, sample_size: list[float], characteristic_values: pd.DataFrame, invoice_obj: dict) -> dict[str, str]:
         """Calculate physical properties based on sample size and characteristic values."""
-        results = {}
         correction_factor: float = invoice_obj["custom"].get("correction_factor") or 1
+        values = self.physical_property_values(sample_size, characteristic_values, correction_factor)
+        return {key: f"{value:.2e}" for key, value in values.items()}
+
+    def physical_property_values(self, sample_size: list[float], characteristic_values: pd.DataFrame, correction_factor: float = 1) -> dict[str, float]:
+        """Calculate the physical properties per volume (3 sample dimensions, mm) or per area (2 dimensions).
+
+        Args:
+            sample_size (list[float]): height, width and thickness, or height and width.
+            characteristic_values (pd.DataFrame): Br, and Ms and Bs if present.
+            correction_factor (float): factor of the corrected values per volume.
+
+        Returns:
+            dict[str, float]: e.g. Br_per_volume, Br_per_volume_corrected, Ms_per_volume, Bs_per_volume or Brt.
+
+        """
+        results = {}
         sample_size_dim_2 = 2
         sample_size_dim_3 = 3
         if len(sample_size) == sample_size_dim_3:
             volume = sample_size[0] * sample_size[1] * sample_size[2]
             br_val = float(characteristic_values["Br"].iloc[-1])
-            results["Br_per_volume"] = f"{(br_val / volume) * 1e9:.2e}"
-            results["Br_per_volume_corrected"] = f"{(br_val / volume * correction_factor) * 1e9:.2e}"
+            results["Br_per_volume"] = (br_val / volume) * 1e9
+            results["Br_per_volume_corrected"] = (br_val / volume * correction_factor) * 1e9
             if "Ms" in characteristic_values.columns:
                 ms_val = float(characteristic_values["Ms"].iloc[-1])
-                results["Ms_per_volume"] = f"{(ms_val / volume) * 1e9:.2e}"
-                results["Ms_per_volume_corrected"] = f"{(ms_val / volume * correction_factor) * 1e9:.2e}"
+                results["Ms_per_volume"] = (ms_val / volume) * 1e9
+                results["Ms_per_volume_corrected"] = (ms_val / volume * correction_factor) * 1e9
             if "Bs" in characteristic_values.columns:
                 bs_val = float(characteristic_values["Bs"].iloc[-1])
-                results["Bs_per_volume"] = f"{(bs_val / volume) * 1e9:.2e}"
+                results["Bs_per_volume"] = (bs_val / volume) * 1e9
         elif len(sample_size) == sample_size_dim_2:
             area = sample_size[0] * sample_size[1]
             br_val = float(characteristic_values["Br"].iloc[-1])
-            results["Brt"] = f"{1000 * br_val / area:.2e}"
+            results["Brt"] = 1000 * br_val / area
         return results
 
     def _prepare_characteristic_lists(
@@ -352,7 +417,7 @@ class StructuredDataProcesser(IStructuredDataProcesser):
 
         keys, values = self._prepare_characteristic_lists(characteristic_values, physical_props)
 
-        with open(csv_path_param, "w", newline="\n") as f:
+        with open_output(csv_path_param, "w", newline="\n") as f:
             writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
             writer.writerow(keys)
             writer.writerow(values)
@@ -365,45 +430,42 @@ class StructuredDataProcesser(IStructuredDataProcesser):
             df_out_raw[rm_col] = df_data[rm_col]
         else:
             df_out_raw[dc_rm_col] = df_data[dc_rm_col]
-        df_out_raw.to_csv(csv_path_raw, index=False)
+        with open_output(csv_path_raw, "w", newline="") as f:
+            df_out_raw.to_csv(f, index=False)
 
     def write_graph_csv(self, csv_path_graph: Path, df_fit: pd.DataFrame) -> None:
         """Write raw measurement data to a CSV file."""
         df_out = pd.DataFrame()
         df_out["Magnetic Field (T)"] = df_fit["x"]
         df_out["Magnetization (emu)"] = df_fit["RM"]
-        df_out.to_csv(csv_path_graph, index=False)
+        with open_output(csv_path_graph, "w", newline="") as f:
+            df_out.to_csv(f, index=False)
 
-    def to_csv_3types(
+    def analyze(
             self,
             df_data: pd.DataFrame,
-            csv_path_param: Path,
-            csv_path_raw: Path,
-            csv_path_graph: Path,
             *,
             x_col: str | None,
             rm_col: str | None,
             dc_rm_col: str | None,
             header: dict[str, Any],
             invoice_obj: dict,
-    ) -> tuple[pd.DataFrame, pd.DataFrame, bool]:
-        """Measurement data (metadata) output to csv files.
+    ) -> tuple[pd.DataFrame, pd.DataFrame, bool, dict[str, str]]:
+        """Compute the corrected curve and characteristic values without writing any file.
 
         Args:
             df_data (pd.DataFrame): Measurement data.
-            csv_path_param (Path): Path to param.csv file.
-            csv_path_raw (Path): Path to raw.csv file.
-            csv_path_graph (Path): Path to graph csv file.
             x_col (str | None): Name of the column to use as the x-axis.
             rm_col (str | None): Name of the column for moment (emu).
             dc_rm_col (str | None): Name of the column for DC Moment Fixed Ctr (emu).
-            header (dict[str, Any]): Header information to include in the CSV files.
+            header (dict[str, Any]): Header information of the measurement file.
             invoice_obj (dict): Invoice data.
 
         Returns:
             df_fit (pd.DataFrame) : measurement data
             characteristic_values (pd.DataFrame) : Hc, Br, Bs, Brt
             moment_flag (bool) : False:DC Moment Fixed Ctr (emu), True: Moment (emu)
+            physical_props (dict[str, str]) : physical properties per volume or area
 
         """
         moment_flag = True
@@ -415,8 +477,31 @@ class StructuredDataProcesser(IStructuredDataProcesser):
 
         df_data_x = df_data[[x_col]]
 
-        df_fit, characteristic_values = self._generic_plot(df_data_x, df_data_y, invoice_obj)
+        with span("fit", rows=len(df_data)):
+            df_fit, characteristic_values = self._generic_plot(df_data_x, df_data_y, invoice_obj)
+        with span("physical_properties"):
+            characteristic_values, physical_props = self.add_physical_properties(characteristic_values, header, invoice_obj)
+
+        return df_fit, characteristic_values, moment_flag, physical_props
+
+    def add_physical_properties(
+        self,
+        characteristic_values: pd.DataFrame,
+        header: dict[str, Any],
+        invoice_obj: dict,
+    ) -> tuple[pd.DataFrame, dict[str, str]]:
+        """Calculate the physical properties per volume or area and append them to the characteristic values.
+
+        Args:
+            characteristic_values (pd.DataFrame): Hc, Br, Bs, Ms.
+            header (dict[str, Any]): Header information of the measurement file.
+            invoice_obj (dict): Invoice data.
 
+        Returns:
+            characteristic_values (pd.DataFrame) : characteristic values with the physical properties
+            physical_props (dict[str, str]) : physical properties per volume or area
+
+        """
         meta1 = self.parse_header(header)
         sample_size = self.get_sample_size(meta1, invoice_obj)
         physical_props = self.calculate_physical_properties(sample_size, characteristic_values, invoice_obj)
@@ -424,10 +509,57 @@ class StructuredDataProcesser(IStructuredDataProcesser):
         physical_props_df = pd.DataFrame([physical_props])
         characteristic_values = pd.concat([characteristic_values.reset_index(drop=True), physical_props_df], axis=1)
 
+        return characteristic_values, physical_props
+
+    def to_csv_3types(
+            self,
+            df_data: pd.DataFrame,
+            csv_path_param: Path,
+            csv_path_raw: Path,
+            csv_path_graph: Path,
+            *,
+            x_col: str | None,
+            rm_col: str | None,
+            dc_rm_col: str | None,
+            header: dict[str, Any],
+            invoice_obj: dict,
+    ) -> tuple[pd.DataFrame, pd.DataFrame, bool]:
+        """Measurement data (metadata) output to csv files.
+
+        Args:
+            df_data (pd.DataFrame): Measurement data.
+            csv_path_param (Path): Path to param.csv file.
+            csv_path_raw (Path): Path to raw.csv file.
+            csv_path_graph (Path): Path to graph csv file.
+            x_col (str | None): Name of the column to use as the x-axis.
+            rm_col (str | None): Name of the column for moment (emu).
+            dc_rm_col (str | None): Name of the column for DC Moment Fixed Ctr (emu).
+            header (dict[str, Any]): Header information to include in the CSV files.
+            invoice_obj (dict): Invoice data.
+
+        Returns:
+            df_fit (pd.DataFrame) : measurement data
+            characteristic_values (pd.DataFrame) : Hc, Br, Bs, Brt
+            moment_flag (bool) : False:DC Moment Fixed Ctr (emu), True: Moment (emu)
+
+        """
+        with span("analyze", rows=len(df_data)):
+            df_fit, characteristic_values, moment_flag, physical_props = self.analyze(
+                df_data,
+                x_col=x_col,
+                rm_col=rm_col,
+                dc_rm_col=dc_rm_col,
+                header=header,
+                invoice_obj=invoice_obj,
+            )
+
         # CSV出力を分割した関数で呼ぶ
-        self.write_param_csv(csv_path_param, characteristic_values, invoice_obj, physical_props)
-        self.write_raw_csv(csv_path_raw, df_data, x_col, rm_col, dc_rm_col, moment_flag)
-        self.write_graph_csv(csv_path_graph, df_fit)
+        with span("param_csv", rows=len(characteristic_values)):
+            self.write_param_csv(csv_path_param, characteristic_values, invoice_obj, physical_props)
+        with span("raw_csv", rows=len(df_data)):
+            self.write_raw_csv(csv_path_raw, df_data, x_col, rm_col, dc_rm_col, moment_flag)
+        with span("graph_csv", rows=len(df_fit)):
+            self.write_graph_csv(csv_path_graph, df_fit)
 
         return df_fit, characteristic_values, moment_flag
 
@@ -441,7 +573,8 @@ class StructuredDataProcesser(IStructuredDataProcesser):
                 If None, the default headers from the DataFrame are used.
 
         """
-        if header is not None:
-            dataframe.to_csv(save_path, header=header, index=False)
-        else:
-            dataframe.to_csv(save_path, index=False)
+        with open_output(save_path, "w", newline="") as f:
+            if header is not None:
+                dataframe.to_csv(f, header=header, index=False)
+            else:
+                dataframe.to_csv(f, index=False)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import copy
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Mapping
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, TypeVar
+
+from rdetoolkit.rde2util import Meta
+
+from modules_vsm.manifest import hash_file
+
+T = TypeVar("T")
+# Entries kept per process in each of the caches below; the least recently used are dropped first.
+# Long-lived workers see a new tasksupport copy per job, so the caches must not grow with the jobs.
+MAX_CACHED_FILES = 64
+MAX_POOLED_OBJECTS = 32
+
+
+def freeze(value: Any) -> Any:
+    """Return a read-only copy of parsed YAML/JSON data: mappings become MappingProxyType and lists become tuples."""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list | tuple):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class TasksupportCache:
+    """Per-process cache of parsed tasksupport files and the handler objects built from them.
+
+    Parsed files are keyed by their size and SHA-256, so identical copies of the
+    tasksupport (e.g. one per job of a worker daemon) share one entry and one set
+    of pooled handlers, and an edited rdeconfig.yaml or metadata-def.json is
+    parsed again without restarting a long-lived worker. The digest of a path is
+    only recomputed when its mtime or size changed. All caches are bounded and
+    drop their least recently used entries. Cached values are shared and must
+    not be modified; configurations are therefore frozen (see `freeze`) and the
+    metadata definition is handed out as a copy of a parsed prototype.
+
+    Example:
+        config = tasksupport_cache.load(rdeconfig_file, read_rdeconfig)
+        metadata_def = tasksupport_cache.new_metadata_def(path_tasksupport.joinpath("metadata-def.json"))
+
+    """
+
+    def __init__(self, max_files: int = MAX_CACHED_FILES, max_pooled: int = MAX_POOLED_OBJECTS) -> None:
+        self.max_files = max_files
+        self.max_pooled = max_pooled
+        self._lock = threading.Lock()
+        # Resolved path -> (mtime, size) when hashed, content key.
+        self._contents: OrderedDict[Path, tuple[tuple[int, int], tuple[int, str]]] = OrderedDict()
+        # (parser, content key) -> parsed contents.
+        self._files: OrderedDict[tuple[Callable, tuple[int, str]], Any] = OrderedDict()
+        self._pool: OrderedDict[Hashable, tuple[Any, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _put(cache: OrderedDict, key: Hashable, value: Any, limit: int) -> None:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def _content_key(self, path: Path) -> tuple[int, str]:
+        """Return the size and SHA-256 of a file, hashing it only if it is new or has changed."""
+        stat = path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+        resolved = path.resolve()
+        with self._lock:
+            cached = self._contents.get(resolved)
+            if cached is not None and cached[0] == signature:
+                self._contents.move_to_end(resolved)
+                return cached[1]
+        content = hash_file(path)
+        with self._lock:
+            self._put(self._contents, resolved, (signature, content), self.max_files)
+        return content
+
+    def load(self, path: Path, parse: Callable[[Path], T]) -> T:
+        """Return the parsed contents of a file, parsing it only if it is new or has changed.
+
+        Args:
+            path (Path): file to parse.
+            parse (Callable[[Path], T]): parser; its result is shared between callers.
+
+        Returns:
+            T: parsed contents.
+
+        """
+        key = (parse, self._content_key(path))
+        with self._lock:
+            if key in self._files:
+                self._files.move_to_end(key)
+                self.hits += 1
+                value: T = self._files[key]
+                return value
+
+        value = parse(path)
+        with self._lock:
+            self._put(self._files, key, value, self.max_files)
+            self.misses += 1
+        return value
+
+    def new_metadata_def(self, path: Path) -> Meta:
+        """Return a fresh Meta object for a metadata definition file, copied from a parsed prototype."""
+        return copy.deepcopy(self.load(path, Meta))
+
+    def pooled(self, key: Hashable, owner: Any, build: Callable[[], T]) -> T:
+        """Return a pooled object, building it again when its owner changed.
+
+        Args:
+            key (Hashable): pool key, e.g. manufacturer and file extension.
+            owner (Any): object the pooled object was built from, typically the cached
+                configuration. A different owner (e.g. after rdeconfig.yaml changed)
+                replaces the pooled object.
+            build (Callable[[], T]): builds the object.
+
+        Returns:
+            T: the pooled object.
+
+        """
+        with self._lock:
+            cached = self._pool.get(key)
+            if cached is not None and cached[0] is owner:
+                self._pool.move_to_end(key)
+                obj: T = cached[1]
+                return obj
+        obj = build()
+        with self._lock:
+            self._put(self._pool, key, (owner, obj), self.max_pooled)
+        return obj
+
+    def clear(self) -> None:
+        """Drop all cached files and pooled objects."""
+        with self._lock:
+            self._contents.clear()
+            self._files.clear()
+            self._pool.clear()
+
+
+tasksupport_cache = TasksupportCache()
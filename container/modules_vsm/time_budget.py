@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import contextlib
+import threading
+import time
+from collections.abc import Generator
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from modules_vsm import metrics
+
+# Metadata key (metadata-def.json) listing the degradations applied to a tile.
+METADATA_KEY = "processing_degradations"
+# Points per curve drawn when a graph is decimated to meet the budget.
+DEFAULT_DEGRADED_PLOT_POINTS = 20000
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """Time budget of the running stage.
+
+    Attributes:
+        stage (str): stage name.
+        budget (float): allowed seconds.
+        start (float): `time.perf_counter()` at the start of the stage.
+
+    """
+
+    stage: str
+    budget: float
+    start: float
+
+    def elapsed(self) -> float:
+        """Return the seconds since the start of the stage."""
+        return time.perf_counter() - self.start
+
+
+# Budget of the running tile, and deadline of the stage running in the current thread.
+current_budget: ContextVar[TimeBudget | None] = ContextVar("current_budget", default=None)
+current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+class TimeBudget:
+    """Per-stage time budgets of a tile and the degradations applied to meet them.
+
+    A running thread cannot be interrupted, so a stage over its budget is not
+    aborted. Instead the stages check `exceeded` between steps and switch to a
+    cheaper variant of the remaining work (decimated graphs, skipping optional
+    images) and record it with `degrade`. The
+    degradations are written to the metadata of the tile (`METADATA_KEY`).
+
+    Args:
+        budgets (dict[str, float]): stage name to allowed seconds, e.g. {"graph": 30}.
+
+    Example:
+        budget = TimeBudget.from_config(config)
+        with budget.activate():
+            ...  # run the pipeline; StageGraph opens `stage_budget` for each stage
+
+    """
+
+    def __init__(self, budgets: dict[str, float]):
+        self.budgets = {name: float(seconds) for name, seconds in budgets.items()}
+        self.degradations: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Any) -> TimeBudget:
+        """Return the budgets of `stage_time_budgets` in rdeconfig.yaml (none by default)."""
+        return cls(dict(config['vsm'].get('stage_time_budgets') or {}))
+
+    @property
+    def enabled(self) -> bool:
+        """Return True if any stage has a budget."""
+        return bool(self.budgets)
+
+    @contextlib.contextmanager
+    def activate(self) -> Generator[TimeBudget, None, None]:
+        """Make this the budget of the stages run in the current context."""
+        token = current_budget.set(self)
+        try:
+            yield self
+        finally:
+            current_budget.reset(token)
+
+    def record(self, stage: str, action: str, detail: str, elapsed: float) -> None:
+        """Record a degradation of a stage."""
+        with self._lock:
+            self.degradations.append({"stage": stage, "action": action, "detail": detail, "elapsed_sec": round(elapsed, 3)})
+
+    def summary(self) -> str:
+        """Return the degradations as the metadata value, e.g. "graph: decimate_plot (Bs curve: 2000000 -> 20000 points)"."""
+        with self._lock:
+            return "; ".join(f"{d['stage']}: {d['action']} ({d['detail']})" for d in self.degradations)
+
+
+@contextlib.contextmanager
+def stage_budget(name: str) -> Generator[None, None, None]:
+    """Start the clock of a stage if the running tile has a budget for it."""
+    budget = current_budget.get()
+    if budget is None or name not in budget.budgets:
+        yield
+        return
+    token = current_deadline.set(Deadline(name, budget.budgets[name], time.perf_counter()))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def exceeded(expected: float = 0.0) -> bool:
+    """Return True if the current stage has used, or with `expected` more seconds would use, its budget.
+
+    Outside of a stage with a budget this is always False.
+    """
+    deadline = current_deadline.get()
+    return deadline is not None and deadline.elapsed() + expected > deadline.budget
+
+
+def degrade(action: str, detail: str) -> None:
+    """Record a degradation of the current stage in the metadata and the metrics of the tile."""
+    budget, deadline = current_budget.get(), current_deadline.get()
+    if budget is None or deadline is None:
+        return
+    budget.record(deadline.stage, action, detail, deadline.elapsed())
+    metrics.registry.inc("vsm_degradations_total", stage=deadline.stage, action=action)
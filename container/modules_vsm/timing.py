@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from collections.abc import Generator
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from typing import Any
+
+TIMINGS_FORMAT = "vsm-timings/1"
+TIMINGS_NAME = "timings.json"
+# Frames kept per traced allocation in the memory profiling mode; one frame gives the allocating line.
+MEMORY_TRACE_FRAMES = 1
+DEFAULT_MEMORY_TOP = 5
+# Allocations of the profiler and of the spans are not reported as allocation sites.
+_MEMORY_FILTERS = (
+    tracemalloc.Filter(inclusive=False, filename_pattern=tracemalloc.__file__),
+    tracemalloc.Filter(inclusive=False, filename_pattern=__file__),
+)
+
+# Innermost open span; spans opened while another one is open become its children.
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """Wall time, CPU time, input rows and written bytes of one step of a tile.
+
+    CPU time is measured per thread, because the stages of a tile run in
+    parallel threads. A span's totals include its children: the CPU time of
+    children running in other threads is added to the span's own thread time,
+    and the bytes written inside children are added to its own.
+
+    In the memory profiling mode (`memory_top` is set) the span also records
+    the tracemalloc peak above the traced memory at its start, the change of
+    the traced memory and of the process RSS, the growth of the RSS high-water
+    mark, and the `memory_top` source lines whose allocations grew the most.
+    tracemalloc is process-wide, so the stages must then run one at a time.
+
+    Args:
+        name (str): step name, e.g. the stage name.
+        parent (Span | None): enclosing span; children inherit its memory mode.
+        memory_top (int | None): allocation sites to report, or None without memory profiling.
+
+    """
+
+    def __init__(self, name: str, parent: Span | None = None, memory_top: int | None = None):
+        self.name = name
+        self.parent = parent
+        self.rows: int | None = None
+        self.bytes_written = 0
+        self.failed = False
+        self.children: list[Span] = []
+        self.memory: dict[str, Any] | None = None
+        self.memory_top: int | None = parent.memory_top if parent is not None else memory_top
+        self._lock = threading.Lock()
+        self._thread = threading.get_ident()
+        if self.memory_top is not None:
+            self._start_memory()
+        self._start = time.perf_counter()
+        self._start_cpu = time.thread_time()
+        self.wall_sec = 0.0
+        self.cpu_sec = 0.0
+
+    def close(self) -> None:
+        """Stop the clocks of the span."""
+        self.wall_sec = time.perf_counter() - self._start
+        self.cpu_sec = time.thread_time() - self._start_cpu
+        if self.memory_top is not None:
+            self._stop_memory()
+
+    def _start_memory(self) -> None:
+        # Snapshot first, so that the snapshot itself is part of the baseline and not of the peak.
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS) if self.memory_top else None
+        # The peak counter is shared: hand the peak so far to the parent before restarting it.
+        _, peak = tracemalloc.get_traced_memory()
+        if self.parent is not None:
+            self.parent._note_peak(peak)  # noqa: SLF001
+        tracemalloc.reset_peak()
+        self._traced_start, self._traced_peak = tracemalloc.get_traced_memory()
+        self._rss_start = current_rss()
+        self._max_rss_start = max_rss()
+
+    def _note_peak(self, peak: int) -> None:
+        self._traced_peak = max(self._traced_peak, peak)
+
+    def _stop_memory(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        self._note_peak(peak)
+        rss = current_rss()
+        self.memory = {
+            "traced_peak_bytes": self._traced_peak - self._traced_start,
+            "traced_delta_bytes": current - self._traced_start,
+            "rss_delta_bytes": None if rss is None or self._rss_start is None else rss - self._rss_start,
+            "max_rss_growth_bytes": max_rss() - self._max_rss_start,
+        }
+        if self._snapshot is not None:
+            stats = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS).compare_to(self._snapshot, "lineno")
+            self._snapshot = None
+            stats.sort(key=lambda stat: stat.size_diff, reverse=True)
+            self.memory["top_allocations"] = [
+                {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in stats[: self.memory_top]
+                if stat.size_diff > 0
+            ]
+        if self.parent is not None:
+            self.parent._note_peak(self._traced_peak)  # noqa: SLF001
+        tracemalloc.reset_peak()
+
+    def add_child(self, child: Span) -> None:
+        """Attach a span opened inside this one, possibly from another thread."""
+        with self._lock:
+            self.children.append(child)
+
+    def add_bytes(self, size: int) -> None:
+        """Count bytes written inside the span."""
+        with self._lock:
+            self.bytes_written += size
+
+    def total_cpu_sec(self) -> float:
+        """Return the CPU time of the span including children that ran in other threads."""
+        return self.cpu_sec + sum(c.total_cpu_sec() for c in self.children if c._thread != self._thread)  # noqa: SLF001
+
+    def total_bytes_written(self) -> int:
+        """Return the bytes written in the span and its children."""
+        return self.bytes_written + sum(c.total_bytes_written() for c in self.children)
+
+    def to_dict(self, origin: float | None = None) -> dict[str, Any]:
+        """Return the JSON representation; `start_sec` is relative to `origin` (default: this span's start)."""
+        origin = self._start if origin is None else origin
+        result: dict[str, Any] = {
+            "name": self.name,
+            "start_sec": round(self._start - origin, 6),
+            "wall_sec": round(self.wall_sec, 6),
+            "cpu_sec": round(self.total_cpu_sec(), 6),
+            "rows": self.rows,
+            "bytes_written": self.total_bytes_written(),
+        }
+        if self.memory is not None:
+            result["memory"] = self.memory
+        if self.failed:
+            result["failed"] = True
+        if self.children:
+            children = sorted(self.children, key=lambda c: c._start)  # noqa: SLF001
+            result["children"] = [c.to_dict(origin) for c in children]
+        return result
+
+
+def current_rss() -> int | None:
+    """Return the resident set size of the process in bytes, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def max_rss() -> int:
+    """Return the RSS high-water mark of the process in bytes."""
+    # ru_maxrss is in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextlib.contextmanager
+def span(name: str, rows: int | None = None) -> Generator[Span | None, None, None]:
+    """Time a block as a child of the current span.
+
+    Outside of a tile (no open span) nothing is recorded and None is yielded,
+    so instrumented functions cost nothing when they are called directly.
+
+    Args:
+        name (str): step name.
+        rows (int | None): number of input rows processed in the block.
+
+    Yields:
+        Span | None: the new span, e.g. to set `rows` once they are known.
+
+    """
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent)
+    child.rows = rows
+    parent.add_child(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException:
+        child.failed = True
+        raise
+    finally:
+        child.close()
+        current_span.reset(token)
+
+
+def add_bytes(size: int) -> None:
+    """Count bytes written in the current span, if any."""
+    current = current_span.get()
+    if current is not None:
+        current.add_bytes(size)
+
+
+class TileTimings:
+    """Root span of a tile and its `timings.json`.
+
+    Args:
+        name (str): name of the root span, e.g. the input file name.
+        input_bytes (int | None): size of the input, so that timings and memory can be grouped by input size.
+        memory_top (int | None): enable the memory profiling mode with this many allocation sites per span.
+        manufacturer (str | None): `manufacturer` of rdeconfig.yaml, to group the timings by input format.
+
+    Example:
+        timings = TileTimings(raw_file.name)
+        with timings.activate():
+            ...  # run the pipeline
+        with open_output(resource_paths.logs.joinpath(TIMINGS_NAME), "w", encoding="utf_8") as f:
+            json.dump(timings.to_dict(), f, indent=4)
+
+    """
+
+    def __init__(self, name: str, input_bytes: int | None = None, memory_top: int | None = None, manufacturer: str | None = None):
+        self.name = name
+        self.input_bytes = input_bytes
+        self.manufacturer = manufacturer
+        self.memory_top = memory_top
+        self.root: Span | None = None
+
+    @contextlib.contextmanager
+    def activate(self) -> Generator[Span, None, None]:
+        """Open the root span and make it the parent of the spans opened in the current context."""
+        started_tracing = self.memory_top is not None and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(MEMORY_TRACE_FRAMES)
+        self.root = Span(self.name, memory_top=self.memory_top)
+        token = current_span.set(self.root)
+        try:
+            yield self.root
+        finally:
+            self.root.close()
+            current_span.reset(token)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def to_dict(self) -> dict[str, Any]:
+        """Return the contents of `timings.json`."""
+        return {
+            "format": TIMINGS_FORMAT,
+            "created": datetime.now(UTC).isoformat(),
+            "manufacturer": self.manufacturer,
+            "input_bytes": self.input_bytes,
+            "memory_profile": self.memory_top is not None,
+            "spans": None if self.root is None else self.root.to_dict(),
+        }
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import json
+import shutil
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+import yaml
+from rdetoolkit import workflows
+
+from modules import datasets_process
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+RAW_NAME = "BGULVAC_T20221013-2_VSM_P20221016.dat"
+SAMPLE_SIZE = {"sample_size_height": 5.0, "sample_size_width": 5.0, "sample_size_thickness": 0.1}
+
+
+def hysteresis_loop(points: int = 400, *, integral_field: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """Return field (Oe) and moment (emu) of a synthetic hysteresis loop with one spike."""
+    half = points // 2
+    field = np.concatenate([np.linspace(20000, -20000, half), np.linspace(-20000, 20000, half)])
+    if integral_field:
+        field = np.round(field).astype(np.int64)
+    branch = np.concatenate([np.ones(half), -np.ones(half)])
+    moment = 1e-3 * np.tanh((field + 300 * branch) / 1500) + 1e-9 * field
+    moment[points // 5] += 5e-3
+    return field, moment
+
+
+def write_dataset(
+    root: Path,
+    vsm_config: dict[str, Any] | None = None,
+    custom: dict[str, Any] | None = None,
+    *,
+    integral_field: bool = False,
+    points: int = 400,
+) -> Path:
+    """Create an RDE input tree with an mpms dat file below `root` and return its `data` directory."""
+    data = root.joinpath("data")
+    data.joinpath("inputdata").mkdir(parents=True)
+    data.joinpath("invoice").mkdir()
+    shutil.copytree(REPO_ROOT.joinpath("templates", "mpms", "tasksupport"), data.joinpath("tasksupport"))
+
+    rdeconfig_path = data.joinpath("tasksupport", "rdeconfig.yaml")
+    with open(rdeconfig_path, encoding="utf_8") as f:
+        rdeconfig = yaml.safe_load(f)
+    rdeconfig["vsm"].update(vsm_config or {})
+    with open(rdeconfig_path, "w", encoding="utf_8") as f:
+        yaml.safe_dump(rdeconfig, f)
+
+    with open(REPO_ROOT.joinpath("tryout", "invoice_sample.json"), encoding="utf_8") as f:
+        invoice = json.load(f)
+    invoice["custom"].update({"measurement_measured_date": None, **(custom or {})})
+    with open(data.joinpath("invoice", "invoice.json"), "w", encoding="utf_8") as f:
+        json.dump(invoice, f, indent=2, ensure_ascii=False)
+
+    field, moment = hysteresis_loop(points, integral_field=integral_field)
+    lines = ["[Header]", "INFO,MPMS,APPNAME", "FILEOPENTIME,5,01/02/2022,10:00 AM", "[Data]", "Time,Magnetic Field (Oe),Moment (emu),DC Moment Fixed Ctr (emu)"]
+    lines += [f"{i},{h},{m}," for i, (h, m) in enumerate(zip(field, moment, strict=True))]
+    data.joinpath("inputdata", RAW_NAME).write_text("\n".join(lines) + "\n", encoding="utf_8")
+    return data
+
+
+@pytest.fixture
+def run_dataset(monkeypatch: pytest.MonkeyPatch) -> Callable[[Path], dict[str, Any]]:
+    """Return a function running the structuring process on the `data` directory below a root."""
+
+    def run(root: Path) -> dict[str, Any]:
+        monkeypatch.chdir(root)
+        result: dict[str, Any] = json.loads(workflows.run(custom_dataset_function=datasets_process.dataset))
+        assert [status["status"] for status in result["statuses"]] == ["success"]
+        return result
+
+    return run
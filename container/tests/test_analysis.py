@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import csv
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import RAW_NAME, SAMPLE_SIZE, write_dataset
+
+from modules_vsm.analysis import AnalysisOptions, AnalysisResult, analyze_curve
+
+STEM = Path(RAW_NAME).stem
+CORRECTION_FACTOR = 1.2
+
+
+@pytest.fixture(params=[True, False], ids=["spike_removal", "no_spike_removal"])
+def pipeline_run(request: pytest.FixtureRequest, tmp_path: Path, run_dataset: Callable[[Path], dict[str, Any]]) -> tuple[Path, AnalysisResult]:
+    """Run the pipeline on the synthetic loop and analyze the data it read (its raw CSV) with `analyze_curve`."""
+    spike_removal: bool = request.param
+    custom = {**SAMPLE_SIZE, "spike_removal": spike_removal, "correction_factor": CORRECTION_FACTOR}
+    data = write_dataset(tmp_path, custom=custom)
+    run_dataset(tmp_path)
+    options = AnalysisOptions(
+        spike_removal=spike_removal,
+        sample_size=tuple(SAMPLE_SIZE.values()),
+        correction_factor=CORRECTION_FACTOR,
+    )
+    df_raw = pd.read_csv(data.joinpath("structured", f"{STEM}_raw.csv"), float_precision="round_trip")
+    return data, analyze_curve(df_raw["Magnetic Field (Oe)"], df_raw["Moment (emu)"], options)
+
+
+def test_values_equal_param_csv(pipeline_run: tuple[Path, AnalysisResult]) -> None:
+    data, result = pipeline_run
+    with open(data.joinpath("structured", f"{STEM}_param.csv"), encoding="utf_8") as f:
+        header, row = list(csv.reader(f))
+
+    values = result.characteristic_values()
+    assert dict(zip(header, row, strict=True)) == {key: f"{values[key]:.2e}" for key in header}
+
+
+def test_corrected_curve_equals_graph_csv(pipeline_run: tuple[Path, AnalysisResult]) -> None:
+    data, result = pipeline_run
+    df_graph = pd.read_csv(data.joinpath("structured", f"{STEM}.csv"), float_precision="round_trip")
+
+    np.testing.assert_array_equal(df_graph["Magnetic Field (T)"], result.field)
+    np.testing.assert_array_equal(df_graph["Magnetization (emu)"], result.corrected_moment)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from rdetoolkit.models.result import WorkflowExecutionStatus
+
+from modules import batch_runner
+from modules.batch_runner import BatchRunner, TileJob
+from modules_vsm.batch_journal import BatchJournal, hash_inputs
+from modules_vsm.manifest import PARTIAL_SUFFIX, OutputManifest, open_output
+
+TILES = 3
+
+
+def _no_warm_up() -> None:
+    pass
+
+
+def _write_tile(job: TileJob) -> WorkflowExecutionStatus:
+    """Stand-in for `process_tile`: writes one output with a manifest and counts the runs of the tile."""
+    paths = job.resource_paths
+    with paths.logs.joinpath("runs").open("a", encoding="utf_8") as f:
+        f.write("run\n")
+    manifest = OutputManifest()
+    with manifest.activate(), open_output(paths.struct.joinpath("out.csv")) as f:
+        f.write(paths.rawfiles[0].read_text(encoding="utf_8"))
+    manifest.write(paths.logs.joinpath("manifest.json"))
+    return WorkflowExecutionStatus(run_id=str(job.idx), title="tile", status="success", mode="batch", target=str(paths.rawfiles[0]))
+
+
+def _job(root: Path, idx: int) -> TileJob:
+    tile = root.joinpath(f"tile{idx}")
+    names = ("inputdata", "invoice_org", "structured", "main_image", "other_image", "meta", "invoice", "logs")
+    dirs = {name: tile.joinpath(name) for name in names}
+    for path in dirs.values():
+        path.mkdir(parents=True, exist_ok=True)
+    rawfile = dirs["inputdata"].joinpath("sample.dat")
+    if not rawfile.exists():
+        rawfile.write_text(f"tile {idx}\n", encoding="utf_8")
+    resource_paths = SimpleNamespace(
+        rawfiles=(rawfile,), invoice_org=dirs["invoice_org"], struct=dirs["structured"], main_image=dirs["main_image"],
+        other_image=dirs["other_image"], meta=dirs["meta"], invoice=dirs["invoice"], logs=dirs["logs"],
+    )
+    srcpaths = SimpleNamespace(tasksupport=root.joinpath("tasksupport"))
+    return TileJob(idx, srcpaths, resource_paths, None, None, None)  # type: ignore[arg-type]
+
+
+def _runs(root: Path) -> list[int]:
+    """Return how often each tile was processed."""
+    return [len(root.joinpath(f"tile{idx}", "logs", "runs").read_text(encoding="utf_8").splitlines()) for idx in range(TILES)]
+
+
+@pytest.fixture
+def batch(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> tuple[Path, Path]:
+    """Run a batch of tiles once with a journal; return the batch root and the journal path."""
+    monkeypatch.setattr(batch_runner, "warm_up_worker", _no_warm_up)
+    tmp_path.joinpath("tasksupport").mkdir()
+    journal_path = tmp_path.joinpath("batch_journal.jsonl")
+    BatchRunner(max_workers=2, process_function=_write_tile, journal=BatchJournal(journal_path)).run_jobs([_job(tmp_path, idx) for idx in range(TILES)])
+    return tmp_path, journal_path
+
+
+def _resume(root: Path, journal_path: Path) -> list[WorkflowExecutionStatus]:
+    return BatchRunner(max_workers=2, process_function=_write_tile, journal=BatchJournal(journal_path)).run_jobs([_job(root, idx) for idx in range(TILES)])
+
+
+def test_completed_tiles_are_journaled(batch: tuple[Path, Path]) -> None:
+    root, journal_path = batch
+    journal = BatchJournal(journal_path)
+
+    assert len(journal) == TILES
+    for idx in range(TILES):
+        assert journal.completed(idx, hash_inputs(_job(root, idx).input_paths())) is not None
+
+
+def test_resume_skips_unchanged_tiles(batch: tuple[Path, Path]) -> None:
+    root, journal_path = batch
+    statuses = _resume(root, journal_path)
+
+    assert [status.status for status in statuses] == ["success"] * TILES
+    assert _runs(root) == [1] * TILES
+
+
+def test_resume_reruns_tiles_with_changed_inputs_or_outputs(batch: tuple[Path, Path]) -> None:
+    root, journal_path = batch
+    root.joinpath("tile1", "inputdata", "sample.dat").write_text("tile 1, measured again\n", encoding="utf_8")
+    root.joinpath("tile2", "structured", "out.csv").unlink()
+    partial = root.joinpath("tile2", "structured", f".out.csv.1.1{PARTIAL_SUFFIX}")
+    partial.write_text("half", encoding="utf_8")
+
+    _resume(root, journal_path)
+
+    assert _runs(root) == [1, 2, 2]
+    assert root.joinpath("tile1", "structured", "out.csv").read_text(encoding="utf_8") == "tile 1, measured again\n"
+    assert not partial.exists()
+
+
+def test_line_cut_short_by_a_crash_is_ignored(batch: tuple[Path, Path]) -> None:
+    root, journal_path = batch
+    lines = journal_path.read_text(encoding="utf_8").splitlines(keepends=True)
+    journal_path.write_text("".join(lines[:-1]) + lines[-1][: len(lines[-1]) // 2], encoding="utf_8")
+    last_tile = json.loads(lines[-1])["tile"]
+
+    journal = BatchJournal(journal_path)
+
+    assert len(journal) == TILES - 1
+    assert journal.completed(last_tile, hash_inputs(_job(root, last_tile).input_paths())) is None
+    _resume(root, journal_path)
+    assert _runs(root)[last_tile] == 2
+
+
+def test_entries_of_another_format_are_ignored(tmp_path: Path) -> None:
+    journal_path = tmp_path.joinpath("batch_journal.jsonl")
+    entry = {"format": "vsm-batch-journal/0", "tile": 0, "input_sha256": "", "files": [], "status": {}}
+    journal_path.write_text(json.dumps(entry) + "\n", encoding="utf_8")
+
+    assert len(BatchJournal(journal_path)) == 0
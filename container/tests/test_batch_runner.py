@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from modules import batch_runner
+from modules.batch_runner import BatchRunner, TileJob
+
+CRASHING_TILE = 0
+
+
+def _no_warm_up() -> None:
+    pass
+
+
+def _crash_on_first_tile(job: TileJob) -> Any:
+    if job.idx == CRASHING_TILE:
+        os._exit(1)
+    return SimpleNamespace(status="success", run_id=str(job.idx))
+
+
+class RecordingRunner(BatchRunner):
+    """BatchRunner that records the jobs of every pool it starts."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.pools: list[list[int]] = []
+
+    def _run_pool(self, jobs: list[TileJob], max_workers: int) -> Any:
+        self.pools.append([job.idx for job in jobs])
+        return super()._run_pool(jobs, max_workers)
+
+
+def _job(idx: int, logs: Path) -> TileJob:
+    resource_paths = SimpleNamespace(rawfiles=(Path(f"tile{idx}.dat"),), logs=logs)
+    return TileJob(idx, None, resource_paths, None, None, None)  # type: ignore[arg-type]
+
+
+@pytest.fixture(autouse=True)
+def _skip_warm_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(batch_runner, "warm_up_worker", _no_warm_up)
+
+
+def test_crash_is_counted_only_against_the_executing_tile(tmp_path: Path) -> None:
+    runner = RecordingRunner(max_workers=1, process_function=_crash_on_first_tile)
+    statuses = runner.run_jobs([_job(idx, tmp_path) for idx in range(5)])
+
+    assert [status.status for status in statuses] == ["failed", "success", "success", "success", "success"]
+    assert "crashed while processing tile 0" in statuses[0].error_message
+    # Tiles that were only queued when the pool broke are not run alone.
+    assert [pool for pool in runner.pools if len(pool) == 1] == [[CRASHING_TILE]]
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import RAW_NAME, SAMPLE_SIZE, write_dataset
+
+STEM = Path(RAW_NAME).stem
+CHUNKED = {"chunked_processing": True, "chunk_rows": 37}
+# Long enough for the merged fit to differ from the in-memory fit in the last bits.
+POINTS = 1940
+# Deviation of the corrected moment, relative to the largest moment, allowed by the merged fit.
+MOMENT_TOLERANCE = 1e-12
+EXACT_OUTPUTS = (f"structured/{STEM}_raw.csv", f"structured/{STEM}_param.csv", "meta/metadata.json")
+
+
+@pytest.fixture(params=[True, False], ids=["integral_field", "float_field"])
+def runs(request: pytest.FixtureRequest, tmp_path: Path, run_dataset: Callable[[Path], dict[str, Any]]) -> tuple[Path, Path]:
+    """Process the same file in memory and in chunks; return both data directories."""
+    custom = {**SAMPLE_SIZE, "spike_removal": True}
+    normal = write_dataset(tmp_path.joinpath("normal"), custom=custom, integral_field=request.param, points=POINTS)
+    chunked = write_dataset(tmp_path.joinpath("chunked"), CHUNKED, custom, integral_field=request.param, points=POINTS)
+    run_dataset(normal.parent)
+    run_dataset(chunked.parent)
+    return normal, chunked
+
+
+@pytest.mark.parametrize("output", EXACT_OUTPUTS)
+def test_outputs_equal_normal_outputs(runs: tuple[Path, Path], output: str) -> None:
+    normal, chunked = runs
+    assert chunked.joinpath(output).read_bytes() == normal.joinpath(output).read_bytes()
+
+
+def test_graph_csv_equals_normal_graph_csv_within_tolerance(runs: tuple[Path, Path]) -> None:
+    normal, chunked = (pd.read_csv(data.joinpath("structured", f"{STEM}.csv"), float_precision="round_trip") for data in runs)
+
+    np.testing.assert_array_equal(chunked["Magnetic Field (T)"], normal["Magnetic Field (T)"])
+    moment = normal["Magnetization (emu)"]
+    np.testing.assert_allclose(chunked["Magnetization (emu)"], moment, rtol=0, atol=MOMENT_TOLERANCE * moment.abs().max())
+
+
+def test_reader_without_chunk_support_cannot_be_created() -> None:
+    from modules_vsm.inputfile_handler import FileReader
+
+    class NoChunkReader(FileReader):
+        def _read_raw_data(self, raw_file_path: Path) -> tuple[dict[str, Any], pd.DataFrame | None]:
+            return {}, None
+
+        def _resolve_rawfile(self, resource_paths: Any, is_filename_mapping_rule: bool) -> tuple[Path, list[str] | None]:
+            return resource_paths.rawfiles[0], None
+
+    with pytest.raises(TypeError, match="_open_chunks"):
+        NoChunkReader()  # type: ignore[abstract]
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules_vsm import time_budget
+from modules_vsm.graph_handler import ESTIMATED_PLOT_POINTS_PER_SEC, GraphPlotter
+from modules_vsm.time_budget import DEFAULT_DEGRADED_PLOT_POINTS, TimeBudget
+
+X_COL, RM_COL = "Magnetic Field (Oe)", "Moment (emu)"
+
+
+def _plot_raw_graph(tmp_path: Path, rows: int, budget_sec: float) -> TimeBudget:
+    """Draw the graphs of `rows` raw points within a graph stage budget; only the raw data graph is drawn."""
+    df_data = pd.DataFrame({X_COL: np.linspace(-2e4, 2e4, rows), RM_COL: np.linspace(-1e-3, 1e-3, rows)})
+    fit_data = pd.DataFrame({"x": [0.0], "RM": [0.0]})
+    budget = TimeBudget({"graph": budget_sec})
+    with budget.activate(), time_budget.stage_budget("graph"):
+        GraphPlotter({"vsm": {}}).plot_corrected_original(
+            df_data, fit_data, pd.DataFrame(), "sample", {}, tmp_path, tmp_path, True, X_COL, RM_COL, None,
+        )
+    return budget
+
+
+def test_first_graph_is_decimated_when_estimated_over_budget(tmp_path: Path) -> None:
+    rows = 4 * DEFAULT_DEGRADED_PLOT_POINTS
+    budget = _plot_raw_graph(tmp_path, rows, budget_sec=rows / ESTIMATED_PLOT_POINTS_PER_SEC / 2)
+
+    assert [d["action"] for d in budget.degradations] == ["decimate_plot"]
+    assert budget.degradations[0]["detail"] == f"raw data graph: {rows} -> {DEFAULT_DEGRADED_PLOT_POINTS} points"
+    assert tmp_path.joinpath("sample_raw.png").exists()
+
+
+@pytest.mark.parametrize("rows", [100, 4 * DEFAULT_DEGRADED_PLOT_POINTS])
+def test_first_graph_is_kept_within_budget(tmp_path: Path, rows: int) -> None:
+    budget = _plot_raw_graph(tmp_path, rows, budget_sec=60.0)
+
+    assert budget.degradations == []
@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pytest
+
+from benchmarks.import_budget import DEFAULT_BUDGET_MS, DEFAULT_MODULE, DEFAULT_REPEAT, DEFAULT_TOP, check
+
+
+@pytest.fixture(scope="module")
+def report() -> dict[str, Any]:
+    return check(DEFAULT_MODULE, DEFAULT_BUDGET_MS, DEFAULT_REPEAT, DEFAULT_TOP)
+
+
+def test_deferred_packages_are_not_imported_at_startup(report: dict[str, Any]) -> None:
+    assert not [violation for violation in report["violations"] if violation.startswith("deferred packages")]
+
+
+def test_import_time_is_within_budget(report: dict[str, Any]) -> None:
+    assert report["violations"] == []
+    assert report["total_ms"] <= DEFAULT_BUDGET_MS
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from modules_vsm.manifest import PARTIAL_SUFFIX, OutputManifest, current_stage, open_output, remove_partial_outputs
+
+
+def test_output_appears_only_when_complete(tmp_path: Path) -> None:
+    path = tmp_path.joinpath("out.csv")
+    with open_output(path, newline="") as f:
+        f.write("a,b\n")
+        assert not path.exists()
+        assert len(list(tmp_path.glob(f".*{PARTIAL_SUFFIX}"))) == 1
+
+    assert path.read_text(encoding="utf_8") == "a,b\n"
+    assert list(tmp_path.glob(f".*{PARTIAL_SUFFIX}")) == []
+
+
+def test_failed_write_keeps_the_previous_output(tmp_path: Path) -> None:
+    path = tmp_path.joinpath("out.csv")
+    path.write_text("previous\n", encoding="utf_8")
+    manifest = OutputManifest()
+
+    with manifest.activate(), pytest.raises(RuntimeError), open_output(path) as f:
+        f.write("half")
+        raise RuntimeError
+
+    assert path.read_text(encoding="utf_8") == "previous\n"
+    assert list(tmp_path.glob(f".*{PARTIAL_SUFFIX}")) == []
+    assert manifest.entries == []
+
+
+def test_manifest_records_size_hash_and_stage(tmp_path: Path) -> None:
+    path = tmp_path.joinpath("graph.png")
+    data = b"\x89PNG" * 1000
+    manifest = OutputManifest()
+
+    token = current_stage.set("graph")
+    try:
+        with manifest.activate(), open_output(path, "wb") as f:
+            f.write(data)
+    finally:
+        current_stage.reset(token)
+
+    [entry] = manifest.entries
+    assert entry["path"] == str(path)
+    assert entry["bytes"] == len(data) == path.stat().st_size
+    assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+    assert entry["stage"] == "graph"
+
+
+def test_nothing_is_recorded_without_an_active_manifest(tmp_path: Path) -> None:
+    manifest = OutputManifest()
+    with open_output(tmp_path.joinpath("out.txt")) as f:
+        f.write("x")
+
+    assert manifest.entries == []
+
+
+def test_partial_outputs_of_an_interrupted_run_are_removed(tmp_path: Path) -> None:
+    tmp_path.joinpath(f".out.csv.1.1{PARTIAL_SUFFIX}").write_text("half", encoding="utf_8")
+    tmp_path.joinpath("out.csv").write_text("complete", encoding="utf_8")
+
+    assert remove_partial_outputs([tmp_path, tmp_path.joinpath("missing")]) == 1
+    assert [path.name for path in tmp_path.iterdir()] == ["out.csv"]
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any
+
+import pytest
+from rdetoolkit.exceptions import StructuredError
+
+from modules.pipeline import Stage, StageGraph
+
+
+class Recorder:
+    """Records the order in which stages start and finish."""
+
+    def __init__(self) -> None:
+        self.events: list[str] = []
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, result: Any = None, delay: float = 0.0) -> Any:
+        def run(**_inputs: Any) -> Any:
+            with self._lock:
+                self.events.append(f"start {name}")
+            time.sleep(delay)
+            with self._lock:
+                self.events.append(f"end {name}")
+            return result
+
+        return run
+
+
+def _fail(exc: BaseException) -> Any:
+    def run(**_inputs: Any) -> Any:
+        raise exc
+
+    return run
+
+
+def test_stages_run_after_their_inputs_and_after() -> None:
+    recorder = Recorder()
+    graph = StageGraph([
+        Stage("invoice", recorder.stage("invoice"), after=("analyze",)),
+        Stage("analyze", recorder.stage("analyze", result=2), inputs=("df",), outputs=("value",)),
+        Stage("read", recorder.stage("read", result=1), inputs=("path",), outputs=("df",)),
+        Stage("plot", recorder.stage("plot"), inputs=("df", "value")),
+    ])
+
+    values = graph.run({"path": "raw.dat"}, targets=["plot", "invoice"])
+
+    assert values == {"path": "raw.dat", "df": 1, "value": 2}
+    events = recorder.events
+    assert events.index("end read") < events.index("start analyze")
+    assert events.index("end analyze") < events.index("start plot")
+    assert events.index("end analyze") < events.index("start invoice")
+
+
+def test_only_needed_stages_run_and_given_values_are_not_recomputed() -> None:
+    recorder = Recorder()
+    graph = StageGraph([
+        Stage("read", recorder.stage("read", result=1), inputs=("path",), outputs=("df",)),
+        Stage("plot", recorder.stage("plot"), inputs=("df",)),
+        Stage("unrelated", recorder.stage("unrelated")),
+    ])
+
+    graph.run({"df": 0}, targets=["plot"])
+
+    assert recorder.events == ["start plot", "end plot"]
+
+
+def test_independent_stages_overlap() -> None:
+    barrier = threading.Barrier(2, timeout=5)
+
+    def meet(**_inputs: Any) -> None:
+        barrier.wait()
+
+    graph = StageGraph([Stage("left", meet), Stage("right", meet)])
+
+    graph.run({}, targets=["left", "right"], max_workers=2)
+
+
+def test_failure_stops_later_stages_and_is_wrapped() -> None:
+    recorder = Recorder()
+    graph = StageGraph([
+        Stage("analyze", _fail(KeyError("Moment (emu)")), outputs=("value",)),
+        Stage("plot", recorder.stage("plot"), inputs=("value",)),
+    ])
+
+    with pytest.raises(StructuredError, match="Stage 'analyze' failed") as excinfo:
+        graph.run({}, targets=["plot"])
+
+    assert isinstance(excinfo.value.__cause__, KeyError)
+    assert "KeyError" in excinfo.value.traceback_info
+    assert recorder.events == []
+
+
+def test_structured_error_of_a_stage_is_raised_unchanged() -> None:
+    error = StructuredError("Invalid sample size", 101)
+    graph = StageGraph([Stage("analyze", _fail(error))])
+
+    with pytest.raises(StructuredError) as excinfo:
+        graph.run({}, targets=["analyze"])
+
+    assert excinfo.value is error
+    assert excinfo.value.ecode == 101
+
+
+def test_running_stages_are_awaited_after_a_failure() -> None:
+    recorder = Recorder()
+    graph = StageGraph([
+        Stage("slow", recorder.stage("slow", delay=0.2)),
+        Stage("broken", _fail(ValueError("bad"))),
+    ])
+
+    with pytest.raises(StructuredError):
+        graph.run({}, targets=["slow", "broken"], max_workers=2)
+
+    assert recorder.events == ["start slow", "end slow"]
+
+
+@pytest.mark.parametrize(("stages", "message"), [
+    ([Stage("a", print), Stage("a", print)], "Duplicate stage name"),
+    ([Stage("a", print, outputs=("x",)), Stage("b", print, outputs=("x",))], "produced by both"),
+])
+def test_invalid_graphs_are_rejected(stages: list[Stage], message: str) -> None:
+    with pytest.raises(ValueError, match=message):
+        StageGraph(stages)
+
+
+@pytest.mark.parametrize(("stages", "message"), [
+    ([Stage("a", print, inputs=("missing",))], "neither given nor produced"),
+    ([Stage("a", print, inputs=("y",), outputs=("x",)), Stage("b", print, inputs=("x",), outputs=("y",))], "Cycle"),
+    ([Stage("a", print, after=("nowhere",))], "unknown stages"),
+])
+def test_unrunnable_plans_are_rejected_before_any_stage_runs(stages: list[Stage], message: str) -> None:
+    with pytest.raises(ValueError, match=message):
+        StageGraph(stages).plan(["a"])
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import logging
+
+import pytest
+
+from modules_vsm.profiling import PROFILE_RATE_ENV, profile_rate
+
+CONFIG = {"vsm": {"profile_rate": 0.25}}
+
+
+@pytest.mark.parametrize(("value", "expected"), [
+    ("0.01", 0.01),
+    ("1", 1.0),
+    ("5", 1.0),
+    ("true", 1.0),
+    (" On ", 1.0),
+    ("yes", 1.0),
+    ("off", 0.0),
+    ("false", 0.0),
+    ("", 0.0),
+])
+def test_environment_rate(monkeypatch: pytest.MonkeyPatch, value: str, expected: float) -> None:
+    monkeypatch.setenv(PROFILE_RATE_ENV, value)
+    assert profile_rate(CONFIG) == expected
+
+
+def test_invalid_environment_rate_disables_profiling(monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture) -> None:
+    monkeypatch.setenv(PROFILE_RATE_ENV, "sometimes")
+    with caplog.at_level(logging.WARNING, logger="modules_vsm.profiling"):
+        assert profile_rate(CONFIG) == 0.0
+    assert PROFILE_RATE_ENV in caplog.text
+
+
+def test_config_rate_without_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv(PROFILE_RATE_ENV, raising=False)
+    assert profile_rate(CONFIG) == 0.25
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+from conftest import RAW_NAME, SAMPLE_SIZE, write_dataset
+
+STEM = Path(RAW_NAME).stem
+# Outputs produced on a hit, and outputs restored from the cache.
+REBUILT_OUTPUTS = ("meta/metadata.json", "invoice/invoice.json")
+RESTORED_OUTPUTS = (f"structured/{STEM}.csv", f"structured/{STEM}_param.csv", f"structured/{STEM}_raw.csv")
+# Settings of the second run that change how it runs but not its outputs.
+RUN_ONLY_CONFIG = {"pipeline_workers": 1, "parsed_input_cache": False, "metrics_flush_interval": 60.0, "live_plot_interval": 1.0}
+
+
+@pytest.fixture
+def cached_runs(tmp_path: Path, run_dataset: Callable[[Path], dict[str, Any]]) -> tuple[Path, Path, Path]:
+    """Run the same dataset twice with the result cache and different run-only settings; return the data directories of the miss and the hit, and the cache."""
+    cache_dir = tmp_path.joinpath("cache")
+    config = {"result_cache": True, "result_cache_dir": str(cache_dir)}
+    miss = write_dataset(tmp_path.joinpath("miss"), config, SAMPLE_SIZE)
+    hit = write_dataset(tmp_path.joinpath("hit"), {**config, **RUN_ONLY_CONFIG}, SAMPLE_SIZE)
+    run_dataset(miss.parent)
+    run_dataset(hit.parent)
+    return miss, hit, cache_dir
+
+
+def test_second_run_is_a_hit(cached_runs: tuple[Path, Path, Path]) -> None:
+    _, _, cache_dir = cached_runs
+    with open(cache_dir.joinpath("stats.json"), encoding="utf_8") as f:
+        stats = json.load(f)
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+
+@pytest.mark.parametrize("output", REBUILT_OUTPUTS + RESTORED_OUTPUTS)
+def test_hit_outputs_equal_miss_outputs(cached_runs: tuple[Path, Path, Path], output: str) -> None:
+    miss, hit, _ = cached_runs
+    assert hit.joinpath(output).read_bytes() == miss.joinpath(output).read_bytes()
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import sqlite3
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+from conftest import SAMPLE_SIZE, write_dataset
+
+from modules.result_index_backfill import backfill
+from modules_vsm.result_index import ResultIndex
+
+
+def _rows(index: ResultIndex) -> list[tuple[Any, ...]]:
+    with sqlite3.connect(index.path) as connection:
+        return connection.execute("SELECT file_name, input_sha256, source, hc, br, br_per_volume_corrected FROM results").fetchall()
+
+
+@pytest.fixture
+def dataset(tmp_path: Path, run_dataset: Callable[[Path], dict[str, Any]]) -> tuple[Path, ResultIndex]:
+    """Process a dataset with the result index enabled; return its data directory and the index."""
+    index = ResultIndex(tmp_path.joinpath("index.sqlite"))
+    data = write_dataset(tmp_path.joinpath("run"), {"result_index": True, "result_index_path": str(index.path)}, SAMPLE_SIZE)
+    run_dataset(data.parent)
+    return data, index
+
+
+def test_backfill_keeps_pipeline_rows(dataset: tuple[Path, ResultIndex]) -> None:
+    data, index = dataset
+    pipeline_rows = _rows(index)
+    assert [row[2] for row in pipeline_rows] == ["pipeline"]
+
+    written, skipped = backfill(index, [data])
+
+    assert (written, skipped) == (0, [])
+    assert _rows(index) == pipeline_rows
+
+
+def test_pipeline_replaces_backfilled_rows(dataset: tuple[Path, ResultIndex], tmp_path: Path, run_dataset: Callable[[Path], dict[str, Any]]) -> None:
+    data, index = dataset
+    pipeline_rows = _rows(index)
+    index.path.unlink()
+
+    assert backfill(index, [data]) == (1, [])
+    assert backfill(index, [data]) == (1, [])
+    [backfilled] = _rows(index)
+    assert backfilled[:2] == pipeline_rows[0][:2]
+    assert backfilled[2] == "backfill"
+    # The param CSV holds three significant digits only.
+    assert backfilled[3:] != pipeline_rows[0][3:]
+    assert backfilled[3:] == pytest.approx(pipeline_rows[0][3:], rel=1e-2)
+
+    rerun = write_dataset(tmp_path.joinpath("rerun"), {"result_index": True, "result_index_path": str(index.path)}, SAMPLE_SIZE)
+    run_dataset(rerun.parent)
+
+    assert _rows(index) == pipeline_rows
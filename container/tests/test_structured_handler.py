@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from modules_vsm.structured_handler import StructuredDataProcesser
+
+
+def _hampel_per_row(x: np.ndarray, k: int, thr: float) -> tuple[np.ndarray, np.ndarray]:
+    """Per-row Hampel filter the windowed evaluation replaced."""
+    idx = np.arange(len(x))
+    output_x = x.copy()
+    output_idx = np.zeros_like(x)
+    for i in range(len(x)):
+        kernel = x[(idx >= i - k) & (idx <= i + k)]
+        median = np.median(kernel)
+        std = 1.4826 * np.median(np.abs(kernel - median))
+        if np.abs(x[i] - median) > thr * std:
+            output_idx[i] = 1
+            output_x[i] = median
+    return output_x, output_idx
+
+
+@pytest.mark.parametrize("size", [0, 1, 3, 4, 5, 6, 500])
+@pytest.mark.parametrize("k", [1, 2, 5])
+def test_hampel_equals_per_row_filter(size: int, k: int) -> None:
+    rng = np.random.default_rng(size * 10 + k)
+    x = rng.normal(size=size)
+    x[::37] += 10.0
+    x[1::50] = 0.0
+
+    filtered, outliers = StructuredDataProcesser().hampel(x, k=k, thr=3)
+    expected_filtered, expected_outliers = _hampel_per_row(x, k, 3)
+
+    np.testing.assert_array_equal(filtered, expected_filtered)
+    np.testing.assert_array_equal(outliers, expected_outliers)
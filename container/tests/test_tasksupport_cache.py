@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Any
+
+from modules_vsm.tasksupport_cache import TasksupportCache
+
+
+def _parse(path: Path) -> dict[str, Any]:
+    return {"text": path.read_text(encoding="utf_8")}
+
+
+def _write(path: Path, text: str) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf_8")
+    return path
+
+
+def test_identical_copies_share_one_entry(tmp_path: Path) -> None:
+    cache = TasksupportCache()
+    first = cache.load(_write(tmp_path.joinpath("job1", "rdeconfig.yaml"), "vsm: {}\n"), _parse)
+    second = cache.load(_write(tmp_path.joinpath("job2", "rdeconfig.yaml"), "vsm: {}\n"), _parse)
+
+    assert second is first
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_edited_file_is_parsed_again(tmp_path: Path) -> None:
+    cache = TasksupportCache()
+    path = _write(tmp_path.joinpath("rdeconfig.yaml"), "vsm: {}\n")
+    cache.load(path, _parse)
+    _write(path, "vsm: {chunk_rows: 10}\n")
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 1))
+
+    assert cache.load(path, _parse) == {"text": "vsm: {chunk_rows: 10}\n"}
+    assert cache.misses == 2
+
+
+def test_least_recently_used_files_are_dropped(tmp_path: Path) -> None:
+    cache = TasksupportCache(max_files=2)
+    paths = [_write(tmp_path.joinpath(f"job{i}", "rdeconfig.yaml"), f"vsm: {{id: {i}}}\n") for i in range(3)]
+    for path in paths:
+        cache.load(path, _parse)
+    cache.load(paths[2], _parse)
+    assert cache.hits == 1
+
+    cache.load(paths[0], _parse)
+    assert cache.misses == 4
+
+
+def test_pool_is_bounded_and_rebuilt_for_a_new_owner() -> None:
+    cache = TasksupportCache(max_pooled=1)
+    owner = object()
+    built = cache.pooled("mpms", owner, object)
+
+    assert cache.pooled("mpms", owner, object) is built
+    assert cache.pooled("mpms", object(), object) is not built
+    cache.pooled("tamakawa", owner, object)
+    assert cache.pooled("mpms", owner, object) is not built
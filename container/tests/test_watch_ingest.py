@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from modules import watch_ingest
+from modules.watch_ingest import DirectoryWatcher, IngestService
+
+
+def _no_warm_up() -> None:
+    pass
+
+
+def _crash_once(job: dict[str, Any]) -> dict[str, Any]:
+    """Stand-in for `run_job` whose worker dies the first time it is called for a tree."""
+    marker = Path(job["input_dir"]).joinpath("crashed")
+    if not marker.exists():
+        marker.touch()
+        os._exit(1)
+    return {**job, "status": "success", "error": None}
+
+
+@pytest.fixture
+def service(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> IngestService:
+    monkeypatch.setattr(watch_ingest, "warm_up_worker", _no_warm_up)
+    monkeypatch.setattr(watch_ingest, "run_job", _crash_once)
+    watch_dir = tmp_path.joinpath("watch")
+    watch_dir.mkdir()
+    watch_dir.joinpath("sample.dat").write_text("data\n", encoding="utf_8")
+    tasksupport = tmp_path.joinpath("tasksupport")
+    tasksupport.mkdir()
+    invoice = tmp_path.joinpath("invoice.json")
+    invoice.write_text("{}", encoding="utf_8")
+    return IngestService(DirectoryWatcher(watch_dir, settle=0.0), tmp_path.joinpath("out"), tasksupport=tasksupport, invoice=invoice)
+
+
+def _log(service: IngestService) -> list[dict[str, Any]]:
+    with open(service.log_path, encoding="utf_8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_file_is_retried_on_a_new_pool_after_a_worker_crash(service: IngestService) -> None:
+    asyncio.run(service.run(poll_interval=0.01, once=True))
+
+    assert [record["status"] for record in _log(service)] == ["success"]
+
+
+def test_failed_files_are_not_done_after_restart(service: IngestService) -> None:
+    service.output_root.mkdir()
+    records = [
+        {"file": "ok.dat", "bytes": 1, "mtime_ns": 1, "status": "success"},
+        {"file": "bad.dat", "bytes": 1, "mtime_ns": 1, "status": "failed"},
+    ]
+    service.log_path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf_8")
+
+    service.load_done()
+
+    assert service.watcher.done == {("ok.dat", 1, 1)}
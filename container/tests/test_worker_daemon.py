@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import json
+import socket
+import subprocess
+import sys
+import time
+from collections.abc import Generator
+from pathlib import Path
+
+import pytest
+from conftest import SAMPLE_SIZE, write_dataset
+
+from modules import worker_daemon
+from modules.worker_daemon import MAX_ATTEMPTS, claim_next, recover_stale_claims, serve, submit_job
+from modules_vsm.tasksupport_cache import tasksupport_cache
+
+
+class StopServing(Exception):
+    pass
+
+
+def _no_warm_up() -> None:
+    pass
+
+
+@pytest.fixture
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def live_pid() -> Generator[int, None, None]:
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    yield process.pid
+    process.kill()
+    process.wait()
+
+
+def _claim_as(spool: Path, pid: int) -> str:
+    """Claim the queued job as if by the worker process `pid` on this host."""
+    claimed = claim_next(spool)
+    assert claimed is not None
+    running_path, job = claimed
+    running_path.rename(running_path.with_name(f"{job['job_id']}@{socket.gethostname()}@{pid}.json"))
+    return str(job["job_id"])
+
+
+def test_claim_of_dead_worker_is_queued_again(tmp_path: Path, dead_pid: int) -> None:
+    job_id = submit_job(tmp_path, tmp_path.joinpath("data"))
+    _claim_as(tmp_path, dead_pid)
+
+    assert recover_stale_claims(tmp_path) == 1
+    assert list(tmp_path.joinpath("running").iterdir()) == []
+    with open(tmp_path.joinpath("incoming", f"{job_id}.json"), encoding="utf_8") as f:
+        assert json.load(f)["attempts"] == 1
+
+
+def test_claim_of_live_worker_is_kept(tmp_path: Path, live_pid: int) -> None:
+    submit_job(tmp_path, tmp_path.joinpath("data"))
+    _claim_as(tmp_path, live_pid)
+
+    assert recover_stale_claims(tmp_path) == 0
+    assert len(list(tmp_path.joinpath("running").glob("*.json"))) == 1
+
+
+def test_job_is_failed_after_max_attempts(tmp_path: Path, dead_pid: int) -> None:
+    job_id = submit_job(tmp_path, tmp_path.joinpath("data"))
+    for _ in range(MAX_ATTEMPTS):
+        _claim_as(tmp_path, dead_pid)
+        recover_stale_claims(tmp_path)
+
+    assert list(tmp_path.joinpath("incoming").glob("*.json")) == []
+    with open(tmp_path.joinpath("done", f"{job_id}.json"), encoding="utf_8") as f:
+        record = json.load(f)
+    assert record["status"] == "failed"
+    assert record["attempts"] == MAX_ATTEMPTS
+
+
+def test_claims_of_workers_dying_while_serving_are_recovered(tmp_path: Path, dead_pid: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(worker_daemon, "warm_up_worker", _no_warm_up)
+    idle_polls: list[str] = []
+
+    def sleep(_seconds: float) -> None:
+        if idle_polls:
+            raise StopServing
+        # Another worker claims a job and dies after this worker started.
+        submit_job(tmp_path, tmp_path.joinpath("missing"))
+        idle_polls.append(_claim_as(tmp_path, dead_pid))
+
+    monkeypatch.setattr(time, "sleep", sleep)
+    with pytest.raises(StopServing):
+        serve(tmp_path, poll_interval=0.0, recovery_interval=0.0)
+
+    with open(tmp_path.joinpath("done", f"{idle_polls[0]}.json"), encoding="utf_8") as f:
+        record = json.load(f)
+    assert record["attempts"] == 1
+    assert record["status"] == "failed"
+
+
+def test_second_job_reuses_the_parsed_tasksupport(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(worker_daemon, "warm_up_worker", _no_warm_up)
+    tasksupport_cache.clear()
+    spool = tmp_path.joinpath("spool")
+    records = []
+    for name in ("first", "second"):
+        data = write_dataset(tmp_path.joinpath("inbox", name), custom=SAMPLE_SIZE)
+        job_id = submit_job(spool, data, tmp_path.joinpath("out", name))
+        misses, hits, pooled = tasksupport_cache.misses, tasksupport_cache.hits, list(tasksupport_cache._pool.values())
+        serve(spool, once=True)
+        records.append(worker_daemon.wait_for_result(spool, job_id, timeout=0))
+
+    assert [record["status"] for record in records] == ["success", "success"]
+    # The second job reads its own copy of the tasksupport, with the same contents.
+    assert tasksupport_cache.misses == misses
+    assert tasksupport_cache.hits > hits
+    assert pooled
+    assert list(tasksupport_cache._pool.values()) == pooled